@@ -57,11 +57,48 @@ def send_message(chat_id):
     # 从请求数据中获取stream参数
     stream = data.get('stream', False)
     
-    # 根据stream参数处理响应
-    if stream:
+    # 根据stream参数处理响应（流式请求在开始前被拒绝时同样返回json和状态码）
+    if stream and callable(result):
         # 流式响应返回生成器函数
         return Response(result(), content_type='text/event-stream')
     else:
         # 普通响应返回json和状态码
         response_data, status_code = result
-        return jsonify(response_data), status_code
\ No newline at end of file
+        response = jsonify(response_data)
+        if status_code == 429:
+            # 排队已满，提示客户端稍后重试
+            response.headers['Retry-After'] = str(response_data.get('retry_after', 1))
+        return response, status_code
+
+# 停止进行中的流式生成（message_id为流式响应第一个增量中的message_id）
+@chat_bp.route('/<chat_id>/messages/<message_id>/cancel', methods=['POST'])
+def cancel_message(chat_id, message_id):
+    if not ChatService.cancel_generation(chat_id, message_id):
+        return jsonify({'error': '没有进行中的生成'}), 404
+    
+    return jsonify({'success': True, 'message': '已停止生成'})
+
+# 获取对话的路由策略（备用模型、对冲和失败切换）
+@chat_bp.route('/<chat_id>/routing', methods=['GET'])
+def get_routing(chat_id):
+    result, status_code = ChatService.get_routing_policy(chat_id)
+    return jsonify(result), status_code
+
+# 设置对话的路由策略，请求体为空对象时清除
+@chat_bp.route('/<chat_id>/routing', methods=['PUT'])
+def set_routing(chat_id):
+    result, status_code = ChatService.set_routing_policy(chat_id, request.json)
+    return jsonify(result), status_code
+
+# 同一条消息同时发给多个模型对比，各模型的增量交错写入同一个SSE连接（事件带model字段）
+@chat_bp.route('/<chat_id>/messages/fanout', methods=['POST'])
+def send_fanout_message(chat_id):
+    result = ChatService.send_fanout_message(chat_id, request.json)
+    if callable(result):
+        return Response(result(), content_type='text/event-stream')
+    
+    response_data, status_code = result
+    response = jsonify(response_data)
+    if status_code == 429:
+        response.headers['Retry-After'] = str(response_data.get('retry_after', 1))
+    return response, status_code
@@ -17,6 +17,31 @@ def get_models():
     models = ModelService.get_all_models()
     return jsonify({'models': models})
 
+# 获取模型请求调度状态（排队深度、进行中的调用数、token额度）
+@model_bp.route('/scheduler', methods=['GET'])
+def get_scheduler_status():
+    from app.services.request_scheduler import RequestScheduler
+    return jsonify({'success': True, 'scheduler': RequestScheduler.get_instance().snapshot()})
+
+# 获取各模型版本最近的延迟统计（首token和总耗时的p50/p95、对冲和切换次数）
+@model_bp.route('/latency', methods=['GET'])
+def get_latency_stats():
+    from app.services.model_router import LatencyStats
+    return jsonify({'success': True, 'latency': LatencyStats.get_instance().snapshot()})
+
+# 获取回复缓存的条目数、占用空间和命中率
+@model_bp.route('/response-cache', methods=['GET'])
+def get_response_cache_stats():
+    from app.models.response_cache import get_response_cache
+    return jsonify({'success': True, 'cache': get_response_cache().stats()})
+
+# 清空回复缓存
+@model_bp.route('/response-cache', methods=['DELETE'])
+def clear_response_cache():
+    from app.models.response_cache import get_response_cache
+    deleted = get_response_cache().clear()
+    return jsonify({'success': True, 'message': f'已清空 {deleted} 条缓存的回复'})
+
 # 获取模型供应商图标
 @model_bp.route('/icons/<filename>', methods=['GET'])
 def get_model_icon(filename):
@@ -110,6 +135,16 @@ def delete_version(model_name, version_name):
         'model': model
     })
 
+# 预加载模型版本到内存（如Ollama），避免首条消息等待模型加载
+@model_bp.route('/<model_name>/<path:version_name>/warm', methods=['POST'])
+def warm_version(model_name, version_name):
+    success, result, status_code = ModelService.warm_model(model_name, version_name)
+    
+    if not success:
+        return jsonify({'error': result}), status_code
+    
+    return jsonify({'success': True, 'result': result})
+
 # 辅助函数：从模型的versions数组中获取特定版本的配置信息
 def get_version_config(model, version_name):
     return ModelService.get_version_config(model, version_name)
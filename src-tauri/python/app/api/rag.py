@@ -165,6 +165,90 @@ def search_file_content():
             'error': str(e)
         }), 500
 
+# 获取向量库统计信息
+@rag_bp.route('/stats', methods=['GET'])
+def get_vector_statistics():
+    try:
+        # detailed=false 时只返回总数，不返回按文件夹和文件的明细
+        detailed = request.args.get('detailed', 'true').lower() != 'false'
+        stats = RAGService.get_vector_statistics(detailed=detailed)
+        
+        return jsonify({
+            'success': True,
+            'stats': stats
+        })
+    except Exception as e:
+        print(f"❌ 获取向量库统计信息失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 启动重新嵌入（更换嵌入模型）
+@rag_bp.route('/reembed', methods=['POST'])
+def start_reembedding():
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        # 调用服务层方法，未指定时使用配置中的嵌入模型和维度
+        job = RAGService.start_reembedding(
+            embedder_model=data.get('embedder_model'),
+            embedding_dimension=data.get('embedding_dimension')
+        )
+        
+        return jsonify({
+            'success': True,
+            'job': job
+        }), 202
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f"❌ 启动重新嵌入失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 获取重新嵌入进度
+@rag_bp.route('/reembed', methods=['GET'])
+def get_reembedding_status():
+    try:
+        status = RAGService.get_reembedding_status()
+        
+        return jsonify({
+            'success': True,
+            **status
+        })
+    except Exception as e:
+        print(f"❌ 获取重新嵌入状态失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 预取检索结果（用户输入时调用，发送消息时直接命中查询缓存）
+@rag_bp.route('/prefetch', methods=['POST'])
+def prefetch_retrieval():
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        # 使用与发送消息相同的ragConfig，保证检索参数一致
+        result = RAGService.prefetch(data.get('query', ''), data.get('ragConfig'))
+        
+        return jsonify({
+            'success': True,
+            **result
+        }), 202
+    except Exception as e:
+        print(f"❌ 预取检索失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # 获取文件详情
 @rag_bp.route('/documents/<file_id>', methods=['GET'])
 def get_document_details(file_id):
@@ -10,12 +10,99 @@ dirs = PlatformDirs(appname="NeoVAI", appauthor="NeoVAI")
 DEFAULT_CONFIG = {
     'rag': {
         'enabled': False,
-        'retrieval_mode': 'vector',
+        'retrieval_mode': 'vector',  # 检索方式：vector（相似度）或 mmr（最大边际相关性）
         'top_k': 3,
         'score_threshold': 0.7,
         'vector_db_path': '',  # 将在初始化时设置为用户数据目录中的路径
         'embedder_model': 'qwen3-embedding-0.6b',
-        'vector_db_type': 'chroma'
+        'embedding_backend': 'pytorch',  # 嵌入推理后端：pytorch 或 onnx
+        'embedding_batch_size': 32,
+        'embedding_dimension': 0,  # Matryoshka截断后的向量维度，0 表示使用模型完整维度
+        'onnx_quantize': True,  # ONNX后端是否使用int8动态量化
+        'onnx_intra_op_threads': 0,  # 0 表示由onnxruntime自动决定线程数
+        'vector_db_type': 'chroma',  # 向量库引擎：chroma 或 mmap（进程内内存映射矩阵）
+        'hnsw_space': 'l2',  # Chroma集合的距离空间：l2 / cosine / ip（仅创建集合时生效）
+        'hnsw_m': 16,  # HNSW图每个节点的邻居数（仅创建集合时生效）
+        'hnsw_construction_ef': 100,  # 建索引时的候选列表大小（仅创建集合时生效）
+        'hnsw_search_ef': 100,  # 检索时的候选列表大小，越大召回越高、延迟越大
+        'vector_quantization': 'none',  # mmap引擎的向量量化：none / int8 / binary
+        'rescore_multiplier': 4,  # 量化粗排召回 k * rescore_multiplier 个候选后精确重排
+        'reembed_batch_size': 64,  # 重新嵌入时每批处理的片段数量
+        'reembed_duty_cycle': 0.5,  # 重新嵌入的CPU占空比，每批耗时t秒后休眠 t*(1-d)/d 秒
+        'context_token_budget': 1500,  # 检索片段组装为上下文时可使用的token数
+        'rerank_enabled': False,  # 是否使用交叉编码器对检索候选重排序
+        'rerank_model': 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1',  # 多语言小型交叉编码器
+        'rerank_candidates': 20,  # 重排序前从向量库召回的候选数量
+        'rerank_batch_size': 16,  # 交叉编码器每批推理的(查询, 片段)对数量
+        'rerank_cache_size': 10000,  # (查询哈希, 片段ID) 分数缓存的最大条目数
+        'mmr_fetch_k': 20,  # MMR检索的候选池大小（至少为结果数的2倍）
+        'mmr_lambda': 0.5,  # MMR相关性权重，1 等价于相似度检索，越小越强调多样性
+        'prefetch_min_chars': 4,  # 输入草稿至少多少个字符才预取检索
+        'prefetch_prefix_ratio': 0.8,  # 发送的问题与预取草稿的公共前缀占比达到该值时复用预取结果
+        'dedup_mode': 'link',  # 入库时近似重复片段的处理：link（链接到已存储片段）/ drop（丢弃）/ off
+        'dedup_threshold': 0.9,  # MinHash估计的Jaccard相似度达到该值时视为重复
+        'dedup_num_perm': 128,  # MinHash签名长度
+        'dedup_bands': 16,  # LSH分段数量，需能整除签名长度
+        'indexing_mode': 'standard',  # 分块方式：standard（单层片段）或 parent_child（嵌入子片段，返回父窗口）
+        'chunk_size': 1000,  # standard模式的片段大小（字符）
+        'chunk_overlap': 200,  # standard模式的片段重叠大小（字符）
+        'parent_chunk_size': 2000,  # parent_child模式返回给模型的父窗口大小
+        'parent_chunk_overlap': 0,  # 父窗口重叠大小，0 表示每段文本只保存一次
+        'child_chunk_size': 200,  # parent_child模式用于嵌入匹配的子片段大小
+        'child_chunk_overlap': 40,  # 子片段重叠大小（只在同一父窗口内重叠）
+        'parent_fetch_multiplier': 3  # parent_child模式检索 k * 该值 个子片段，映射到父窗口后保留前k个
+    },
+    'chat': {
+        'prepare_workers': 8,  # 发送消息前并行执行RAG检索、历史组装和驱动构造的线程数
+        'fanout_max_models': 4,  # 多模型对比时一次最多同时调用的模型版本数
+        'system_prompt': '',  # 每次请求最前面的系统提示词，为空时不发送
+        'history_messages': 10,  # 发送给模型的最近历史消息数上限
+        'history_token_budget': 0,  # 历史消息（含当前问题）的token上限，超出时从最早的消息开始整块丢弃，0 表示不限制
+        'history_window_step': 4  # 历史窗口的起点按该消息数整块前移，窗口不变的几轮中请求前缀保持一致，可命中提示词缓存
+    },
+    'models': {
+        'http2': True,  # 原生驱动在安装了h2时使用HTTP/2
+        'request_timeout': 60,  # 模型接口读取超时（秒）
+        'max_connections': 20,  # 每个接口地址的最大连接数
+        'max_keepalive_connections': 10,  # 每个接口地址保持的空闲连接数
+        'keepalive_expiry': 60,  # 空闲连接保持时间（秒）
+        'ollama_keep_alive': '30m',  # Ollama模型空闲后保留在内存中的时间（版本options中的keep_alive优先）
+        'ollama_timeout': 300,  # Ollama读取超时（秒），首次请求可能需要从磁盘加载模型
+        'stream_usage': True  # OpenAI兼容接口的流式请求是否要求返回token用量（含提示词缓存命中数）
+    },
+    'scheduler': {
+        'enabled': True,  # 是否对模型调用做并发和速率限制
+        'max_queue': 32,  # 最多排队的请求数，超出时返回429
+        'queue_timeout': 120,  # 排队等待超时（秒）
+        'default_concurrency': 4,  # 未单独配置的供应商的并发上限，0 表示不限制
+        'vendor_concurrency': {'Ollama': 1},  # 各供应商的并发上限（本地Ollama一次只运行一个生成）
+        'version_concurrency': {},  # 各模型版本的并发上限，键为 "供应商/版本"
+        'vendor_tokens_per_minute': {},  # 各供应商每分钟的token上限
+        'version_tokens_per_minute': {}  # 各模型版本每分钟的token上限，键为 "供应商/版本"
+    },
+    'routing': {
+        'hedge_percentile': 95,  # 对冲期限取主模型首token延迟（非流式为总耗时）的该百分位
+        'min_samples': 20,  # 样本数少于该值时使用default_hedge_ms作为对冲期限
+        'default_hedge_ms': 5000,  # 延迟样本不足时的对冲期限（毫秒）
+        'min_hedge_ms': 300,  # 对冲期限下限（毫秒），避免延迟很低时几乎每次都发出对冲请求
+        'history_size': 200,  # 每个模型版本保留的最近延迟样本数
+        'max_workers': 8  # 非流式对冲请求使用的线程数
+    },
+    'response_cache': {
+        'enabled': False,  # temperature为0的请求是否使用回复缓存（请求的modelParams.cache可单独开启或关闭）
+        'max_entries': 1000,  # 最多缓存的回复数
+        'max_bytes': 50 * 1024 * 1024,  # 缓存回复的总字节数上限
+        'max_age_hours': 168,  # 缓存回复的有效期（小时）
+        'replay_chunk_chars': 4,  # 流式回放缓存回复时每个增量的字符数
+        'replay_interval_ms': 10  # 流式回放的增量间隔（毫秒），0 表示不等待
+    },
+    'tokenizer': {
+        'default': 'tiktoken:o200k_base',  # 默认分词器（未单独配置的模型和RAG片段），规格为 tiktoken:<编码> / hf:<目录> / estimate
+        'vendor_tokenizers': {'Qwen': 'hf:qwen3-embedding-0.6b'},  # 各供应商的分词器，hf目录在 models/tokenizers 或 models/embedding 下查找
+        'version_tokenizers': {},  # 各模型版本的分词器，键为 "供应商/版本"
+        'tokenizer_dir': '',  # 本地分词器目录，为空时使用 <用户数据目录>/models/tokenizers
+        'message_overhead': 4,  # 每条消息的角色和格式标记占用的token数
+        'cache_size': 20000  # 内存中缓存的文本token数条目上限
     },
     'mcp': {
         'enabled': False,
@@ -26,7 +113,8 @@ DEFAULT_CONFIG = {
     'app': {
         'debug': True,
         'host': '0.0.0.0',
-        'port': 5000
+        'port': 5000,
+        'preload_model_drivers': True  # 启动后在后台导入已配置模型的驱动
     }
 }
 
@@ -28,6 +28,13 @@ def get_db_connection():
     conn.execute('PRAGMA foreign_keys = ON')
     return conn
 
+# 为旧数据库补充新增的列
+def ensure_column(cursor, table, column, definition):
+    """表中不存在该列时通过ALTER TABLE添加（用于升级旧版本创建的数据库）"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 # --------------------------
 # 2. 数据目录管理（确保data目录存在）
 # --------------------------
@@ -79,10 +86,13 @@ def init_db():
         api_key TEXT,
         api_base_url TEXT,
         streaming_config BOOLEAN DEFAULT FALSE,
+        options TEXT,
         FOREIGN KEY (model_id) REFERENCES models (id) ON DELETE CASCADE,
         UNIQUE(model_id, version_name)
     )
     ''')
+    # 版本运行参数（JSON，如Ollama的keep_alive、num_ctx），旧数据库补充该列
+    ensure_column(cursor, 'model_versions', 'options', 'TEXT')
     
     # 创建对话表
     cursor.execute('''
@@ -91,9 +101,12 @@ def init_db():
         title TEXT NOT NULL,
         preview TEXT,
         created_at TEXT NOT NULL,
-        updated_at TEXT NOT NULL
+        updated_at TEXT NOT NULL,
+        routing TEXT
     )
     ''')
+    # 对话的路由策略（JSON），旧数据库补充该列
+    ensure_column(cursor, 'chats', 'routing', 'TEXT')
     
     # 创建消息表
     cursor.execute('''
@@ -104,9 +117,15 @@ def init_db():
         content TEXT NOT NULL,
         created_at TEXT NOT NULL,
         model TEXT,
+        truncated BOOLEAN DEFAULT FALSE,
+        token_counts TEXT,
         FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
     )
     ''')
+    # 生成被取消时保存的不完整回复带有truncated标记，旧数据库补充该列
+    ensure_column(cursor, 'messages', 'truncated', 'BOOLEAN DEFAULT FALSE')
+    # 各分词器统计的消息token数（JSON），写入时统计一次，旧数据库补充该列
+    ensure_column(cursor, 'messages', 'token_counts', 'TEXT')
     
     # 创建设置表
     cursor.execute('''
@@ -146,6 +165,7 @@ def load_chats_from_db():
             preview = chat_row[2] if len(chat_row) > 2 else ''
             created_at = chat_row[3] if len(chat_row) > 3 else datetime.now().isoformat()
             updated_at = chat_row[4] if len(chat_row) > 4 else datetime.now().isoformat()
+            routing = json.loads(chat_row[5]) if len(chat_row) > 5 and chat_row[5] else None
             
             # 获取对话的所有消息
             cursor.execute("SELECT * FROM messages WHERE chat_id = ? ORDER BY created_at", (chat_id,))
@@ -159,24 +179,37 @@ def load_chats_from_db():
                 content = msg_row[3] if len(msg_row) > 3 else ''
                 msg_created_at = msg_row[4] if len(msg_row) > 4 else datetime.now().isoformat()
                 model = msg_row[5] if len(msg_row) > 5 else None
+                truncated = bool(msg_row[6]) if len(msg_row) > 6 else False
+                token_counts = json.loads(msg_row[7]) if len(msg_row) > 7 and msg_row[7] else None
                 
-                message_list.append({
+                message = {
                     'id': msg_id,
                     'role': role,
                     'content': content,
                     'createdAt': msg_created_at,
                     'model': model
-                })
+                }
+                if truncated:
+                    # 生成被取消的不完整回复
+                    message['truncated'] = True
+                if token_counts:
+                    # 按分词器缓存的消息token数
+                    message['tokenCounts'] = token_counts
+                message_list.append(message)
             
             # 添加对话到内存数据库
-            db['chats'].append({
+            chat = {
                 'id': chat_id,
                 'title': title,
                 'preview': preview,
                 'createdAt': created_at,
                 'updatedAt': updated_at,
                 'messages': message_list
-            })
+            }
+            if routing:
+                # 对话的路由策略（备用模型、对冲和失败切换）
+                chat['routing'] = routing
+            db['chats'].append(chat)
         
         # 关闭数据库连接
         conn.close()
@@ -369,15 +402,16 @@ def insert_default_models():
         # 插入模型版本
         for version in model.get('versions', []):
             cursor.execute('''
-            INSERT INTO model_versions (model_id, version_name, custom_name, api_key, api_base_url, streaming_config)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO model_versions (model_id, version_name, custom_name, api_key, api_base_url, streaming_config, options)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
                 model_id,
                 version['version_name'],
                 version.get('custom_name', ''),
                 version.get('api_key', ''),
                 version.get('api_base_url', ''),
-                version.get('streaming_config', False)
+                version.get('streaming_config', False),
+                json.dumps(version['options'], ensure_ascii=False) if version.get('options') else None
             ))
     
     conn.commit()
@@ -413,20 +447,26 @@ def load_models_from_db():
                 model_id, name, description, configured, enabled, icon_class, icon_bg, icon_color, icon_url, icon_blob = model_row
             
             # 获取模型的所有版本
-            cursor.execute("SELECT * FROM model_versions WHERE model_id = ?", (model_id,))
+            cursor.execute('''
+            SELECT version_name, custom_name, api_key, api_base_url, streaming_config, options
+            FROM model_versions WHERE model_id = ?
+            ''', (model_id,))
             versions = cursor.fetchall()
             
             # 构建版本列表
             version_list = []
             for version_row in versions:
-                _, _, version_name, custom_name, api_key, api_base_url, streaming_config = version_row
-                version_list.append({
+                version_name, custom_name, api_key, api_base_url, streaming_config, options = version_row
+                version = {
                     'version_name': version_name,
                     'custom_name': custom_name,
                     'api_key': api_key,
                     'api_base_url': api_base_url,
                     'streaming_config': streaming_config
-                })
+                }
+                if options:
+                    version['options'] = json.loads(options)
+                version_list.append(version)
             
             # 添加模型到内存数据库
             db['models'].append({
@@ -533,9 +573,10 @@ def save_chats_to_db():
             
             # 插入对话
             cursor.execute('''
-            INSERT INTO chats (id, title, preview, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (chat_id, title, preview, created_at, updated_at))
+            INSERT INTO chats (id, title, preview, created_at, updated_at, routing)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (chat_id, title, preview, created_at, updated_at,
+                  json.dumps(chat['routing'], ensure_ascii=False) if chat.get('routing') else None))
             
             # 插入对话中的消息
             for msg in chat.get('messages', []):
@@ -545,9 +586,10 @@ def save_chats_to_db():
                 msg_created_at = msg['createdAt']
                 
                 cursor.execute('''
-                INSERT INTO messages (id, chat_id, role, content, created_at)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (msg_id, chat_id, role, content, msg_created_at))
+                INSERT INTO messages (id, chat_id, role, content, created_at, model, truncated, token_counts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (msg_id, chat_id, role, content, msg_created_at, msg.get('model'), msg.get('truncated', False),
+                      json.dumps(msg['tokenCounts']) if msg.get('tokenCounts') else None))
         
         conn.commit()
         conn.close()
@@ -603,15 +645,16 @@ def save_models_to_db():
             # 插入新版本
             for version in model.get('versions', []):
                 cursor.execute('''
-                INSERT INTO model_versions (model_id, version_name, custom_name, api_key, api_base_url, streaming_config)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO model_versions (model_id, version_name, custom_name, api_key, api_base_url, streaming_config, options)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     model_id,
                     version['version_name'],
                     version.get('custom_name', ''),
                     version.get('api_key', ''),
                     version.get('api_base_url', ''),
-                    version.get('streaming_config', False)
+                    version.get('streaming_config', False),
+                    json.dumps(version['options'], ensure_ascii=False) if version.get('options') else None
                 ))
         
         conn.commit()
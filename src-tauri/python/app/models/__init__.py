@@ -1,6 +1,14 @@
 """模型相关模块"""
 from app.models.base_model import BaseModel
 from app.models.model_manager import ModelManager
-from app.models.vendors import AnthropicModel, GitHubModel, GoogleAIModel, OllamaModel, OpenAIModel
 
-__all__ = ['BaseModel', 'ModelManager', 'OllamaModel', 'GitHubModel', 'OpenAIModel', 'AnthropicModel', 'GoogleAIModel']
\ No newline at end of file
+__all__ = ['BaseModel', 'ModelManager', 'OllamaModel', 'GitHubModel', 'OpenAIModel', 'AnthropicModel', 'GoogleAIModel',
+           'OpenAICompatibleModel']
+
+
+def __getattr__(name):
+    """供应商驱动类按需从app.models.vendors导入"""
+    if name in __all__:
+        from app.models import vendors
+        return getattr(vendors, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,15 +1,25 @@
 # models/base_model.py
 from abc import ABC, abstractmethod
-from langchain_core.language_models import BaseLanguageModel
-from langchain_core.messages import BaseMessage
-from typing import List, Dict, Any, Optional, Generator
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Generator
+
+if TYPE_CHECKING:
+    # 仅用于类型标注，运行时由各驱动模块导入langchain
+    from langchain_core.language_models import BaseLanguageModel
+    from langchain_core.messages import BaseMessage
 
 
 class BaseModel(ABC):
     def __init__(self, model_config: Dict[str, Any], version_config: Dict[str, Any]):
         self.model_config = model_config
         self.version_config = version_config
-        self.llm: Optional[BaseLanguageModel] = None
+        self.llm: Optional['BaseLanguageModel'] = None
+        # 最近一次调用中模型服务返回的耗时和token用量统计（驱动支持时填写）
+        self.last_metrics: Optional[Dict[str, Any]] = None
+        # 最近一次调用是否直接使用了回复缓存
+        self.last_cache_hit = False
+        # 取消标记；原生驱动在流式调用期间把上游响应保存在_active_response，取消时直接关闭
+        self._cancelled = False
+        self._active_response = None
         self._initialize_llm()
 
     @abstractmethod
@@ -27,6 +37,41 @@ class BaseModel(ABC):
         """流式对话 - 返回统一的生成器"""
         pass
 
+    def cancel(self) -> None:
+        """取消进行中的调用（可从其他线程调用）
+
+        原生驱动的上游连接被立即关闭，读取中的流式调用随即结束；
+        其他驱动只设置取消标记，由调用方在下一个增量处停止并关闭生成器。
+        """
+        self._cancelled = True
+        response = self._active_response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def warm(self) -> Dict[str, Any]:
+        """预加载模型到内存 - 默认不支持，本地模型驱动按需实现"""
+        raise NotImplementedError('该模型不支持预加载')
+
+    def _record_usage(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                      cache_write_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """记录模型服务返回的token用量（含提示词缓存命中的token数）到last_metrics"""
+        metrics = {
+            'prompt_tokens': prompt_tokens or 0,
+            'completion_tokens': completion_tokens or 0,
+            'cached_tokens': cached_tokens or 0,
+            'cache_hit_ratio': round((cached_tokens or 0) / prompt_tokens, 4) if prompt_tokens else 0.0
+        }
+        if cache_write_tokens is not None:
+            metrics['cache_write_tokens'] = cache_write_tokens
+        self.last_metrics = metrics
+        if metrics['cached_tokens']:
+            print(f"[Prompt Cache] {self.model_config.get('name', '')} 提示词 {metrics['prompt_tokens']} tokens，"
+                  f"缓存命中 {metrics['cached_tokens']} tokens（{metrics['cache_hit_ratio']:.0%}）")
+        return metrics
+
     def _format_response(self, content: str, content_struct: Optional[Any] = None) -> Dict[str, Any]:
         """统一响应格式"""
         return {
@@ -34,7 +79,7 @@ class BaseModel(ABC):
             'content_struct': content_struct
         }
 
-    def _convert_to_langchain_messages(self, messages: List[Dict[str, str]]) -> List[BaseMessage]:
+    def _convert_to_langchain_messages(self, messages: List[Dict[str, str]]) -> List['BaseMessage']:
         """将内部消息格式转换为langchain消息格式"""
         from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
         
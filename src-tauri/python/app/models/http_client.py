@@ -0,0 +1,61 @@
+# app/models/http_client.py
+"""原生模型驱动共享的HTTP连接池 - 同一接口地址（scheme://host:port）的驱动实例复用一个httpx.Client"""
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import config_manager
+
+# (接口地址, 读取超时) -> 共享的httpx.Client
+_clients: Dict[tuple, httpx.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def _http2_enabled() -> bool:
+    """配置开启且安装了h2时使用HTTP/2，否则回退到HTTP/1.1"""
+    if not config_manager.get('models.http2', True):
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client(url: str, read_timeout: Optional[float] = None) -> httpx.Client:
+    """获取url所在接口地址的共享连接池，首次使用时创建
+
+    Args:
+        url: 请求地址（只取scheme://host:port部分）
+        read_timeout: 读取超时（秒），默认使用 models.request_timeout
+    """
+    if read_timeout is None:
+        read_timeout = config_manager.get('models.request_timeout', 60)
+    origin = str(httpx.URL(url).copy_with(path='/', query=None, fragment=None))
+    key = (origin, read_timeout)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = httpx.Client(
+                http2=_http2_enabled(),
+                timeout=httpx.Timeout(read_timeout, connect=10),
+                limits=httpx.Limits(
+                    max_connections=config_manager.get('models.max_connections', 20),
+                    max_keepalive_connections=config_manager.get('models.max_keepalive_connections', 10),
+                    keepalive_expiry=config_manager.get('models.keepalive_expiry', 60)
+                )
+            )
+            _clients[key] = client
+    return client
+
+
+def close_http_clients() -> None:
+    """关闭全部共享连接池"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -1,33 +1,187 @@
 # app/models/model_manager.py
+import importlib
+import json
+import threading
+import time
+from app.core.config import config_manager
 from app.models.base_model import BaseModel
-from app.models.vendors import OllamaModel, OpenAIModel, AnthropicModel, GoogleAIModel, GitHubModel
-from typing import Dict, Any, Generator, List, Optional
+from typing import Dict, Any, Generator, List, Optional, Type, Union
 
 class ModelManager:
-    # 模型驱动映射表
+    # 模型驱动注册表：模型类型 -> 'module:Class'，首次使用时才导入驱动模块及其SDK
     _model_drivers = {
-        'Ollama': OllamaModel,
-        'GitHubModel': GitHubModel,
-        'OpenAI': OpenAIModel,        
-        'Anthropic': AnthropicModel,   
-        'GoogleAI': GoogleAIModel      
+        'Ollama': 'app.models.vendors.ollama_model:OllamaModel',
+        'GitHubModel': 'app.models.vendors.github_model:GitHubModel',
+        'OpenAI': 'app.models.vendors.openai_model:OpenAIModel',
+        'Anthropic': 'app.models.vendors.anthropic_model:AnthropicModel',
+        'GoogleAI': 'app.models.vendors.google_ai_model:GoogleAIModel',
+        # OpenAI兼容接口的供应商使用原生httpx驱动，不经过langchain
+        'Deepseek': 'app.models.vendors.openai_compatible_model:OpenAICompatibleModel',
+        'Doubao': 'app.models.vendors.openai_compatible_model:OpenAICompatibleModel',
+        'Qwen': 'app.models.vendors.openai_compatible_model:OpenAICompatibleModel',
+        '文心一言': 'app.models.vendors.openai_compatible_model:OpenAICompatibleModel'
     }
+    # 第三方驱动通过该入口点组注册，name为模型类型，value为 'module:Class'
+    ENTRY_POINT_GROUP = 'neovai.model_drivers'
+    _entry_points_loaded = False
+    _registry_lock = threading.Lock()
     
     @classmethod
-    def get_model_driver(cls, model_name: str, model_config: Dict[str, Any], version_config: Dict[str, Any]) -> BaseModel:
-        """获取模型驱动实例"""
+    def register_driver(cls, model_name: str, driver: Union[str, Type[BaseModel]]) -> None:
+        """注册模型驱动
+        
+        Args:
+            model_name: 模型类型名称（与模型配置中的name一致）
+            driver: 驱动类，或 'module:Class' 形式的导入路径（首次使用时导入）
+        """
+        with cls._registry_lock:
+            cls._model_drivers[model_name] = driver
+    
+    @classmethod
+    def _load_entry_points(cls) -> None:
+        """读取已安装包通过入口点注册的驱动（只读取一次，不导入驱动模块）"""
+        if cls._entry_points_loaded:
+            return
+        with cls._registry_lock:
+            if cls._entry_points_loaded:
+                return
+            try:
+                from importlib.metadata import entry_points
+                for entry_point in entry_points(group=cls.ENTRY_POINT_GROUP):
+                    cls._model_drivers.setdefault(entry_point.name, entry_point.value)
+            except Exception as e:
+                print(f"⚠️ 读取模型驱动入口点失败: {e}")
+            cls._entry_points_loaded = True
+    
+    @classmethod
+    def get_driver_class(cls, model_name: str) -> Type[BaseModel]:
+        """获取模型驱动类，注册为导入路径的驱动在此时导入"""
+        if model_name not in cls._model_drivers:
+            cls._load_entry_points()
         if model_name not in cls._model_drivers:
             raise ValueError(f'未实现注册的模型类型: {model_name}')
         
-        return cls._model_drivers[model_name](model_config, version_config)
+        driver = cls._model_drivers[model_name]
+        if isinstance(driver, str):
+            module_path, _, class_name = driver.partition(':')
+            driver = getattr(importlib.import_module(module_path), class_name)
+            with cls._registry_lock:
+                cls._model_drivers[model_name] = driver
+        return driver
+    
+    @classmethod
+    def preload_drivers(cls, model_names: List[str]) -> threading.Thread:
+        """在后台线程中导入指定模型类型的驱动，启动完成后提前承担首次对话的导入开销"""
+        def preload():
+            for model_name in model_names:
+                try:
+                    cls.get_driver_class(model_name)
+                except Exception as e:
+                    print(f"⚠️ 预加载模型驱动 {model_name} 失败: {e}")
+        
+        thread = threading.Thread(target=preload, name='driver-preload', daemon=True)
+        thread.start()
+        return thread
+    
+    @classmethod
+    def get_registered_models(cls) -> List[str]:
+        """获取已注册的模型类型（不导入驱动）"""
+        cls._load_entry_points()
+        return list(cls._model_drivers)
+    
+    @classmethod
+    def get_model_driver(cls, model_name: str, model_config: Dict[str, Any], version_config: Dict[str, Any]) -> BaseModel:
+        """获取模型驱动实例"""
+        return cls.get_driver_class(model_name)(model_config, version_config)
     
     @classmethod
     def chat(cls, model_name: str, model_config: Dict[str, Any], version_config: Dict[str, Any], 
              messages: List[Dict[str, str]], temperature: float, stream: bool = False) -> Any:
         """统一的聊天接口"""
         driver = cls.get_model_driver(model_name, model_config, version_config)
+        return cls.chat_with_driver(driver, messages, temperature, stream)
+
+    @classmethod
+    def chat_with_driver(cls, driver: BaseModel, messages: List[Dict[str, str]], temperature: float,
+                         stream: bool = False, use_cache: Optional[bool] = None) -> Any:
+        """使用已构造好的驱动实例调用模型（驱动可与检索等准备工作并行构造）
         
+        Args:
+            use_cache: 是否使用回复缓存。True 总是使用，False 不使用；
+                None 时在开启 response_cache.enabled 且temperature为0时使用
+        """
+        driver.last_cache_hit = False
+        if cls._should_use_cache(temperature, use_cache):
+            return cls._chat_with_cache(driver, messages, temperature, stream)
         if stream:
             return driver.chat_stream(messages, temperature)
         else:
-            return driver.chat(messages, temperature, stream)
\ No newline at end of file
+            return driver.chat(messages, temperature, stream)
+
+    @staticmethod
+    def _should_use_cache(temperature: float, use_cache: Optional[bool]) -> bool:
+        if use_cache is not None:
+            return bool(use_cache)
+        return bool(config_manager.get('response_cache.enabled', False)) and float(temperature or 0) == 0
+
+    @classmethod
+    def _chat_with_cache(cls, driver: BaseModel, messages: List[Dict[str, str]], temperature: float,
+                         stream: bool) -> Any:
+        """先查回复缓存，命中时直接返回（流式调用按增量回放），未命中时调用模型并保存完整回复"""
+        from app.models.response_cache import ResponseCache, get_response_cache
+        
+        cache = get_response_cache()
+        vendor = driver.model_config.get('name', '')
+        version = driver.version_config.get('version_name') or driver.version_config.get('name') or ''
+        params = {
+            'base_url': driver.version_config.get('api_base_url'),
+            'options': driver.version_config.get('options')
+        }
+        key = ResponseCache.make_key(vendor, version, messages, temperature, params)
+        cached = cache.get(key)
+        if cached is not None:
+            driver.last_cache_hit = True
+            return cls._replay_stream(cached) if stream else dict(driver._format_response(cached), cached=True)
+        if not stream:
+            response = driver.chat(messages, temperature, False)
+            cache.put(key, vendor, version, response.get('content') or '')
+            return response
+        return cls._caching_stream(driver, driver.chat_stream(messages, temperature), cache, key, vendor, version)
+
+    @staticmethod
+    def _caching_stream(driver: BaseModel, stream: Generator[str, None, None], cache, key: str,
+                        vendor: str, version: str) -> Generator[str, None, None]:
+        """透传流式响应并拼接完整回复，正常结束时写入缓存（出错或被取消的回复不缓存）"""
+        parts = []
+        failed = False
+        try:
+            for chunk in stream:
+                if isinstance(chunk, str) and chunk.startswith('data: '):
+                    try:
+                        data = json.loads(chunk[6:])
+                    except ValueError:
+                        data = {}
+                    if 'error' in data:
+                        failed = True
+                    elif data.get('chunk'):
+                        parts.append(data['chunk'])
+                elif isinstance(chunk, str):
+                    parts.append(chunk)
+                yield chunk
+            if not failed and not driver._cancelled:
+                cache.put(key, vendor, version, ''.join(parts))
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+    @staticmethod
+    def _replay_stream(content: str) -> Generator[str, None, None]:
+        """把缓存的回复按驱动的流式格式分块回放，块间间隔模拟真实的生成节奏"""
+        size = max(1, int(config_manager.get('response_cache.replay_chunk_chars', 4)))
+        interval = config_manager.get('response_cache.replay_interval_ms', 10) / 1000
+        for start in range(0, len(content), size):
+            if start and interval:
+                time.sleep(interval)
+            response_data = {'chunk': content[start:start + size], 'content_struct': None}
+            yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+        yield f"data: {json.dumps({'done': True, 'cached': True})}\n\n"
@@ -0,0 +1,149 @@
+# app/models/response_cache.py
+"""模型回复缓存 - 相同的模型版本、消息和参数直接返回之前的回复，持久化在独立的SQLite文件中"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+
+from app.core.config import config_manager
+
+
+class ResponseCache:
+    """模型回复缓存
+
+    - 键为 (供应商, 版本, 规范化消息, temperature, 运行参数) 的SHA-256
+    - 按条目数、总字节数和存活时间限制大小，超出时淘汰最久未使用的条目
+    - 命中/未命中次数常驻内存，用于统计命中率
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                vendor TEXT NOT NULL,
+                version TEXT NOT NULL,
+                content TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache (last_used)')
+
+    @staticmethod
+    def _normalize_messages(messages: List[Dict[str, str]]) -> List[List[str]]:
+        """只保留role和content，统一换行并去掉首尾空白，空白差异不影响命中"""
+        return [[msg.get('role', ''), (msg.get('content') or '').replace('\r\n', '\n').strip()]
+                for msg in messages]
+
+    @staticmethod
+    def make_key(vendor: str, version: str, messages: List[Dict[str, str]], temperature: float,
+                 params: Optional[Dict[str, Any]] = None) -> str:
+        """计算缓存键"""
+        payload = json.dumps([vendor, version, ResponseCache._normalize_messages(messages),
+                              round(float(temperature), 4), params or {}],
+                             ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _max_age() -> float:
+        return config_manager.get('response_cache.max_age_hours', 168) * 3600
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的回复，不存在或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT content, created_at FROM response_cache WHERE key = ?',
+                                     (key,)).fetchone()
+            if row and now - row[1] > self._max_age():
+                with self._conn:
+                    self._conn.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute('UPDATE response_cache SET last_used = ?, hits = hits + 1 WHERE key = ?',
+                                   (now, key))
+            return row[0]
+
+    def put(self, key: str, vendor: str, version: str, content: str) -> None:
+        """保存回复并按大小限制淘汰旧条目（空回复不缓存）"""
+        if not content:
+            return
+        now = time.time()
+        size = len(content.encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute('''
+            INSERT OR REPLACE INTO response_cache (key, vendor, version, content, bytes, created_at, last_used, hits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (key, vendor, version or '', content, size, now, now))
+            self._evict_locked(now)
+
+    def _evict_locked(self, now: float) -> None:
+        """删除过期条目，再按最久未使用的顺序删除超出条目数或字节数上限的条目"""
+        self._conn.execute('DELETE FROM response_cache WHERE created_at < ?', (now - self._max_age(),))
+        max_entries = config_manager.get('response_cache.max_entries', 1000)
+        max_bytes = config_manager.get('response_cache.max_bytes', 50 * 1024 * 1024)
+        entries, total_bytes = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM response_cache').fetchone()
+        if entries <= max_entries and total_bytes <= max_bytes:
+            return
+        evict = []
+        for key, size in self._conn.execute('SELECT key, bytes FROM response_cache ORDER BY last_used'):
+            if entries <= max_entries and total_bytes <= max_bytes:
+                break
+            evict.append((key,))
+            entries -= 1
+            total_bytes -= size
+        self._conn.executemany('DELETE FROM response_cache WHERE key = ?', evict)
+
+    def clear(self) -> int:
+        """清空缓存和命中统计，返回删除的条目数"""
+        with self._lock, self._conn:
+            deleted = self._conn.execute('DELETE FROM response_cache').rowcount
+            self.hits = self.misses = 0
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """条目数、占用字节数和命中率（命中统计从本次启动开始计算）"""
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM response_cache').fetchone()
+            lookups = self.hits + self.misses
+            return {
+                'enabled': bool(config_manager.get('response_cache.enabled', False)),
+                'entries': entries,
+                'bytes': total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取全局回复缓存（首次使用时打开缓存文件）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                db_path = os.path.join(config_manager.get_user_data_dir(), 'cache', 'response_cache.db')
+                _cache = ResponseCache(db_path)
+    return _cache
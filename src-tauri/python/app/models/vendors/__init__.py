@@ -1,8 +1,32 @@
-"""供应商模型相关模块"""
-from app.models.vendors.anthropic_model import AnthropicModel
-from app.models.vendors.github_model import GitHubModel
-from app.models.vendors.google_ai_model import GoogleAIModel
-from app.models.vendors.ollama_model import OllamaModel
-from app.models.vendors.openai_model import OpenAIModel
-
-__all__ = ['AnthropicModel', 'GitHubModel', 'GoogleAIModel', 'OllamaModel', 'OpenAIModel']
\ No newline at end of file
+"""供应商模型相关模块
+
+各驱动依赖的SDK（langchain_openai、langchain_anthropic等）导入很慢，
+这里不在包导入时加载驱动，访问驱动类时才导入对应模块。
+"""
+import importlib
+
+# 驱动类名 -> 所在模块
+_DRIVER_MODULES = {
+    'AnthropicModel': 'app.models.vendors.anthropic_model',
+    'GitHubModel': 'app.models.vendors.github_model',
+    'GoogleAIModel': 'app.models.vendors.google_ai_model',
+    'OllamaModel': 'app.models.vendors.ollama_model',
+    'OpenAIModel': 'app.models.vendors.openai_model',
+    'OpenAICompatibleModel': 'app.models.vendors.openai_compatible_model',
+}
+
+__all__ = ['AnthropicModel', 'GitHubModel', 'GoogleAIModel', 'OllamaModel', 'OpenAIModel', 'OpenAICompatibleModel']
+
+
+def __getattr__(name):
+    """首次访问驱动类时导入所在模块"""
+    module_path = _DRIVER_MODULES.get(name)
+    if module_path is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    driver_class = getattr(importlib.import_module(module_path), name)
+    globals()[name] = driver_class
+    return driver_class
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
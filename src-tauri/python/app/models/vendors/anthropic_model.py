@@ -5,7 +5,11 @@ import json
 from typing import Dict, Any, Generator, List
 
 class AnthropicModel(BaseModel):
-    """Anthropic模型驱动 (使用langchain)"""
+    """Anthropic模型驱动 (使用langchain)
+
+    消息组装时标记为稳定前缀末尾（cache_prefix）的消息带上cache_control，Anthropic缓存到该位置为止的提示词，
+    后续请求前缀相同时直接读取缓存；缓存读取和写入的token数记录在last_metrics中。
+    """
     
     def _initialize_llm(self) -> None:
         """初始化langchain的Anthropic LLM实例"""
@@ -26,26 +30,51 @@ class AnthropicModel(BaseModel):
             timeout=60
         )
     
+    def _convert_to_langchain_messages(self, messages: List[Dict[str, str]]) -> List[Any]:
+        """转换消息格式，稳定前缀末尾的消息内容改为带cache_control的内容块"""
+        langchain_messages = super()._convert_to_langchain_messages(messages)
+        for msg, langchain_message in zip(messages, langchain_messages):
+            if msg.get('cache_prefix') and msg['content']:
+                langchain_message.content = [
+                    {'type': 'text', 'text': msg['content'], 'cache_control': {'type': 'ephemeral'}}
+                ]
+        return langchain_messages
+    
+    def _record_usage_metadata(self, usage: Dict[str, Any]) -> None:
+        """记录langchain汇总的token用量（input_tokens已包含缓存读取和写入的token）"""
+        if not usage:
+            return
+        details = usage.get('input_token_details') or {}
+        self._record_usage(usage.get('input_tokens', 0), usage.get('output_tokens', 0),
+                           details.get('cache_read', 0), details.get('cache_creation', 0))
+    
     def chat(self, messages: List[Dict[str, str]], temperature: float, stream: bool = False) -> Dict[str, Any]:
         """非流式调用Anthropic API"""
         langchain_messages = self._convert_to_langchain_messages(messages)
         self.llm.temperature = temperature
         
         response = self.llm.invoke(langchain_messages)
+        self._record_usage_metadata(getattr(response, 'usage_metadata', None))
         return self._format_response(response.content)
     
     def chat_stream(self, messages: List[Dict[str, str]], temperature: float) -> Generator[str, None, None]:
         """流式调用Anthropic API"""
+        from langchain_core.messages.ai import add_usage
+        
         langchain_messages = self._convert_to_langchain_messages(messages)
         self.llm.temperature = temperature
         
+        usage = None
         for chunk in self.llm.stream(langchain_messages):
+            if getattr(chunk, 'usage_metadata', None):
+                usage = add_usage(usage, chunk.usage_metadata)
             if hasattr(chunk, 'content') and chunk.content:
                 response_data = {
                     'chunk': chunk.content,
                     'content_struct': None
                 }
                 yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+        self._record_usage_metadata(usage)
         
-        response_data = {'done': True}
+        response_data = {'done': True, 'metrics': self.last_metrics}
         yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
\ No newline at end of file
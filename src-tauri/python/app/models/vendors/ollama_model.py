@@ -1,72 +1,163 @@
 # app/models/ollama_model.py
-from app.models.base_model import BaseModel
-from langchain_ollama import ChatOllama
 import json
-from typing import Dict, Any, Generator, List
+from typing import Dict, Any, Generator, List, Optional
+
+from app.core.config import config_manager
+from app.models.base_model import BaseModel
+from app.models.http_client import get_http_client
 
 
 class OllamaModel(BaseModel):
+    """Ollama本地模型驱动（直接调用Ollama的 /api/chat 接口）
+
+    版本配置的options中可以设置：
+    - keep_alive: 模型在最后一次请求后保留在内存中的时间（如 "30m"，-1 表示一直保留，0 表示用完立即卸载），
+      避免两条消息之间模型被卸载、下次请求重新加载
+    - num_ctx / num_thread / num_batch 等Ollama运行参数，原样放入请求的options
+    """
+
     def _initialize_llm(self) -> None:
-        """初始化langchain的Ollama LLM实例"""
-        # 检查多个可能的版本名称字段，解决'name'错误问题
-        selected_version = self.version_config.get('version_name')
-        base_url = self.version_config.get('api_base_url', self.version_config.get('base_url', 'http://localhost:11434'))
-        
-        # 创建ChatOllama实例
-        self.llm = ChatOllama(
-            model=selected_version,
-            base_url=base_url,
-            temperature=0.7,  # 默认温度，会在调用时被覆盖
-            timeout=60  # 超时设置
-        )
+        """解析接口地址、模型名和运行参数"""
+        self.model = self.version_config.get('version_name')
+        base_url = self.version_config.get('api_base_url') or \
+                   self.version_config.get('base_url') or 'http://localhost:11434'
+        self.base_url = base_url.rstrip('/')
+
+        options = dict(self.version_config.get('options') or {})
+        self.keep_alive = self._normalize_keep_alive(options.pop('keep_alive', None))
+        self.options = {key: value for key, value in options.items() if value not in (None, '')}
+
+        # 首次请求可能需要从磁盘加载模型，读取超时比云端接口更长
+        self.client = get_http_client(self.base_url, config_manager.get('models.ollama_timeout', 300))
+
+    @staticmethod
+    def _normalize_keep_alive(keep_alive):
+        """未设置时使用全局默认值；纯数字字符串转为秒数（Ollama只把数字解释为秒）"""
+        if keep_alive is None or keep_alive == '':
+            keep_alive = config_manager.get('models.ollama_keep_alive', '30m')
+        if isinstance(keep_alive, str) and keep_alive.strip().lstrip('-').isdigit():
+            return int(keep_alive)
+        return keep_alive
+
+    def _build_payload(self, messages: List[Dict[str, str]], temperature: float, stream: bool) -> Dict[str, Any]:
+        """构造 /api/chat 请求体"""
+        return {
+            'model': self.model,
+            'messages': [{'role': msg['role'], 'content': msg['content']} for msg in messages],
+            'stream': stream,
+            'keep_alive': self.keep_alive,
+            'options': dict(self.options, temperature=temperature)
+        }
+
+    @staticmethod
+    def _raise_for_status(response) -> None:
+        """请求失败时抛出带有Ollama错误信息的异常"""
+        if response.status_code < 400:
+            return
+        response.read()
+        try:
+            message = response.json().get('error')
+        except Exception:
+            message = None
+        raise Exception(f'Ollama请求失败 ({response.status_code}): {message or response.text[:200]}')
+
+    @staticmethod
+    def _extract_metrics(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """从Ollama的最终响应中提取耗时统计（纳秒转为毫秒）"""
+        if 'total_duration' not in data and 'eval_count' not in data:
+            return None
+
+        def to_ms(field):
+            return round(data.get(field, 0) / 1e6, 1)
+
+        metrics = {
+            'total_ms': to_ms('total_duration'),
+            'load_ms': to_ms('load_duration'),
+            'prompt_eval_count': data.get('prompt_eval_count', 0),
+            'prompt_eval_ms': to_ms('prompt_eval_duration'),
+            'eval_count': data.get('eval_count', 0),
+            'eval_ms': to_ms('eval_duration'),
+        }
+        if metrics['prompt_eval_ms']:
+            metrics['prompt_tokens_per_s'] = round(metrics['prompt_eval_count'] / metrics['prompt_eval_ms'] * 1000, 1)
+        if metrics['eval_ms']:
+            metrics['eval_tokens_per_s'] = round(metrics['eval_count'] / metrics['eval_ms'] * 1000, 1)
+        return metrics
+
+    def _record_metrics(self, data: Dict[str, Any]) -> None:
+        self.last_metrics = self._extract_metrics(data)
+        if self.last_metrics:
+            print(f"[Ollama Model] {self.model} 加载 {self.last_metrics['load_ms']}ms，"
+                  f"提示词 {self.last_metrics['prompt_eval_count']} tokens / {self.last_metrics['prompt_eval_ms']}ms，"
+                  f"生成 {self.last_metrics['eval_count']} tokens / {self.last_metrics['eval_ms']}ms")
 
     def chat(self, messages: List[Dict[str, str]], temperature: float, stream: bool = False) -> Dict[str, Any]:
-        """非流式调用Ollama API (使用langchain)"""
-        # 打印接收的原始messages
-        # print(f"[Ollama Model] 接收的原始messages: {messages}")
-        
-        # 转换消息格式
-        langchain_messages = self._convert_to_langchain_messages(messages)
-        
-        # 打印转换后的langchain_messages
-        print(f"[Ollama Model] 转换后的langchain_messages: {langchain_messages}")
-        
-        # 更新LLM温度参数
-        self.llm.temperature = temperature
-        
-        # 调用LLM
-        response = self.llm.invoke(langchain_messages)
-        
-        # 提取回复内容
-        content = response.content
-        return self._format_response(content)
+        """非流式调用Ollama API（以流式方式读取响应体，取消时可以关闭连接）"""
+        try:
+            with self.client.stream('POST', f'{self.base_url}/api/chat',
+                                    json=self._build_payload(messages, temperature, False)) as response:
+                self._active_response = response
+                if self._cancelled:
+                    # 响应头返回前已被取消
+                    raise Exception('模型调用已取消')
+                self._raise_for_status(response)
+                response.read()
+        finally:
+            self._active_response = None
+        data = response.json()
+        self._record_metrics(data)
+        return self._format_response((data.get('message') or {}).get('content', ''))
 
     def chat_stream(self, messages: List[Dict[str, str]], temperature: float) -> Generator[str, None, None]:
-        """流式调用Ollama API (使用langchain)"""
-        # 打印接收的原始messages
-        # print(f"[Ollama Model] 接收的原始messages: {messages}")
-        
-        # 转换消息格式
-        langchain_messages = self._convert_to_langchain_messages(messages)
-        
-        # 打印转换后的langchain_messages
-        print(f"[Ollama Model] 转换后的langchain_messages: {langchain_messages}")
-        
-        # 更新LLM温度参数
-        self.llm.temperature = temperature
-        
-        # 使用流式调用
-        chunks = self.llm.stream(langchain_messages)
-        
-        # 处理流式响应
-        for chunk in chunks:
-            if hasattr(chunk, 'content') and chunk.content:
-                response_data = {
-                    'chunk': chunk.content,
-                    'content_struct': None
-                }
-                yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
-        
+        """流式调用Ollama API，逐行解析NDJSON响应"""
+        try:
+            with self.client.stream('POST', f'{self.base_url}/api/chat',
+                                    json=self._build_payload(messages, temperature, True)) as response:
+                self._active_response = response
+                if self._cancelled:
+                    return
+                self._raise_for_status(response)
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get('error'):
+                        raise Exception(f"Ollama生成失败: {data['error']}")
+                    content = (data.get('message') or {}).get('content')
+                    if content:
+                        response_data = {
+                            'chunk': content,
+                            'content_struct': None
+                        }
+                        yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+                    if data.get('done'):
+                        self._record_metrics(data)
+                        break
+        except Exception:
+            # 取消时连接被其他线程关闭，读取中断属于预期
+            if not self._cancelled:
+                raise
+        finally:
+            self._active_response = None
+
         # 结束流式传输
-        response_data = {'done': True}
-        yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
\ No newline at end of file
+        response_data = {'done': True, 'metrics': self.last_metrics}
+        yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+
+    def warm(self) -> Dict[str, Any]:
+        """预加载模型到内存：不带提示词的 /api/generate 请求只加载模型，并按keep_alive保留"""
+        response = self.client.post(f'{self.base_url}/api/generate', json={
+            'model': self.model,
+            'stream': False,
+            'keep_alive': self.keep_alive,
+            'options': self.options
+        })
+        self._raise_for_status(response)
+        data = response.json()
+        self.last_metrics = self._extract_metrics(data)
+        return {
+            'model': self.model,
+            'keep_alive': self.keep_alive,
+            'load_ms': round(data.get('load_duration', 0) / 1e6, 1),
+            'total_ms': round(data.get('total_duration', 0) / 1e6, 1)
+        }
@@ -0,0 +1,185 @@
+# app/models/openai_compatible_model.py
+import json
+from typing import Dict, Any, Generator, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import config_manager
+from app.models.base_model import BaseModel
+from app.models.http_client import get_http_client
+
+
+class OpenAICompatibleModel(BaseModel):
+    """OpenAI兼容接口的原生驱动（不经过langchain）
+
+    直接向 {base_url}/chat/completions 发送请求，流式响应按行增量解析SSE，
+    每个增量只做一次json解析和一次json序列化，没有消息对象转换和回调链。
+    同一接口地址的驱动实例共享一个连接池（可用时启用HTTP/2），
+    后续对话复用已建立的TLS连接。
+
+    提示词缓存：各供应商对相同的请求前缀自动缓存，EXPLICIT_CACHE_VENDORS中的供应商需要在前缀末尾
+    放置cache_control标记。回复结束后，服务端返回的缓存命中token数记录在last_metrics中。
+    """
+
+    # 各供应商的默认接口地址，版本配置中的api_base_url优先
+    DEFAULT_BASE_URLS = {
+        'Deepseek': 'https://api.deepseek.com/v1',
+        'Doubao': 'https://ark.cn-beijing.volces.com/api/v3',
+        'Qwen': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
+        '文心一言': 'https://qianfan.baidubce.com/v2',
+        'OpenAI': 'https://api.openai.com/v1',
+    }
+    # 需要显式cache_control标记才缓存提示词前缀的供应商（通义千问的显式缓存）
+    EXPLICIT_CACHE_VENDORS = {'Qwen'}
+
+    def _initialize_llm(self) -> None:
+        """解析接口地址、密钥和模型名，获取共享连接池"""
+        vendor = self.model_config.get('name', '')
+        self.model = self.version_config.get('version_name') or \
+                     self.version_config.get('name') or \
+                     self.version_config.get('custom_name')
+        self.vendor = vendor
+        self.api_key = self.version_config.get('api_key')
+        base_url = self.version_config.get('api_base_url') or \
+                   self.version_config.get('base_url') or \
+                   self.DEFAULT_BASE_URLS.get(vendor)
+
+        if not self.model:
+            raise Exception(f'{vendor}模型版本未配置')
+        if not self.api_key:
+            raise Exception(f'{vendor} API密钥未配置')
+        if not base_url:
+            raise Exception(f'{vendor}接口地址未配置')
+
+        self.endpoint = self._resolve_endpoint(base_url)
+        self.client = get_http_client(self.endpoint)
+
+    @staticmethod
+    def _resolve_endpoint(base_url: str) -> str:
+        """补全 /chat/completions 路径（配置中既可以填基础地址，也可以填完整地址）"""
+        base_url = base_url.rstrip('/')
+        if base_url.endswith('/chat/completions'):
+            return base_url
+        return f'{base_url}/chat/completions'
+
+    def _build_message(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """消息只保留role和content；需要显式缓存的供应商在稳定前缀末尾的消息上放置cache_control"""
+        if msg.get('cache_prefix') and self.vendor in self.EXPLICIT_CACHE_VENDORS:
+            return {'role': msg['role'], 'content': [
+                {'type': 'text', 'text': msg['content'], 'cache_control': {'type': 'ephemeral'}}
+            ]}
+        return {'role': msg['role'], 'content': msg['content']}
+
+    def _build_payload(self, messages: List[Dict[str, str]], temperature: float, stream: bool) -> Dict[str, Any]:
+        """构造请求体"""
+        payload = {
+            'model': self.model,
+            'messages': [self._build_message(msg) for msg in messages],
+            'temperature': temperature,
+            'stream': stream
+        }
+        if stream and config_manager.get('models.stream_usage', True):
+            # 流式响应最后附带token用量（含缓存命中的token数）
+            payload['stream_options'] = {'include_usage': True}
+        return payload
+
+    def _record_usage_from(self, usage: Optional[Dict[str, Any]]) -> None:
+        """解析服务端返回的usage：OpenAI/通义千问/豆包为prompt_tokens_details.cached_tokens，
+        Deepseek为prompt_cache_hit_tokens"""
+        if not usage:
+            return
+        details = usage.get('prompt_tokens_details') or {}
+        cached_tokens = details.get('cached_tokens') or usage.get('prompt_cache_hit_tokens') or 0
+        self._record_usage(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), cached_tokens)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        }
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response) -> None:
+        """请求失败时抛出带有接口错误信息的异常"""
+        if response.status_code < 400:
+            return
+        response.read()
+        try:
+            error = response.json().get('error', {})
+            message = error.get('message') if isinstance(error, dict) else error
+        except Exception:
+            message = None
+        raise Exception(f'模型接口请求失败 ({response.status_code}): {message or response.text[:200]}')
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float, stream: bool = False) -> Dict[str, Any]:
+        """非流式调用OpenAI兼容接口（以流式方式读取响应体，取消时可以关闭连接）"""
+        try:
+            with self.client.stream('POST', self.endpoint, headers=self._headers(),
+                                    json=self._build_payload(messages, temperature, False)) as response:
+                self._active_response = response
+                if self._cancelled:
+                    # 响应头返回前已被取消
+                    raise Exception('模型调用已取消')
+                self._raise_for_status(response)
+                response.read()
+        finally:
+            self._active_response = None
+        data = response.json()
+        self._record_usage_from(data.get('usage'))
+        choices = data.get('choices') or [{}]
+        content = (choices[0].get('message') or {}).get('content') or ''
+        return self._format_response(content)
+
+    @staticmethod
+    def _parse_sse_line(line: str) -> Tuple[Optional[str], bool, Optional[Dict[str, Any]]]:
+        """解析一行SSE
+
+        Returns:
+            tuple: (增量文本, 是否收到[DONE], usage)，非data行和空增量返回 (None, False, None)
+        """
+        if not line.startswith('data:'):
+            return None, False, None
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return None, True, None
+        if not data:
+            return None, False, None
+        event = json.loads(data)
+        usage = event.get('usage')
+        choices = event.get('choices')
+        if not choices:
+            return None, False, usage
+        delta = choices[0].get('delta') or {}
+        return delta.get('content') or None, False, usage
+
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float) -> Generator[str, None, None]:
+        """流式调用OpenAI兼容接口，按行增量解析SSE"""
+        try:
+            with self.client.stream('POST', self.endpoint, headers=self._headers(),
+                                    json=self._build_payload(messages, temperature, True)) as response:
+                self._active_response = response
+                if self._cancelled:
+                    return
+                self._raise_for_status(response)
+                for line in response.iter_lines():
+                    content, finished, usage = self._parse_sse_line(line)
+                    if usage:
+                        self._record_usage_from(usage)
+                    if content:
+                        response_data = {
+                            'chunk': content,
+                            'content_struct': None
+                        }
+                        yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+                    if finished:
+                        break
+        except Exception:
+            # 取消时连接被其他线程关闭，读取中断属于预期
+            if not self._cancelled:
+                raise
+        finally:
+            self._active_response = None
+
+        response_data = {'done': True, 'metrics': self.last_metrics}
+        yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
@@ -1,15 +1,29 @@
 """对话相关业务逻辑服务"""
 import sys
+import time
 import uuid
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from app.core.data_manager import db, save_data, get_db_connection  # 依赖数据管理模块
+from app.core.config import config_manager
 from app.models.model_manager import ModelManager  # 导入模型管理器
 from app.services.base_service import BaseService
+from app.services.request_scheduler import RequestScheduler, QueueFullError
+from app.services.model_router import ModelRouter
 
 class ChatService(BaseService):
     """对话服务类，封装所有对话相关的业务逻辑"""
 
+    # 发送消息前各准备阶段（RAG检索、历史组装、驱动构造）共用的线程池
+    _prepare_executor = None
+    _prepare_executor_lock = threading.Lock()
+    # 进行中的流式生成：AI消息ID -> {chat_id, message_id, cancelled, driver}，用于显式取消
+    _active_generations = {}
+    _active_generations_lock = threading.Lock()
+
     @staticmethod
     def get_chats():
         """获取所有对话"""
@@ -30,6 +44,7 @@ class ChatService(BaseService):
                 preview = chat_row[2] if len(chat_row) > 2 else ''
                 created_at = chat_row[3] if len(chat_row) > 3 else datetime.now().isoformat()
                 updated_at = chat_row[4] if len(chat_row) > 4 else datetime.now().isoformat()
+                routing = json.loads(chat_row[5]) if len(chat_row) > 5 and chat_row[5] else None
                 
                 # 获取对话的所有消息
                 cursor.execute("SELECT * FROM messages WHERE chat_id = ? ORDER BY created_at", (chat_id,))
@@ -43,24 +58,37 @@ class ChatService(BaseService):
                     content = msg_row[3] if len(msg_row) > 3 else ''
                     msg_created_at = msg_row[4] if len(msg_row) > 4 else datetime.now().isoformat()
                     model = msg_row[5] if len(msg_row) > 5 else None
+                    truncated = bool(msg_row[6]) if len(msg_row) > 6 else False
+                    token_counts = json.loads(msg_row[7]) if len(msg_row) > 7 and msg_row[7] else None
                     
-                    message_list.append({
+                    message = {
                         'id': msg_id,
                         'role': role,
                         'content': content,
                         'createdAt': msg_created_at,
                         'model': model
-                    })
+                    }
+                    if truncated:
+                        # 生成被取消的不完整回复
+                        message['truncated'] = True
+                    if token_counts:
+                        # 按分词器缓存的消息token数
+                        message['tokenCounts'] = token_counts
+                    message_list.append(message)
                 
                 # 添加对话到列表
-                chat_list.append({
+                chat = {
                     'id': chat_id,
                     'title': title,
                     'preview': preview,
                     'createdAt': created_at,
                     'updatedAt': updated_at,
                     'messages': message_list
-                })
+                }
+                if routing:
+                    # 对话的路由策略（备用模型、对冲和失败切换）
+                    chat['routing'] = routing
+                chat_list.append(chat)
             
             # 关闭数据库连接
             conn.close()
@@ -152,6 +180,7 @@ class ChatService(BaseService):
             preview = chat_row[2] if len(chat_row) > 2 else ''
             created_at = chat_row[3] if len(chat_row) > 3 else datetime.now().isoformat()
             updated_at = chat_row[4] if len(chat_row) > 4 else datetime.now().isoformat()
+            routing = json.loads(chat_row[5]) if len(chat_row) > 5 and chat_row[5] else None
             
             # 获取对话的所有消息
             cursor.execute("SELECT * FROM messages WHERE chat_id = ? ORDER BY created_at", (chat_id,))
@@ -164,13 +193,22 @@ class ChatService(BaseService):
                 role = msg_row[2] if len(msg_row) > 2 else 'user'
                 content = msg_row[3] if len(msg_row) > 3 else ''
                 msg_created_at = msg_row[4] if len(msg_row) > 4 else datetime.now().isoformat()
+                truncated = bool(msg_row[6]) if len(msg_row) > 6 else False
+                token_counts = json.loads(msg_row[7]) if len(msg_row) > 7 and msg_row[7] else None
                 
-                message_list.append({
+                message = {
                     'id': msg_id,
                     'role': role,
                     'content': content,
                     'createdAt': msg_created_at
-                })
+                }
+                if truncated:
+                    # 生成被取消的不完整回复
+                    message['truncated'] = True
+                if token_counts:
+                    # 按分词器缓存的消息token数
+                    message['tokenCounts'] = token_counts
+                message_list.append(message)
             
             # 关闭数据库连接
             conn.close()
@@ -184,6 +222,9 @@ class ChatService(BaseService):
                 'updatedAt': updated_at,
                 'messages': message_list
             }
+            if routing:
+                # 对话的路由策略（备用模型、对冲和失败切换）
+                chat['routing'] = routing
             
             # 更新内存数据库
             db['chats'].append(chat)
@@ -244,13 +285,14 @@ class ChatService(BaseService):
             return True
     
     @staticmethod
-    def get_chat_context(chat_id, max_messages=10):
+    def get_chat_context(chat_id, max_messages=None, model_name=None, version_name=None):
         """
         获取对话上下文历史
         
         参数:
             chat_id: 对话ID
-            max_messages: 最大获取的消息数量，默认10条
+            max_messages: 最大获取的消息数量，默认为配置 chat.history_messages
+            model_name / version_name: 接收消息的模型，按其分词器统计token数（配置了 chat.history_token_budget 时）
             
         返回:
             格式化的上下文消息列表，或者None（如果对话不存在）
@@ -262,49 +304,83 @@ class ChatService(BaseService):
         
         # 获取对话历史消息
         messages = chat.get('messages', [])
+        if max_messages is None:
+            max_messages = config_manager.get('chat.history_messages', 10)
         
-        # 如果消息数量超过max_messages，只保留最近的max_messages条
+        # 如果消息数量超过max_messages，只保留最近的消息。窗口起点按 history_window_step 条整块前移，
+        # 而不是每轮都前移，起点不变的几轮中请求前缀相同，可以命中模型服务的提示词缓存
+        step = max(1, min(int(config_manager.get('chat.history_window_step', 4)), max(1, max_messages)))
         if len(messages) > max_messages:
-            messages = messages[-max_messages:]
+            start = len(messages) - max_messages
+            start = -(-start // step) * step
+            messages = messages[start:]
         
         # 转换为适合模型输入的格式
         formatted_messages = []
         for msg in messages:
             # 确保消息有必要的字段
             if 'role' in msg and 'content' in msg:
-                # 原始内容
-                original_content = msg['content']
-                # 剔除content中的think标签内容
-                content = original_content
-                
-                # 定义可能的think标签格式
-                think_tag_pairs = [
-                    ('<think>', '</think>'),  # 尖括号格式
-                    ('[think]', '[/think]'),  # 方括号格式
-                ]
-                
-                # 对每种标签格式进行过滤
-                for opening_tag, closing_tag in think_tag_pairs:
-                    while opening_tag in content:
-                        start = content.find(opening_tag)
-                        if start != -1:
-                            # 从start + len(opening_tag)的位置开始查找结束标签
-                            end = content.find(closing_tag, start + len(opening_tag))
-                            if end != -1:
-                                # 保留开始标签前的内容和结束标签后的内容
-                                content = content[:start] + content[end + len(closing_tag):]
-                            else:
-                                break
-                
-                # 去除多余的空白字符
-                content = content.strip()
-                
                 formatted_messages.append({
                     'role': msg['role'],
-                    'content': content
+                    'content': ChatService._strip_think_tags(msg['content']),
+                    # 与存储的消息共用token数缓存，统计结果随消息保存，之后的轮次不再重新统计
+                    'tokenCounts': msg.setdefault('tokenCounts', {})
                 })
         
+        # 超出token上限时从最早的消息开始按 history_window_step 条整块丢弃，至少保留当前问题
+        token_budget = config_manager.get('chat.history_token_budget', 0)
+        if token_budget and len(formatted_messages) > 1:
+            from app.services.tokenizer_service import TokenizerService
+            
+            overhead = config_manager.get('tokenizer.message_overhead', 4)
+            counts = [count + overhead for count in
+                      TokenizerService.message_tokens(formatted_messages, model_name, version_name)]
+            trim = 0
+            while trim < len(counts) - 1 and sum(counts[trim:]) > token_budget:
+                trim = min(trim + step, len(counts) - 1)
+            if trim:
+                print(f"✂️ 历史消息超出 {token_budget} tokens，丢弃最早的 {trim} 条")
+                formatted_messages = formatted_messages[trim:]
+        
         return formatted_messages
+    
+    @staticmethod
+    def _strip_think_tags(content):
+        """剔除content中的think标签内容并去除首尾空白"""
+        # 定义可能的think标签格式
+        think_tag_pairs = [
+            ('<think>', '</think>'),  # 尖括号格式
+            ('[think]', '[/think]'),  # 方括号格式
+        ]
+        
+        # 对每种标签格式进行过滤
+        for opening_tag, closing_tag in think_tag_pairs:
+            while opening_tag in content:
+                start = content.find(opening_tag)
+                if start != -1:
+                    # 从start + len(opening_tag)的位置开始查找结束标签
+                    end = content.find(closing_tag, start + len(opening_tag))
+                    if end != -1:
+                        # 保留开始标签前的内容和结束标签后的内容
+                        content = content[:start] + content[end + len(closing_tag):]
+                    else:
+                        break
+        
+        # 去除多余的空白字符
+        return content.strip()
+    
+    @staticmethod
+    def _cache_message_tokens(messages, model_display_name):
+        """写入消息时用回复模型的分词器统计一次token数（与发送给模型的内容一致，不含think标签）"""
+        from app.services.tokenizer_service import TokenizerService
+        
+        model_name, version_name, _ = ChatService.parse_model_info((model_display_name or '').replace(' - ', '-', 1))
+        views = [{'content': ChatService._strip_think_tags(msg['content']),
+                  'tokenCounts': msg.setdefault('tokenCounts', {})} for msg in messages]
+        try:
+            TokenizerService.message_tokens(views, model_name, version_name)
+        except Exception as e:
+            print(f"⚠️ 统计消息token数失败: {str(e)}")
 
     @staticmethod
     def get_rag_enhanced_prompt(question, rag_config=None):
@@ -322,20 +398,22 @@ class ChatService(BaseService):
             from app.services.vector_store_service import VectorStoreService
             vector_service = VectorStoreService.get_instance()
             if vector_service:
-                # 获取RAG设置，处理前端可能使用的不同键名
-                # 将前端的topK映射到后端的top_k
-                top_k = rag_settings.get('topK', rag_settings.get('top_k', 3))
-                score_threshold = rag_settings.get('score_threshold', 0.7)
+                # 检索参数与输入时的预取共用同一转换，保证缓存键一致
+                from app.services.rag_service import RAGService
+                token_budget = rag_settings.get('contextTokenBudget',
+                                                config_manager.get('rag.context_token_budget', 1500))
                 
-                # 执行向量搜索
-                result = vector_service.search_documents(question, k=top_k, score_threshold=score_threshold)
+                # 执行向量搜索，rerank未指定时由config['rag']['rerank_enabled']决定
+                result = vector_service.search_documents(question, **RAGService.get_search_params(rag_settings))
                 
-                # 构造增强提示
+                # 构造增强提示：合并相邻片段、去重后按token预算打包完整片段
                 if result:
-                    context = "\n".join([f"参考文档{i+1}：{doc.page_content[:200]}..." 
-                                        for i, doc in enumerate(result)])
-                    if context:
-                        return f"参考文档：{context}\n问题：{question}"
+                    from app.utils.RagUtils.context_assembler import ContextAssembler
+                    assembled = ContextAssembler.assemble(result, token_budget=int(token_budget))
+                    if assembled['context']:
+                        print(f"📚 RAG上下文: {assembled['retrieved_chunks']} 个片段 -> {assembled['blocks_used']} 段，"
+                              f"约 {assembled['tokens']} tokens")
+                        return f"参考文档：\n{assembled['context']}\n\n问题：{question}"
                 return question
             print("VectorStoreService实例未初始化，跳过RAG增强")
             return question
@@ -344,6 +422,51 @@ class ChatService(BaseService):
             # 确保即使RAG失败，原始问题也能正常返回
             return question
 
+    @staticmethod
+    def get_routing_policy(chat_id):
+        """
+        获取对话的路由策略
+        返回: (result, status_code)
+        """
+        chat = ChatService.get_chat(chat_id)
+        if not chat:
+            return {'error': '对话不存在'}, 404
+        return {'success': True, 'routing': chat.get('routing')}, 200
+
+    @staticmethod
+    def set_routing_policy(chat_id, policy):
+        """
+        设置对话的路由策略（备用模型、对冲和失败切换），policy为空时清除
+        返回: (result, status_code)
+        """
+        chat = ChatService.get_chat(chat_id)
+        if not chat:
+            return {'error': '对话不存在'}, 404
+        try:
+            routing = ModelRouter.normalize_policy(policy)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if routing:
+            backup_name, _, _ = ChatService.parse_model_info(routing['backup_model'])
+            _, error_response, error_code = ChatService.validate_model(backup_name)
+            if error_response:
+                return {'error': f"备用模型不可用: {error_response['error']}"}, error_code
+
+        if routing:
+            chat['routing'] = routing
+        else:
+            chat.pop('routing', None)
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute('UPDATE chats SET routing = ? WHERE id = ?',
+                           (json.dumps(routing, ensure_ascii=False) if routing else None, chat_id))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"❌ 保存路由策略失败: {str(e)}")
+        return {'success': True, 'routing': routing}, 200
+
     @staticmethod
     def parse_model_info(model_name):
         """
@@ -384,21 +507,25 @@ class ChatService(BaseService):
 
 
     @staticmethod
-    def create_ai_message(now, content, model_display_name):
-        """创建标准格式的AI回复消息"""
-        return {
-            'id': str(uuid.uuid4()),
+    def create_ai_message(now, content, model_display_name, message_id=None, truncated=False):
+        """创建标准格式的AI回复消息，truncated表示生成被取消、内容不完整"""
+        ai_message = {
+            'id': message_id or str(uuid.uuid4()),
             'role': 'assistant',
             'content': content,  # 保留原始content字段以兼容旧版前端
             'createdAt': now,
             'model': model_display_name
         }
+        if truncated:
+            ai_message['truncated'] = True
+        return ai_message
 
     @staticmethod
     def update_chat_and_save(chat, message_text, user_message, ai_message, now):
         """更新对话并保存"""
         # 添加AI回复到对话（内存）
         chat['messages'].append(ai_message)
+        ChatService._cache_message_tokens([user_message, ai_message], ai_message.get('model'))
         
         # 更新对话的更新时间
         chat['updatedAt'] = now
@@ -421,15 +548,18 @@ class ChatService(BaseService):
             
             # 保存用户消息到数据库
             cursor.execute('''
-            INSERT OR REPLACE INTO messages (id, chat_id, role, content, created_at, model)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_message['id'], chat['id'], user_message['role'], user_message['content'], user_message['createdAt'], user_message.get('model')))
+            INSERT OR REPLACE INTO messages (id, chat_id, role, content, created_at, model, token_counts)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_message['id'], chat['id'], user_message['role'], user_message['content'], user_message['createdAt'], user_message.get('model'),
+                  json.dumps(user_message['tokenCounts']) if user_message.get('tokenCounts') else None))
             
             # 保存AI消息到数据库
             cursor.execute('''
-            INSERT OR REPLACE INTO messages (id, chat_id, role, content, created_at, model)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (ai_message['id'], chat['id'], ai_message['role'], ai_message['content'], ai_message['createdAt'], ai_message.get('model')))
+            INSERT OR REPLACE INTO messages (id, chat_id, role, content, created_at, model, truncated, token_counts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (ai_message['id'], chat['id'], ai_message['role'], ai_message['content'], ai_message['createdAt'],
+                  ai_message.get('model'), ai_message.get('truncated', False),
+                  json.dumps(ai_message['tokenCounts']) if ai_message.get('tokenCounts') else None))
             
             # 更新对话信息
             cursor.execute('''
@@ -456,18 +586,317 @@ class ChatService(BaseService):
         """
         # 获取对话上下文历史
         context_messages = ChatService.get_chat_context(chat_id)
+        return ChatService._build_model_messages(context_messages, enhanced_question)
+
+    @staticmethod
+    def _build_model_messages(context_messages, enhanced_question):
+        """
+        用对话上下文和增强后的问题组装模型消息
         
+        消息按变化频率排列：系统提示词、历史消息、当前问题（含RAG检索上下文）。
+        系统提示词和历史消息的末尾标记为cache_prefix，支持提示词缓存的驱动在此处放置缓存标记；
+        每轮变化的检索上下文只放在最后一条消息中，不影响前面的前缀。
+        """
         # 准备消息格式，如果有上下文则使用上下文，否则使用当前问题
         if context_messages and len(context_messages) > 0:
             # 替换最后一条消息（即当前消息）的内容为增强后的问题
             messages = context_messages.copy()
             if messages:
                 messages[-1]['content'] = enhanced_question
+                # 当前问题已替换为增强后的内容，不再使用存储消息的token数
+                messages[-1].pop('tokenCounts', None)
         else:
             # 如果没有上下文历史，只发送当前问题
             messages = [{'role': 'user', 'content': enhanced_question}]
         
+        if len(messages) > 1:
+            messages[-2]['cache_prefix'] = True
+        system_prompt = config_manager.get('chat.system_prompt', '')
+        if system_prompt:
+            messages.insert(0, {'role': 'system', 'content': system_prompt, 'cache_prefix': True})
         return messages
+
+    @staticmethod
+    def _get_prepare_executor():
+        """获取准备阶段线程池（首次使用时创建）"""
+        if ChatService._prepare_executor is None:
+            with ChatService._prepare_executor_lock:
+                if ChatService._prepare_executor is None:
+                    workers = max(3, int(config_manager.get('chat.prepare_workers', 8)))
+                    ChatService._prepare_executor = ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix='chat-prepare')
+        return ChatService._prepare_executor
+
+    @staticmethod
+    def _run_timed(func, *args):
+        """执行一个准备阶段，返回 (结果, 异常, 耗时毫秒)"""
+        start = time.perf_counter()
+        try:
+            result, error = func(*args), None
+        except Exception as e:
+            result, error = None, e
+        return result, error, round((time.perf_counter() - start) * 1000, 1)
+
+    @staticmethod
+    def _build_model_driver(model_name, version_name, stream=False):
+        """
+        验证模型并构造驱动实例
+        
+        返回: (driver, error_response, error_code)
+        """
+        model, error_response, error_code = ChatService.validate_model(model_name)
+        if error_response:
+            return None, error_response, error_code
+        
+        version_config = ChatService.get_version_config(model, version_name)
+        if stream and not version_config.get('streaming_config', False):
+            return None, {'error': '该模型未启用流式传输'}, 400
+        
+        return ModelManager.get_model_driver(model_name, model, version_config), None, None
+
+    @staticmethod
+    def start_message_preparation(chat, message_text, rag_config, model_name, version_name, stream=False):
+        """
+        并行启动发送消息前的三个相互独立的准备阶段：
+        RAG检索、对话历史组装、模型驱动构造。首个token的等待时间从三者之和变为三者最大值。
+        对话设置了路由策略时，备用模型的驱动同时构造。
+        
+        返回:
+            准备任务，交给collect_message_preparation取回结果
+        """
+        executor = ChatService._get_prepare_executor()
+        stages = {
+            'history': executor.submit(ChatService._run_timed, ChatService.get_chat_context, chat['id'],
+                                       None, model_name, version_name),
+            'driver': executor.submit(ChatService._run_timed, ChatService._build_model_driver,
+                                      model_name, version_name, stream)
+        }
+        if rag_config.get('enabled', False):
+            # 调用RAG系统构造增强提示，考虑前端传递的ragConfig配置
+            stages['rag'] = executor.submit(ChatService._run_timed, ChatService.get_rag_enhanced_prompt,
+                                            message_text, rag_config)
+        routing = chat.get('routing') or {}
+        backup = None
+        if routing.get('backup_model'):
+            backup_name, backup_version, backup_display_name = ChatService.parse_model_info(routing['backup_model'])
+            backup = {'key': f'{backup_name}/{backup_version or ""}', 'display': backup_display_name,
+                      **ChatService._model_slot(chat['id'], backup_name, backup_version)}
+            stages['backup'] = executor.submit(ChatService._run_timed, ChatService._build_model_driver,
+                                               backup_name, backup_version, stream)
+        return {
+            'started_at': time.perf_counter(),
+            'message_text': message_text,
+            'model_key': f'{model_name}/{version_name or ""}',
+            'routing': routing,
+            'backup': backup,
+            'stages': stages
+        }
+
+    @staticmethod
+    def start_fanout_preparation(chat, message_text, rag_config, targets):
+        """
+        多模型对比的准备阶段：RAG检索和对话历史只做一次，各模型的驱动并行构造
+        
+        返回:
+            准备任务，交给collect_message_preparation取回结果（驱动在结果的drivers中）
+        """
+        executor = ChatService._get_prepare_executor()
+        stages = {
+            'history': executor.submit(ChatService._run_timed, ChatService.get_chat_context, chat['id'])
+        }
+        if rag_config.get('enabled', False):
+            stages['rag'] = executor.submit(ChatService._run_timed, ChatService.get_rag_enhanced_prompt,
+                                            message_text, rag_config)
+        for target in targets:
+            stages[f"driver:{target['model']}"] = executor.submit(
+                ChatService._run_timed, ChatService._build_model_driver, target['name'], target['version'], True)
+        return {
+            'started_at': time.perf_counter(),
+            'message_text': message_text,
+            'stages': stages
+        }
+
+    @staticmethod
+    def collect_message_preparation(preparation):
+        """
+        等待所有准备阶段完成并组装结果
+        
+        返回:
+            包含messages、driver、backup、error、error_code和timings的字典；
+            backup为备用模型 {key, display, driver}，未设置或构造失败时为None；
+            timings中各阶段耗时为 <阶段>_ms，prepare_ms为实际等待的总耗时
+        """
+        results = {}
+        timings = {}
+        for name, future in preparation['stages'].items():
+            result, error, elapsed = future.result()
+            results[name] = (result, error)
+            timings[f'{name}_ms'] = elapsed
+        timings['prepare_ms'] = round((time.perf_counter() - preparation['started_at']) * 1000, 1)
+        stage_list = '，'.join(f"{name}={timings[f'{name}_ms']}ms" for name in preparation['stages'])
+        print(f"⏱️ 消息准备耗时 {timings['prepare_ms']}ms（{stage_list}）")
+        
+        enhanced_question, rag_error = results.get('rag', (preparation['message_text'], None))
+        if rag_error:
+            print(f"RAG调用失败: {str(rag_error)}")
+            enhanced_question = preparation['message_text']
+        
+        context_messages, history_error = results['history']
+        if history_error:
+            raise history_error
+        
+        prepared = {
+            'messages': ChatService._build_model_messages(context_messages, enhanced_question),
+            'driver': None,
+            'backup': None,
+            'error': None,
+            'error_code': None,
+            'timings': timings
+        }
+        if 'driver' in results:
+            driver_result, driver_error = results['driver']
+            if driver_error:
+                print(f'构造模型驱动失败: {str(driver_error)}')
+                prepared['error'], prepared['error_code'] = {'error': f'调用模型失败: {str(driver_error)}'}, 500
+            else:
+                prepared['driver'], prepared['error'], prepared['error_code'] = driver_result
+        
+        # 多模型对比：各模型的驱动阶段名为 driver:<模型>，结果为 {模型: (driver, 错误信息)}
+        fanout_drivers = {name[len('driver:'):]: result for name, result in results.items()
+                          if name.startswith('driver:')}
+        if fanout_drivers:
+            prepared['drivers'] = {}
+            for model, (driver_result, driver_error) in fanout_drivers.items():
+                if driver_error:
+                    prepared['drivers'][model] = (None, f'调用模型失败: {str(driver_error)}')
+                else:
+                    driver, error_response, _ = driver_result
+                    prepared['drivers'][model] = (driver, error_response['error'] if error_response else None)
+        
+        if 'backup' in results:
+            backup_result, backup_error = results['backup']
+            if backup_error or backup_result[1]:
+                # 备用模型不可用时只调用主模型
+                print(f"⚠️ 备用模型 {preparation['backup']['key']} 不可用: "
+                      f"{backup_error or backup_result[1].get('error')}")
+            else:
+                prepared['backup'] = dict(preparation['backup'], driver=backup_result[0])
+        return prepared
+    
+    @staticmethod
+    def _register_generation(chat_id):
+        """登记一次流式生成，AI消息ID提前确定并随第一个增量发给前端"""
+        generation = {
+            'chat_id': chat_id,
+            'message_id': str(uuid.uuid4()),
+            'cancelled': threading.Event(),
+            'driver': None
+        }
+        with ChatService._active_generations_lock:
+            ChatService._active_generations[generation['message_id']] = generation
+        return generation
+
+    @staticmethod
+    def _unregister_generation(generation):
+        with ChatService._active_generations_lock:
+            ChatService._active_generations.pop(generation['message_id'], None)
+
+    @staticmethod
+    def cancel_generation(chat_id, message_id):
+        """
+        显式停止进行中的流式生成：设置取消标记并关闭上游连接，
+        生成线程随即结束并保存已生成的部分回复（标记为truncated）
+        
+        返回: 是否找到进行中的生成
+        """
+        with ChatService._active_generations_lock:
+            generation = ChatService._active_generations.get(message_id)
+        if not generation or generation['chat_id'] != chat_id:
+            return False
+        generation['cancelled'].set()
+        if generation['driver'] is not None:
+            generation['driver'].cancel()
+        print(f"⏹️ 已取消对话 {chat_id} 的生成 {message_id}")
+        return True
+
+    @staticmethod
+    def _close_stream(stream, generation):
+        """停止上游调用：驱动关闭连接，生成器关闭后释放其中的请求上下文"""
+        if generation['driver'] is not None:
+            generation['driver'].cancel()
+        if stream is not None and hasattr(stream, 'close'):
+            try:
+                stream.close()
+            except Exception as e:
+                print(f"关闭模型流失败: {e}")
+
+    @staticmethod
+    def _route_driver(prepared, route):
+        """实际回复的模型驱动（备用模型胜出时为备用模型的驱动）"""
+        if route and route['backup']:
+            return prepared['backup']['driver']
+        return prepared['driver']
+
+    @staticmethod
+    def acquire_model_slot(preparation, prepared, block=True):
+        """
+        等待调度器放行本次模型调用（按供应商/版本的并发数和token速率排队），
+        排队耗时记录为timings中的queue_ms
+        
+        block为False时不排队，没有空闲名额立即返回False
+        
+        返回:
+            是否已放行
+        """
+        from app.services.tokenizer_service import TokenizerService
+        
+        ticket = preparation.get('ticket')
+        if ticket is None:
+            return True
+        # 历史消息的token数随消息缓存，只有当前问题和系统提示词需要分词（系统提示词的计数在内存缓存中）
+        prompt_tokens = TokenizerService.count_messages(prepared['messages'], ticket.vendor, ticket.version)
+        prepared['timings']['prompt_tokens'] = prompt_tokens
+        scheduler = RequestScheduler.get_instance()
+        if not block:
+            return scheduler.try_acquire(ticket, prompt_tokens)
+        scheduler.acquire(ticket, prompt_tokens)
+        prepared['timings']['queue_ms'] = ticket.wait_ms
+        if ticket.wait_ms >= 100:
+            print(f"⏳ 模型请求 {ticket.version_key} 排队 {ticket.wait_ms}ms")
+        return True
+
+    @staticmethod
+    def release_model_slot(preparation, reply=''):
+        """结束模型调用，归还并发名额并按回复的token数扣减token额度"""
+        from app.services.tokenizer_service import TokenizerService
+        
+        ticket = preparation.get('ticket')
+        completion_tokens = TokenizerService.count(reply or '', ticket.vendor, ticket.version) if ticket else 0
+        RequestScheduler.get_instance().release(ticket, completion_tokens)
+    
+    @staticmethod
+    def _model_slot(chat_id, vendor, version):
+        """
+        按需申请的调度名额（备用模型用）：发出对冲或切换请求前才登记排队，调用结束后归还
+        
+        返回:
+            {'acquire': acquire(messages, block) -> 是否已放行, 'release': release(reply)}
+        """
+        slot = {'ticket': None, 'timings': {}}
+
+        def acquire(messages, block=True):
+            try:
+                slot['ticket'] = RequestScheduler.get_instance().submit(chat_id, vendor, version)
+            except QueueFullError:
+                if block:
+                    raise
+                return False
+            return ChatService.acquire_model_slot(slot, {'messages': messages, 'timings': slot['timings']}, block)
+
+        def release(reply=''):
+            ChatService.release_model_slot(slot, reply)
+
+        return {'acquire': acquire, 'release': release}
     
     @staticmethod
     def chat_with_model_stream(model_name, messages, parsed_version_name, temperature=0.7):
@@ -516,62 +945,113 @@ class ChatService(BaseService):
 
     @staticmethod
     def handle_streaming_response(chat, message_text, user_message, now,
-                                 enhanced_question, parsed_model_name, parsed_version_name, model_params, model_display_name):
+                                 preparation, model_params, model_display_name):
         """处理流式响应"""
         def generate():
+            full_reply = ""
+            stream = None
+            route = None
+            saved = False
+            # AI消息ID提前确定，随第一个增量发给前端，前端据此显式取消
+            generation = ChatService._register_generation(chat['id'])
             try:
-                # 准备消息格式
-                messages = ChatService._prepare_messages_for_model(chat['id'], enhanced_question)
+                # 等待并行的准备阶段完成，得到消息和模型驱动
+                prepared = ChatService.collect_message_preparation(preparation)
+                if prepared['error']:
+                    yield f'data: {json.dumps(prepared["error"], ensure_ascii=False)}\n\n'
+                    return
+                messages = prepared['messages']
+                timings = prepared['timings']
+                generation['driver'] = prepared['driver']
                 
                 # 获取temperature参数
                 temperature = model_params.get('temperature', 0.7)
                 
-                # 初始化完整回复
-                full_reply = ""
+                # 等待调度器放行（供应商/版本的并发和速率限制）
+                ChatService.acquire_model_slot(preparation, prepared)
                 
-                # 使用流式模型回复函数获取响应，传入parsed_version_name
-                for chunk in ChatService.chat_with_model_stream(parsed_model_name, messages, parsed_version_name, temperature):
-                    # 检查是否是错误消息格式
-                    if isinstance(chunk, str) and chunk.startswith('data: {"error"'):
-                        yield chunk
-                        continue
+                if not generation['cancelled'].is_set():
+                    try:
+                        # 使用已构造的驱动获取流式响应，对话设置了备用模型时按路由策略对冲或切换
+                        primary = {'key': preparation['model_key'], 'display': model_display_name,
+                                   'driver': prepared['driver']}
+                        stream, generation['driver'], route = ModelRouter.stream(
+                            primary, prepared['backup'], preparation['routing'], messages, temperature,
+                            model_params.get('cache'))
+                    except Exception as e:
+                        print(f'调用模型失败: {str(e)}')
+                        yield f'data: {json.dumps({"error": str(e)}, ensure_ascii=False)}\n\n'
+                        return
                     
-                    # 尝试解析chunk数据
                     try:
-                        # 如果chunk已经是格式化的字符串，直接处理
-                        if isinstance(chunk, str) and chunk.startswith('data: '):
-                            chunk_str = chunk[6:].strip()
-                            chunk_data = json.loads(chunk_str)
+                        for chunk in stream:
+                            # 显式取消后不再读取上游
+                            if generation['cancelled'].is_set():
+                                break
+                            if 'first_token_ms' not in timings:
+                                timings['first_token_ms'] = round((time.perf_counter() - preparation['started_at']) * 1000, 1)
                             
-                            if 'chunk' in chunk_data:
-                                actual_chunk = chunk_data['chunk']
-                                full_reply += actual_chunk
-                                yield chunk  # 直接传递格式化的chunk
-                            elif 'error' in chunk_data:
-                                yield chunk  # 直接传递错误信息
-                        else:
-                            # 假设chunk是直接的内容块
-                            full_reply += chunk
-                            response_data = {
-                                'chunk': chunk,
-                                'done': False
-                            }
-                            yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
-                    except Exception as e:
-                        print(f"处理流式响应块失败: {e}")
-                        # 尝试作为直接内容处理
-                        full_reply += str(chunk)
-                        response_data = {
-                            'chunk': str(chunk),
-                            'done': False
-                        }
-                        yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+                            # 检查是否是错误消息格式
+                            if isinstance(chunk, str) and chunk.startswith('data: {"error"'):
+                                yield chunk
+                                continue
+                            
+                            # 尝试解析chunk数据
+                            try:
+                                # 如果chunk已经是格式化的字符串，直接处理
+                                if isinstance(chunk, str) and chunk.startswith('data: '):
+                                    chunk_str = chunk[6:].strip()
+                                    chunk_data = json.loads(chunk_str)
+                                    
+                                    if 'chunk' in chunk_data:
+                                        actual_chunk = chunk_data['chunk']
+                                        if not full_reply:
+                                            # 第一个增量附带AI消息ID
+                                            chunk_data['message_id'] = generation['message_id']
+                                            chunk = f'data: {json.dumps(chunk_data, ensure_ascii=False)}\n\n'
+                                        full_reply += actual_chunk
+                                        yield chunk  # 直接传递格式化的chunk
+                                    elif 'error' in chunk_data:
+                                        yield chunk  # 直接传递错误信息
+                                else:
+                                    # 假设chunk是直接的内容块
+                                    response_data = {
+                                        'chunk': chunk,
+                                        'done': False
+                                    }
+                                    if not full_reply:
+                                        response_data['message_id'] = generation['message_id']
+                                    full_reply += chunk
+                                    yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+                            except Exception as e:
+                                print(f"处理流式响应块失败: {e}")
+                                # 尝试作为直接内容处理
+                                full_reply += str(chunk)
+                                response_data = {
+                                    'chunk': str(chunk),
+                                    'done': False
+                                }
+                                yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+                    except Exception:
+                        # 显式取消时上游连接被关闭，读取中断属于预期
+                        if not generation['cancelled'].is_set():
+                            raise
                 
-                # 创建AI回复，确保包含完整的模型和版本信息
-                ai_message = ChatService.create_ai_message(now, full_reply, model_display_name)
+                truncated = generation['cancelled'].is_set()
+                if truncated:
+                    ChatService._close_stream(stream, generation)
+                if route is not None and ChatService._route_driver(prepared, route).last_cache_hit:
+                    # 回复来自回复缓存，没有调用模型
+                    timings['cache_hit'] = True
+                
+                # 创建AI回复，确保包含完整的模型和版本信息（备用模型胜出时记录实际回复的模型）
+                ai_message = ChatService.create_ai_message(now, full_reply,
+                                                           route['model'] if route else model_display_name,
+                                                           generation['message_id'], truncated)
                 
                 # 更新对话并保存
                 ChatService.update_chat_and_save(chat, message_text, user_message, ai_message, now)
+                saved = True
                 
                 # 发送最终完成信号
                 final_data = {
@@ -579,39 +1059,64 @@ class ChatService(BaseService):
                     'done': True,
                     'chat': chat,
                     'user_message': user_message,
-                    'ai_message': ai_message
+                    'ai_message': ai_message,
+                    'timings': timings
                 }
+                if prepared['backup'] is not None and route is not None:
+                    final_data['route'] = route
+                driver = ChatService._route_driver(prepared, route)
+                if getattr(driver, 'last_metrics', None):
+                    # 模型服务自身报告的耗时（如Ollama的加载、预填充和生成耗时）
+                    final_data['model_metrics'] = driver.last_metrics
                 yield f'data: {json.dumps(final_data, ensure_ascii=False)}\n\n'
+            except GeneratorExit:
+                # 客户端断开连接：立即关闭上游请求，不再消耗模型token和本地算力
+                if stream is not None and not saved:
+                    print(f"⏹️ 客户端已断开，停止对话 {chat['id']} 的生成（已生成 {len(full_reply)} 字）")
+                    ChatService._close_stream(stream, generation)
+                    # 保存已生成的部分回复并标记为truncated
+                    ai_message = ChatService.create_ai_message(now, full_reply,
+                                                               route['model'] if route else model_display_name,
+                                                               generation['message_id'], True)
+                    ChatService.update_chat_and_save(chat, message_text, user_message, ai_message, now)
             except Exception as e:
                 # 捕获所有异常并返回错误信息
                 print(f'流式处理失败: {str(e)}')
                 response_data = {'error': str(e)}
                 yield f'data: {json.dumps(response_data, ensure_ascii=False)}\n\n'
+            finally:
+                ChatService._unregister_generation(generation)
+                ChatService.release_model_slot(preparation, full_reply)
         
         return generate
 
     @staticmethod
     def handle_regular_response(chat, message_text, user_message, now,
-                              enhanced_question, parsed_model_name, parsed_version_name, model_params, model_display_name):
+                              preparation, model_params, model_display_name):
         """处理普通响应"""
+        ai_reply = ''
         try:
-            # 使用通用验证函数验证模型
-            model, error_response, error_code = ChatService.validate_model(parsed_model_name)
-            if error_response:
-                return error_response, error_code
-
-            # 准备消息格式
-            messages = ChatService._prepare_messages_for_model(chat['id'], enhanced_question)
+            # 等待并行的准备阶段完成，得到消息和模型驱动
+            prepared = ChatService.collect_message_preparation(preparation)
+            if prepared['error']:
+                return prepared['error'], prepared['error_code']
             
             # 获取temperature参数
             temperature = model_params.get('temperature', 0.7)
-            
-            # 获取版本配置
-            version_id = parsed_version_name
-            version_config = ChatService.get_version_config(model, version_id)
 
-            # 使用模型管理器调用模型
-            response = ModelManager.chat(parsed_model_name, model, version_config, messages, temperature)
+            # 等待调度器放行（供应商/版本的并发和速率限制）
+            ChatService.acquire_model_slot(preparation, prepared)
+
+            # 使用已构造的驱动调用模型，对话设置了备用模型时按路由策略对冲或切换
+            model_start = time.perf_counter()
+            primary = {'key': preparation['model_key'], 'display': model_display_name, 'driver': prepared['driver']}
+            response, route = ModelRouter.chat(primary, prepared['backup'], preparation['routing'],
+                                               prepared['messages'], temperature, model_params.get('cache'))
+            timings = prepared['timings']
+            timings['model_ms'] = round((time.perf_counter() - model_start) * 1000, 1)
+            if ChatService._route_driver(prepared, route).last_cache_hit:
+                # 回复来自回复缓存，没有调用模型
+                timings['cache_hit'] = True
             
             # 获取模型回复内容
             ai_reply = response['content']
@@ -619,19 +1124,218 @@ class ChatService(BaseService):
             # 捕获所有异常并返回错误信息
             print(f'调用模型失败: {str(e)}')
             return {'error': f'调用模型失败: {str(e)}'}, 500
+        finally:
+            ChatService.release_model_slot(preparation, ai_reply)
         
-        # 创建AI回复，确保包含完整的模型和版本信息
-        ai_message = ChatService.create_ai_message(now, ai_reply, model_display_name)
+        # 创建AI回复，确保包含完整的模型和版本信息（备用模型胜出时记录实际回复的模型）
+        ai_message = ChatService.create_ai_message(now, ai_reply, route['model'])
         
         # 更新对话并保存
         ChatService.update_chat_and_save(chat, message_text, user_message, ai_message, now)
         
-        return {
+        result = {
             'success': True,
             'chat': chat,
             'user_message': user_message,
-            'ai_message': ai_message
-        }, 201
+            'ai_message': ai_message,
+            'timings': timings
+        }
+        if prepared['backup'] is not None:
+            result['route'] = route
+        driver = ChatService._route_driver(prepared, route)
+        if getattr(driver, 'last_metrics', None):
+            # 模型服务自身报告的耗时（如Ollama的加载、预填充和生成耗时）
+            result['model_metrics'] = driver.last_metrics
+        return result, 201
+
+    @staticmethod
+    def _run_fanout_target(target, prepared, temperature, use_cache, events):
+        """
+        多模型对比中单个模型的调用（在独立线程中运行）：排队放行后读取流式响应，
+        增量放入events队列，事件为 (target, 'chunk' / 'end' / 'error', 内容)
+        """
+        generation = target['generation']
+        stream = None
+        try:
+            ChatService.acquire_model_slot(target, {'messages': prepared['messages'], 'timings': target['timings']})
+            if generation['cancelled'].is_set():
+                events.put((target, 'end', None))
+                return
+            model_start = time.perf_counter()
+            primary = {'key': target['key'], 'display': target['display'], 'driver': target['driver']}
+            stream, generation['driver'], _ = ModelRouter.stream(primary, None, {}, prepared['messages'],
+                                                                 temperature, use_cache)
+            for chunk in stream:
+                if generation['cancelled'].is_set():
+                    break
+                content = chunk
+                if isinstance(chunk, str) and chunk.startswith('data: '):
+                    chunk_data = json.loads(chunk[6:].strip())
+                    if 'error' in chunk_data:
+                        raise Exception(chunk_data['error'])
+                    content = chunk_data.get('chunk')
+                if not content:
+                    continue
+                if not target['reply']:
+                    target['timings']['first_token_ms'] = round((time.perf_counter() - model_start) * 1000, 1)
+                target['reply'] += content
+                events.put((target, 'chunk', content))
+            target['timings']['model_ms'] = round((time.perf_counter() - model_start) * 1000, 1)
+            if target['driver'].last_cache_hit:
+                target['timings']['cache_hit'] = True
+            events.put((target, 'end', None))
+        except Exception as e:
+            if generation['cancelled'].is_set():
+                events.put((target, 'end', None))
+            else:
+                print(f"调用模型 {target['model']} 失败: {str(e)}")
+                events.put((target, 'error', str(e)))
+        finally:
+            if stream is not None:
+                stream.close()
+            ChatService.release_model_slot(target, target['reply'])
+
+    @staticmethod
+    def handle_fanout_response(chat, message_text, user_message, now, preparation, targets, model_params):
+        """
+        多模型对比的流式响应：各模型并发调用，增量交错写入同一个SSE连接，每个事件带model字段；
+        每个模型结束时立即保存其回复，总耗时等于最慢的模型
+        """
+        def generate():
+            events = queue.Queue()
+            started = []
+            finished = set()
+            for target in targets:
+                target['generation'] = ChatService._register_generation(chat['id'])
+            try:
+                # 第一个事件告知前端各模型对应的AI消息ID（可按消息ID单独停止某个模型）
+                yield 'data: ' + json.dumps({'fanout': [
+                    {'model': target['model'], 'display': target['display'],
+                     'message_id': target['generation']['message_id']} for target in targets
+                ]}, ensure_ascii=False) + '\n\n'
+                
+                prepared = ChatService.collect_message_preparation(preparation)
+                timings = prepared['timings']
+                temperature = model_params.get('temperature', 0.7)
+                for target in targets:
+                    target['driver'], error = prepared['drivers'][target['model']]
+                    if error:
+                        events.put((target, 'error', error))
+                        continue
+                    target['generation']['driver'] = target['driver']
+                    threading.Thread(target=ChatService._run_fanout_target,
+                                     args=(target, prepared, temperature, model_params.get('cache'), events),
+                                     name='chat-fanout', daemon=True).start()
+                    started.append(target)
+                
+                ai_messages = []
+                while len(finished) < len(targets):
+                    target, kind, payload = events.get()
+                    if kind == 'chunk':
+                        yield f"data: {json.dumps({'model': target['model'], 'chunk': payload}, ensure_ascii=False)}\n\n"
+                        continue
+                    finished.add(target['model'])
+                    if kind == 'error':
+                        error_data = {'model': target['model'], 'error': payload}
+                        yield f'data: {json.dumps(error_data, ensure_ascii=False)}\n\n'
+                        continue
+                    # 该模型生成结束，立即保存回复
+                    truncated = target['generation']['cancelled'].is_set()
+                    ai_message = ChatService.create_ai_message(now, target['reply'], target['display'],
+                                                               target['generation']['message_id'], truncated)
+                    ChatService.update_chat_and_save(chat, message_text, user_message, ai_message, now)
+                    target['saved'] = True
+                    ai_messages.append(ai_message)
+                    done_data = {'model': target['model'], 'model_done': True, 'ai_message': ai_message,
+                                 'timings': target['timings']}
+                    yield f'data: {json.dumps(done_data, ensure_ascii=False)}\n\n'
+                
+                timings['models'] = {target['model']: target['timings'] for target in targets}
+                final_data = {
+                    'done': True,
+                    'chat': chat,
+                    'user_message': user_message,
+                    'ai_messages': ai_messages,
+                    'timings': timings
+                }
+                yield f'data: {json.dumps(final_data, ensure_ascii=False)}\n\n'
+            except GeneratorExit:
+                # 客户端断开连接：停止所有模型，保存已生成的部分回复并标记为truncated
+                print(f"⏹️ 客户端已断开，停止对话 {chat['id']} 的多模型生成")
+                for target in started:
+                    if target.get('saved'):
+                        continue
+                    target['generation']['cancelled'].set()
+                    target['generation']['driver'].cancel()
+                    ai_message = ChatService.create_ai_message(now, target['reply'], target['display'],
+                                                               target['generation']['message_id'], True)
+                    ChatService.update_chat_and_save(chat, message_text, user_message, ai_message, now)
+            except Exception as e:
+                print(f'多模型流式处理失败: {str(e)}')
+                yield f'data: {json.dumps({"error": str(e)}, ensure_ascii=False)}\n\n'
+            finally:
+                for target in targets:
+                    ChatService._unregister_generation(target['generation'])
+                    if target not in started:
+                        ChatService.release_model_slot(target)
+        
+        return generate
+
+    @staticmethod
+    def send_fanout_message(chat_id, data):
+        """同一条消息同时发给多个模型版本对比（只检索和组装上下文一次）
+        
+        参数:
+            chat_id: 对话ID
+            data: 请求数据，models为模型列表（格式同send_message的model），其余字段同send_message
+        """
+        message_text = data.get('message')
+        models = data.get('models') or []
+        model_params = data.get('modelParams', {})
+        rag_config = data.get('ragConfig', {})
+        
+        chat = ChatService.get_chat(chat_id)
+        if not chat:
+            return {'error': '对话不存在'}, 404
+        if not message_text:
+            return {'error': '消息不能为空'}, 400
+        if not isinstance(models, list) or not models:
+            return {'error': '请指定要对比的模型列表'}, 400
+        models = list(dict.fromkeys(models))
+        max_models = config_manager.get('chat.fanout_max_models', 4)
+        if len(models) > max_models:
+            return {'error': f'一次最多对比 {max_models} 个模型'}, 400
+        
+        # 每个模型在调度器中单独登记，任一模型排队已满时整体拒绝
+        scheduler = RequestScheduler.get_instance()
+        targets = []
+        for model in models:
+            name, version, display = ChatService.parse_model_info(model)
+            if not name:
+                return {'error': '请指定模型'}, 400
+            targets.append({'model': model, 'name': name, 'version': version, 'display': display,
+                            'key': f'{name}/{version or ""}', 'reply': '', 'timings': {}})
+        try:
+            for target in targets:
+                target['ticket'] = scheduler.submit(chat_id, target['name'], target['version'])
+        except QueueFullError as e:
+            for target in targets:
+                scheduler.release(target.get('ticket'))
+            print(f"🚫 {e}")
+            return {'error': str(e), 'retry_after': e.retry_after}, 429
+        
+        now = datetime.now().isoformat()
+        user_message = {
+            'id': str(uuid.uuid4()),
+            'role': 'user',
+            'content': message_text,
+            'createdAt': now
+        }
+        chat['messages'].append(user_message)
+        
+        preparation = ChatService.start_fanout_preparation(chat, message_text, rag_config, targets)
+        return ChatService.handle_fanout_response(chat, message_text, user_message, now,
+                                                  preparation, targets, model_params)
 
     @staticmethod
     def send_message(chat_id, data):
@@ -655,6 +1359,20 @@ class ChatService(BaseService):
         
         now = datetime.now().isoformat()
         
+        # 使用辅助函数解析模型信息
+        parsed_model_name, parsed_version_name, model_display_name = ChatService.parse_model_info(model_name)
+        
+        # 如果没有传递模型，返回错误
+        if not parsed_model_name:
+            return {'error': '请指定模型'}, 400
+        
+        # 在调度器中登记本次模型调用，排队已满时直接拒绝（不写入用户消息）
+        try:
+            ticket = RequestScheduler.get_instance().submit(chat_id, parsed_model_name, parsed_version_name)
+        except QueueFullError as e:
+            print(f"🚫 {e}")
+            return {'error': str(e), 'retry_after': e.retry_after}, 429
+        
         # 创建用户消息
         user_message = {
             'id': str(uuid.uuid4()),
@@ -664,27 +1382,22 @@ class ChatService(BaseService):
         }
         chat['messages'].append(user_message)
         
-        # 使用辅助函数解析模型信息
-        # parsed_version_name 目前未直接使用，但为了代码清晰和未来扩展性保留接收
-        parsed_model_name, parsed_version_name, model_display_name = ChatService.parse_model_info(model_name)
-        
-        # 如果没有传递模型，返回错误
-        if not parsed_model_name:
-            return {'error': '请指定模型'}, 400
-        
-        # 调用RAG系统构造增强提示，考虑前端传递的ragConfig配置
-        enhanced_question = ChatService.get_rag_enhanced_prompt(message_text, rag_config) if rag_config.get('enabled', False) else message_text
+        # 并行执行RAG检索、历史组装和模型驱动构造，调度器排队与准备阶段同时进行
+        preparation = ChatService.start_message_preparation(
+            chat, message_text, rag_config, parsed_model_name, parsed_version_name, stream
+        )
+        preparation['ticket'] = ticket
         
         # 根据stream参数决定是返回普通响应还是流式响应
         if stream:
             # 流式响应处理
             return ChatService.handle_streaming_response(
                 chat, message_text, user_message, now,
-                enhanced_question, parsed_model_name, parsed_version_name, model_params, model_display_name
+                preparation, model_params, model_display_name
             )
         else:
             # 普通响应处理
             return ChatService.handle_regular_response(
                 chat, message_text, user_message, now,
-                enhanced_question, parsed_model_name, parsed_version_name, model_params, model_display_name
-            )
\ No newline at end of file
+                preparation, model_params, model_display_name
+            )
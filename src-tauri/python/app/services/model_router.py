@@ -0,0 +1,467 @@
+"""模型路由模块 - 按模型版本统计延迟，主模型迟迟没有响应时向备用模型发出对冲请求，失败时自动切换到备用模型"""
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional
+
+from app.core.config import config_manager
+from app.models.model_manager import ModelManager
+
+
+class LatencyStats:
+    """各模型版本最近的调用延迟（单例）
+
+    - first_token: 流式调用发出请求到收到第一个增量的耗时
+    - total: 发出请求到回复结束的耗时
+    键与调度器一致，为 "供应商/版本"。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Dict[str, deque]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def get_instance(cls) -> 'LatencyStats':
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _entry(self, key: str) -> Dict[str, deque]:
+        entry = self._samples.get(key)
+        if entry is None:
+            size = config_manager.get('routing.history_size', 200)
+            entry = self._samples[key] = {'first_token': deque(maxlen=size), 'total': deque(maxlen=size)}
+            self._counts[key] = {'requests': 0, 'errors': 0, 'hedged': 0, 'hedge_wins': 0, 'fallbacks': 0}
+        return entry
+
+    def record(self, key: str, kind: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self._entry(key)[kind].append(round(elapsed_ms, 1))
+            if kind == 'total':
+                self._counts[key]['requests'] += 1
+
+    def count(self, key: str, name: str) -> None:
+        """累计 errors / hedged / hedge_wins / fallbacks 次数"""
+        with self._lock:
+            self._entry(key)
+            self._counts[key][name] += 1
+
+    @staticmethod
+    def _percentile(values, percentile: float) -> float:
+        ordered = sorted(values)
+        index = max(0, math.ceil(len(ordered) * percentile / 100) - 1)
+        return ordered[index]
+
+    def percentile(self, key: str, kind: str, percentile: float) -> Optional[float]:
+        """返回最近样本的百分位延迟（毫秒），样本数不足 routing.min_samples 时返回None"""
+        with self._lock:
+            values = list(self._samples.get(key, {}).get(kind, ()))
+        if not values or len(values) < config_manager.get('routing.min_samples', 20):
+            return None
+        return self._percentile(values, percentile)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各版本的样本数、p50/p95延迟和对冲、切换次数"""
+        with self._lock:
+            result = {}
+            for key, entry in self._samples.items():
+                stats = dict(self._counts[key])
+                for kind, values in entry.items():
+                    stats[kind] = {
+                        'samples': len(values),
+                        'p50_ms': self._percentile(values, 50) if values else None,
+                        'p95_ms': self._percentile(values, 95) if values else None
+                    }
+                result[key] = stats
+            return result
+
+
+class ModelRouter:
+    """按对话的路由策略调用模型
+
+    路由策略（保存在对话的routing字段）：
+    - backup_model: 备用模型，格式与发送消息时的model相同（如 "Deepseek-deepseek-chat"）
+    - hedge: 主模型在对冲期限内没有首个token（非流式为没有返回）时，同时向备用模型发出请求，
+      采用先响应的一方并取消另一方，默认开启
+    - fallback: 主模型调用失败时自动改用备用模型，默认开启
+    - hedge_percentile: 对冲期限取主模型最近延迟的该百分位，默认 routing.hedge_percentile
+
+    调用双方用字典描述：{'key': "供应商/版本", 'display': 模型显示名称, 'driver': 驱动实例}。
+    备用模型可以附带调度名额的申请和归还函数 'acquire'(messages, block) -> 是否放行、'release'(reply)：
+    对冲前不排队申请，没有空闲名额时跳过对冲；失败切换前排队等待；备用模型的调用结束后归还。
+    返回的route记录实际回复的模型：{'model', 'backup', 'hedged', 'fallback'}。
+    """
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def normalize_policy(policy) -> Optional[Dict[str, Any]]:
+        """校验并补全路由策略，空策略返回None（表示不使用备用模型），不合法时抛出ValueError"""
+        if not policy:
+            return None
+        if not isinstance(policy, dict):
+            raise ValueError('路由策略必须是对象')
+        backup_model = policy.get('backup_model')
+        if not backup_model or not isinstance(backup_model, str):
+            raise ValueError('请指定备用模型 backup_model')
+        normalized = {
+            'backup_model': backup_model,
+            'hedge': bool(policy.get('hedge', True)),
+            'fallback': bool(policy.get('fallback', True))
+        }
+        if policy.get('hedge_percentile') is not None:
+            try:
+                percentile = float(policy['hedge_percentile'])
+            except (TypeError, ValueError):
+                raise ValueError('hedge_percentile必须是数字')
+            if not 50 <= percentile < 100:
+                raise ValueError('hedge_percentile必须在50到100之间')
+            normalized['hedge_percentile'] = percentile
+        return normalized
+
+    @staticmethod
+    def hedge_delay(key: str, kind: str, policy: Dict[str, Any]) -> float:
+        """对冲期限（秒）：主模型最近延迟的百分位，样本不足时使用默认值"""
+        percentile = policy.get('hedge_percentile') or config_manager.get('routing.hedge_percentile', 95)
+        delay_ms = LatencyStats.get_instance().percentile(key, kind, percentile)
+        if delay_ms is None:
+            delay_ms = config_manager.get('routing.default_hedge_ms', 5000)
+        return max(delay_ms, config_manager.get('routing.min_hedge_ms', 300)) / 1000
+
+    @staticmethod
+    def _get_executor():
+        if ModelRouter._executor is None:
+            with ModelRouter._executor_lock:
+                if ModelRouter._executor is None:
+                    ModelRouter._executor = ThreadPoolExecutor(
+                        max_workers=max(2, int(config_manager.get('routing.max_workers', 8))),
+                        thread_name_prefix='model-route')
+        return ModelRouter._executor
+
+    @staticmethod
+    def _route(candidate, backup=False) -> Dict[str, Any]:
+        return {'model': candidate['display'], 'backup': backup, 'hedged': False, 'fallback': False}
+
+    @staticmethod
+    def _acquire_backup(backup, messages, reason) -> bool:
+        """向备用模型发出请求前申请调度名额：对冲（hedged）时不排队，切换（fallback）时排队等待"""
+        acquire = backup.get('acquire')
+        if acquire is None:
+            return True
+        try:
+            if acquire(messages, reason == 'fallback'):
+                return True
+            print(f"⏳ 备用模型 {backup['key']} 没有空闲的调度名额，跳过对冲请求")
+        except Exception as e:
+            print(f"⚠️ 备用模型 {backup['key']} 排队失败: {e}")
+        return False
+
+    @staticmethod
+    def _release(candidate, reply=''):
+        """归还调用方的调度名额（附带了release时）"""
+        release = candidate.get('release')
+        if release is not None:
+            release(reply)
+
+    @staticmethod
+    def _record(candidate, kind, elapsed_ms):
+        """记录一次调用延迟，直接使用回复缓存的调用不计入"""
+        if not getattr(candidate['driver'], 'last_cache_hit', False):
+            LatencyStats.get_instance().record(candidate['key'], kind, elapsed_ms)
+
+    @staticmethod
+    def _timed_chat(candidate, messages, temperature, use_cache=None):
+        """非流式调用一个模型并记录总耗时，失败时计入错误次数（被取消的调用除外）"""
+        start = time.perf_counter()
+        response = None
+        try:
+            response = ModelManager.chat_with_driver(candidate['driver'], messages, temperature,
+                                                     use_cache=use_cache)
+        except Exception:
+            if not getattr(candidate['driver'], '_cancelled', False):
+                LatencyStats.get_instance().count(candidate['key'], 'errors')
+            raise
+        finally:
+            ModelRouter._release(candidate, (response or {}).get('content') or '')
+        if not getattr(candidate['driver'], '_cancelled', False):
+            ModelRouter._record(candidate, 'total', (time.perf_counter() - start) * 1000)
+        return response
+
+    @staticmethod
+    def chat(primary, backup, policy, messages, temperature, use_cache=None):
+        """
+        非流式调用：没有备用模型时直接调用主模型；否则按策略对冲或在失败时切换
+        use_cache含义同 ModelManager.chat_with_driver
+
+        返回: (模型回复, route)
+        """
+        route = ModelRouter._route(primary)
+        if backup is None:
+            return ModelRouter._timed_chat(primary, messages, temperature, use_cache), route
+
+        stats = LatencyStats.get_instance()
+        executor = ModelRouter._get_executor()
+        futures = {}  # future -> (调用方, 开始时间)
+
+        def start(candidate):
+            future = executor.submit(ModelRouter._timed_chat, candidate, messages, temperature, use_cache)
+            futures[future] = (candidate, time.perf_counter())
+
+        start(primary)
+        delay = ModelRouter.hedge_delay(primary['key'], 'total', policy) if policy.get('hedge', True) else None
+        backup_started = False
+        error = None
+        while futures:
+            done, _ = wait(list(futures), timeout=None if backup_started else delay,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                # 超过对冲期限仍未返回，同时向备用模型发出请求；备用模型没有空闲名额时只等待主模型
+                print(f"🔀 {primary['key']} 超过 {delay * 1000:.0f}ms 未返回，向备用模型 {backup['key']} 发出对冲请求")
+                if not ModelRouter._acquire_backup(backup, messages, 'hedged'):
+                    delay = None
+                    continue
+                route['hedged'] = backup_started = True
+                stats.count(primary['key'], 'hedged')
+                start(backup)
+                continue
+            for future in done:
+                candidate, _ = futures.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(f"⚠️ 模型 {candidate['key']} 调用失败: {e}")
+                    error = e
+                    if (not backup_started and policy.get('fallback', True)
+                            and ModelRouter._acquire_backup(backup, messages, 'fallback')):
+                        print(f"🔀 改用备用模型 {backup['key']}")
+                        route['fallback'] = backup_started = True
+                        stats.count(primary['key'], 'fallbacks')
+                        start(backup)
+                    continue
+                # 采用先返回的一方，取消另一方；被取消的调用按已等待的时间计入延迟（实际只会更长）
+                for other, other_start in futures.values():
+                    other['driver'].cancel()
+                    ModelRouter._record(other, 'total', (time.perf_counter() - other_start) * 1000)
+                if candidate is backup:
+                    route.update(model=backup['display'], backup=True)
+                    if route['hedged']:
+                        stats.count(primary['key'], 'hedge_wins')
+                return response, route
+        raise error
+
+    @staticmethod
+    def stream(primary, backup, policy, messages, temperature, use_cache=None):
+        """
+        流式调用：没有备用模型时直接调用主模型；否则返回对冲流
+
+        返回: (流式响应生成器, 可取消对象, route)。route在收到首个增量后确定实际回复的模型
+        """
+        route = ModelRouter._route(primary)
+        if backup is None:
+            stream = ModelManager.chat_with_driver(primary['driver'], messages, temperature, stream=True,
+                                                   use_cache=use_cache)
+            return ModelRouter._timed_stream(primary, stream), primary['driver'], route
+        hedged = HedgedStream(primary, backup, policy, messages, temperature, route, use_cache)
+        return hedged, hedged, route
+
+    @staticmethod
+    def _timed_stream(candidate, stream):
+        """透传流式响应，记录首token耗时和总耗时"""
+        stats = LatencyStats.get_instance()
+        driver = candidate['driver']
+        start = time.perf_counter()
+        first = True
+        try:
+            for chunk in stream:
+                if first:
+                    ModelRouter._record(candidate, 'first_token', (time.perf_counter() - start) * 1000)
+                    first = False
+                yield chunk
+            if not getattr(driver, '_cancelled', False):
+                ModelRouter._record(candidate, 'total', (time.perf_counter() - start) * 1000)
+        except Exception:
+            if not getattr(driver, '_cancelled', False):
+                stats.count(candidate['key'], 'errors')
+            raise
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+
+def _is_error_chunk(chunk) -> bool:
+    return isinstance(chunk, str) and chunk.startswith('data: {"error"')
+
+
+def _chunk_text(chunk) -> str:
+    """流式增量中的回复文本（驱动返回 data: {"chunk": ...} 格式或直接的文本）"""
+    if not isinstance(chunk, str):
+        return ''
+    if not chunk.startswith('data: '):
+        return chunk
+    try:
+        return json.loads(chunk[6:].strip()).get('chunk') or ''
+    except (ValueError, AttributeError):
+        return ''
+
+
+class HedgedStream:
+    """带备用模型的流式调用
+
+    每个模型的流式响应由一个后台线程读取并放入同一个队列。主模型在对冲期限内没有首个增量时启动备用模型，
+    先产生首个增量的一方胜出，另一方立即取消（原生驱动关闭上游连接），之后只转发胜出方的增量；
+    首个增量之前的失败会切换到备用模型。
+    """
+
+    def __init__(self, primary, backup, policy, messages, temperature, route, use_cache=None):
+        self._primary = primary
+        self._backup = backup
+        self._policy = policy
+        self._messages = messages
+        self._temperature = temperature
+        self._use_cache = use_cache
+        self._route = route
+        self._queue = queue.Queue()
+        self._runs = []
+        self._closed = False
+        self._events = self._iterate()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def cancel(self) -> None:
+        """取消所有进行中的调用（可从其他线程调用）"""
+        self._closed = True
+        for run in list(self._runs):
+            run['cancelled'] = True
+            run['candidate']['driver'].cancel()
+
+    def close(self) -> None:
+        self.cancel()
+        self._events.close()
+
+    def _start(self, candidate):
+        run = {'candidate': candidate, 'started': time.perf_counter(), 'cancelled': False, 'failed': False}
+        self._runs.append(run)
+        threading.Thread(target=self._pump, args=(run,), name='model-hedge', daemon=True).start()
+        return run
+
+    def _pump(self, run):
+        """后台读取一个模型的流式响应，结束后按已生成的内容归还调度名额"""
+        stream = None
+        reply = ''
+        try:
+            stream = ModelManager.chat_with_driver(run['candidate']['driver'], self._messages,
+                                                   self._temperature, stream=True, use_cache=self._use_cache)
+            for chunk in stream:
+                if run['cancelled']:
+                    break
+                reply += _chunk_text(chunk)
+                self._queue.put((run, 'chunk', chunk))
+            self._queue.put((run, 'end', None))
+        except Exception as e:
+            self._queue.put((run, 'error', e))
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            ModelRouter._release(run['candidate'], reply)
+
+    def _start_backup(self, reason):
+        """申请到调度名额后启动备用模型，返回是否已启动"""
+        if not ModelRouter._acquire_backup(self._backup, self._messages, reason):
+            return False
+        primary_key = self._primary['key']
+        self._route[reason] = True
+        LatencyStats.get_instance().count(primary_key, 'hedged' if reason == 'hedged' else 'fallbacks')
+        self._start(self._backup)
+        return True
+
+    def _elapsed_ms(self, run):
+        return (time.perf_counter() - run['started']) * 1000
+
+    def _iterate(self):
+        stats = LatencyStats.get_instance()
+        primary_run = self._start(self._primary)
+        hedge_at = None
+        if self._policy.get('hedge', True):
+            delay = ModelRouter.hedge_delay(self._primary['key'], 'first_token', self._policy)
+            hedge_at = primary_run['started'] + delay
+        winner = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and hedge_at is not None and len(self._runs) == 1:
+                    timeout = max(0.0, hedge_at - time.perf_counter())
+                try:
+                    run, kind, payload = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    print(f"🔀 {self._primary['key']} 超过 {(hedge_at - primary_run['started']) * 1000:.0f}ms "
+                          f"没有首个token，向备用模型 {self._backup['key']} 发出对冲请求")
+                    if not self._start_backup('hedged'):
+                        # 备用模型没有空闲名额时不再对冲，只等待主模型
+                        hedge_at = None
+                    continue
+                if winner is not None and run is not winner:
+                    continue
+                key = run['candidate']['key']
+
+                if winner is None:
+                    if kind == 'error' or (kind == 'chunk' and _is_error_chunk(payload)):
+                        # 首个增量之前失败：切换到备用模型，或等待另一方
+                        run['failed'] = True
+                        stats.count(key, 'errors')
+                        print(f"⚠️ 模型 {key} 调用失败: {payload if kind == 'error' else payload.strip()}")
+                        if (len(self._runs) == 1 and self._policy.get('fallback', True)
+                                and self._start_backup('fallback')):
+                            print(f"🔀 改用备用模型 {self._backup['key']}")
+                            continue
+                        if any(not other['failed'] for other in self._runs):
+                            continue
+                        if kind == 'error':
+                            raise payload
+                        yield payload
+                        return
+
+                    # 先产生首个增量（或直接结束）的一方胜出，取消另一方
+                    winner = run
+                    ModelRouter._record(run['candidate'], 'first_token', self._elapsed_ms(run))
+                    for other in self._runs:
+                        if other is not run and not other['failed']:
+                            other['cancelled'] = True
+                            other['candidate']['driver'].cancel()
+                            ModelRouter._record(other['candidate'], 'first_token', self._elapsed_ms(other))
+                    if run['candidate'] is self._backup:
+                        self._route.update(model=self._backup['display'], backup=True)
+                        if self._route['hedged']:
+                            stats.count(self._primary['key'], 'hedge_wins')
+                            print(f"🔀 对冲请求胜出，由 {key} 回复")
+
+                if kind == 'chunk':
+                    yield payload
+                elif kind == 'end':
+                    if not self._closed:
+                        ModelRouter._record(run['candidate'], 'total', self._elapsed_ms(run))
+                    return
+                else:
+                    if not self._closed:
+                        stats.count(key, 'errors')
+                    raise payload
+        finally:
+            if not self._closed:
+                self.cancel()
@@ -64,6 +64,11 @@ class ModelService(BaseService):
             version['api_key'] = data['api_key']
         if 'api_base_url' in data:
             version['api_base_url'] = data['api_base_url']
+        if 'options' in data:
+            # 版本运行参数（如Ollama的keep_alive、num_ctx、num_thread、num_batch），空值表示清除
+            if data['options'] and not isinstance(data['options'], dict):
+                return False, 'options必须是对象', None
+            version['options'] = data['options'] or {}
         version['streaming_config'] = data.get('streaming_config', False)  # 流式配置
     
         
@@ -174,4 +179,36 @@ class ModelService(BaseService):
         save_data()
         # 过滤掉icon_blob字段，避免JSON序列化错误
         filtered_model = {k: v for k, v in model.items() if k != 'icon_blob'}
-        return True, f'版本 {version_name} 已成功删除', filtered_model
\ No newline at end of file
+        return True, f'版本 {version_name} 已成功删除', filtered_model
+
+    @staticmethod
+    def warm_model(model_name, version_name):
+        """
+        预加载模型版本到内存（目前用于Ollama本地模型）
+        
+        Args:
+            model_name: 模型名称
+            version_name: 版本名称
+            
+        Returns:
+            元组: (成功标志, 消息或预加载结果, HTTP状态码)
+        """
+        from app.models.model_manager import ModelManager
+
+        model = next((m for m in db['models'] if m['name'] == model_name), None)
+        if not model:
+            return False, '模型不存在', 404
+        version = next((v for v in model.get('versions', []) if v.get('version_name') == version_name), None)
+        if not version:
+            return False, '版本不存在', 404
+
+        try:
+            driver = ModelManager.get_model_driver(model_name, model, version)
+            result = driver.warm()
+        except NotImplementedError as e:
+            return False, str(e), 400
+        except Exception as e:
+            print(f"❌ 预加载模型 {model_name}/{version_name} 失败: {e}")
+            return False, f'预加载失败: {str(e)}', 502
+        print(f"🔥 已预加载模型 {model_name}/{version_name}，加载耗时 {result.get('load_ms', 0)}ms")
+        return True, result, 200
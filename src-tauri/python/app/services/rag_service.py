@@ -30,22 +30,23 @@ def set_rag_instance(instance):
     global vector_store_service
     # 从旧实例中提取必要的配置信息
     if instance:
-        # 创建新的向量存储服务实例
+        # 创建新的向量存储服务实例，并替换单例，保证聊天检索与文档管理使用同一个向量库
         embedder_model = getattr(instance, 'embedder_model', 'all-MiniLM-L6-v2')
         vector_db_path = getattr(instance, 'vector_db_path', VECTOR_DB_PATH)
         vector_store_service = VectorStoreService(
             vector_db_path=vector_db_path,
             embedder_model=embedder_model
         )
+        VectorStoreService._instance = vector_store_service
 
 # 获取向量存储服务实例
 def get_vector_store_service():
-    """获取或创建向量存储服务实例"""
+    """获取或创建向量存储服务实例（与VectorStoreService.get_instance()为同一实例）"""
     global vector_store_service
     # 如果服务实例未初始化，创建一个默认实例
     if vector_store_service is None:
         try:
-            vector_store_service = VectorStoreService(
+            vector_store_service = VectorStoreService.get_instance(
                 vector_db_path=VECTOR_DB_PATH,
                 embedder_model=config_manager.get('rag.embedder_model', 'all-MiniLM-L6-v2')
             )
@@ -170,11 +171,8 @@ class RAGService:
         document_info = DocumentLoader.load_document(file_path)
         
         # 初始化处理信息
-        chunk_info = {
-            'total_chunks': 0,
-            'chunk_size': 1000,
-            'chunk_overlap': 200
-        }
+        chunk_info = RAGService._get_chunk_config()
+        chunk_info['total_chunks'] = 0
         
         vector_info = {
             'vectorized': False,
@@ -193,6 +191,9 @@ class RAGService:
             document_info['chunk_size'] = split_result['chunk_size']
             document_info['chunk_overlap'] = split_result['chunk_overlap']
             document_info['sample_chunks'] = split_result['sample_chunks']
+            if 'parent_documents' in split_result:
+                document_info['parent_chunk_size'] = split_result.get('parent_chunk_size')
+                document_info['parent_documents_count'] = split_result['parent_documents_count']
             
             # 如果分割失败，记录错误
             if not split_result['success']:
@@ -205,7 +206,8 @@ class RAGService:
                     split_result['document_id'],
                     file_path,
                     document_info,
-                    vector_info
+                    vector_info,
+                    parent_documents=split_result.get('parent_documents')
                 )
             
             # 移除原始documents列表，只保留元数据信息
@@ -218,15 +220,42 @@ class RAGService:
         
         return document_info, chunk_info, vector_info
     
+    @staticmethod
+    def _get_chunk_config():
+        """读取config['rag']中的分块配置"""
+        indexing_mode = config_manager.get('rag.indexing_mode', 'standard')
+        if indexing_mode == 'parent_child':
+            return {
+                'indexing_mode': indexing_mode,
+                'chunk_size': int(config_manager.get('rag.child_chunk_size', 200)),
+                'chunk_overlap': int(config_manager.get('rag.child_chunk_overlap', 40)),
+                'parent_chunk_size': int(config_manager.get('rag.parent_chunk_size', 2000)),
+                'parent_chunk_overlap': int(config_manager.get('rag.parent_chunk_overlap', 0))
+            }
+        return {
+            'indexing_mode': 'standard',
+            'chunk_size': int(config_manager.get('rag.chunk_size', 1000)),
+            'chunk_overlap': int(config_manager.get('rag.chunk_overlap', 200))
+        }
+    
     @staticmethod
     def _split_document(documents, chunk_info):
         """执行文档分割操作"""
-        # 使用文本分割工具类进行分割
-        split_result = TextSplitter.split_documents(
-            documents=documents,
-            chunk_size=chunk_info['chunk_size'],
-            chunk_overlap=chunk_info['chunk_overlap']
-        )
+        # 使用文本分割工具类进行分割，父子分块模式下切出父窗口和用于嵌入的子片段
+        if chunk_info.get('indexing_mode') == 'parent_child':
+            split_result = TextSplitter.split_parent_child(
+                documents=documents,
+                parent_chunk_size=chunk_info['parent_chunk_size'],
+                parent_chunk_overlap=chunk_info['parent_chunk_overlap'],
+                child_chunk_size=chunk_info['chunk_size'],
+                child_chunk_overlap=chunk_info['chunk_overlap']
+            )
+        else:
+            split_result = TextSplitter.split_documents(
+                documents=documents,
+                chunk_size=chunk_info['chunk_size'],
+                chunk_overlap=chunk_info['chunk_overlap']
+            )
         
         # 更新chunk_info
         chunk_info['total_chunks'] = split_result['split_documents_count']
@@ -235,7 +264,8 @@ class RAGService:
         return split_result
     
     @staticmethod
-    def _vectorize_documents(split_documents, document_id, source_file, document_info, vector_info):
+    def _vectorize_documents(split_documents, document_id, source_file, document_info, vector_info,
+                             parent_documents=None):
         """执行文档向量化操作"""
         try:
             # 验证文档是否适合向量化
@@ -254,14 +284,16 @@ class RAGService:
             # 获取向量存储服务实例
             vector_service = get_vector_store_service()
             
-            # 执行向量化操作
-            vectorized = vector_service.add_documents(split_documents)
+            # 执行向量化操作（近似重复的片段不再嵌入）
+            ingest_result = vector_service.ingest_documents(split_documents, parents=parent_documents)
+            vectorized = ingest_result['success']
             
             # 更新向量化信息
             vector_info['vectorized'] = vectorized
-            vector_info['vector_count'] = len(split_documents) if vectorized else 0
+            vector_info['vector_count'] = ingest_result['added']
+            vector_info['duplicate_chunks'] = ingest_result['dropped'] + ingest_result['linked']
             vector_info['embedding_model'] = vector_service.embedder_model
-            vector_info['vector_store_type'] = 'chroma'
+            vector_info['vector_store_type'] = vector_service.vector_db_type
             
             # 创建并添加向量化元数据
             vector_metadata = VectorService.create_vector_metadata(
@@ -337,8 +369,10 @@ class RAGService:
         # 从缓存中移除文件
         DocumentLoader.remove_from_cache(file_path)
         
-        # 重新加载向量库
-        RAGService.reload_documents()
+        # 只删除该文件的向量片段，无需重新向量化全部文档
+        vector_service = get_vector_store_service()
+        if vector_service:
+            vector_service.delete_documents_by_source([file_path])
         
         # 返回结果
         return {
@@ -499,6 +533,72 @@ class RAGService:
             'message': f'已删除 {deleted_count} 个文件和所有文件夹，并清空了向量数据库'
         }
     
+    @staticmethod
+    def get_vector_statistics(detailed=True):
+        """获取向量库统计信息（总片段数、按文件夹/文件的片段数、字节数、嵌入模型和维度）"""
+        vector_service = get_vector_store_service()
+        if not vector_service:
+            raise RuntimeError('向量存储服务未初始化')
+        
+        stats = vector_service.get_vector_statistics(detailed=detailed)
+        if stats.get('status') != 'ok':
+            raise RuntimeError(stats.get('error', '获取向量库统计信息失败'))
+        return stats
+    
+    @staticmethod
+    def start_reembedding(embedder_model=None, embedding_dimension=None):
+        """更换嵌入模型：在后台用新模型重建影子向量库，完成后自动切换"""
+        vector_service = get_vector_store_service()
+        if not vector_service:
+            raise RuntimeError('向量存储服务未初始化')
+        return vector_service.start_reembedding(embedder_model, embedding_dimension)
+    
+    @staticmethod
+    def get_reembedding_status():
+        """获取重新嵌入任务的状态"""
+        vector_service = get_vector_store_service()
+        if not vector_service:
+            raise RuntimeError('向量存储服务未初始化')
+        return {
+            'embedder_model': vector_service.embedder_model,
+            'embedding_dimension': vector_service.embedding_dimension or None,
+            'job': vector_service.get_reembedding_status()
+        }
+    
+    @staticmethod
+    def get_search_params(rag_settings):
+        """把前端ragConfig转换为search_documents的检索参数（对话检索与输入时预取共用）"""
+        # 处理前端可能使用的不同键名，将前端的topK映射到后端的top_k
+        mode = rag_settings.get('retrievalMode', rag_settings.get('retrieval_mode'))
+        return {
+            'k': rag_settings.get('topK', rag_settings.get('top_k', 3)),
+            'score_threshold': rag_settings.get('score_threshold', 0.7),
+            'rerank': rag_settings.get('rerank'),
+            'rerank_candidates': rag_settings.get('rerankCandidates'),
+            # 未实现的检索方式交给config['rag']的默认值
+            'retrieval_mode': mode if mode in ('vector', 'mmr') else None
+        }
+    
+    @staticmethod
+    def prefetch(query, rag_config=None):
+        """用户输入时预取检索结果到查询缓存，发送消息时相同或前缀相近的问题直接使用"""
+        # 与ChatService.get_rag_enhanced_prompt相同：未提供ragConfig时使用数据库中的RAG设置
+        if rag_config and isinstance(rag_config, dict):
+            rag_settings = rag_config
+        else:
+            from app.core.data_manager import db
+            rag_settings = db['settings'].get('rag', {})
+        if not rag_settings.get('enabled', False):
+            return {'status': 'disabled'}
+        if not query or len(query.strip()) < int(config_manager.get('rag.prefetch_min_chars', 4)):
+            return {'status': 'skipped'}
+        
+        vector_service = get_vector_store_service()
+        if not vector_service:
+            raise RuntimeError('向量存储服务未初始化')
+        status = vector_service.prefetch(query, **RAGService.get_search_params(rag_settings))
+        return {'status': status, 'stats': dict(vector_service.prefetch_stats)}
+    
     @staticmethod
     def search_file_content(query):
         """搜索文件内容"""
@@ -622,8 +722,10 @@ class RAGService:
         # 删除文件夹及其所有内容
         shutil.rmtree(folder_path)
         
-        # 重新加载向量库
-        RAGService.reload_documents()
+        # 只删除该文件夹下文件的向量片段
+        vector_service = get_vector_store_service()
+        if vector_service and vector_service.statistics:
+            vector_service.delete_documents_by_source(vector_service.statistics.sources_in_folder(folder_name))
         
         return {
             'deleted_folder': folder_name,
@@ -644,7 +746,9 @@ class RAGService:
             vector_service.clear_vector_store()
             
             # 加载、分割和向量化所有文档
+            chunk_config = RAGService._get_chunk_config()
             loaded_chunks = 0
+            duplicate_chunks = 0
             processed_files = 0
             failed_files = 0
             
@@ -662,14 +766,17 @@ class RAGService:
                         document_info = DocumentLoader.load_document(file_path)
                         if 'documents' in document_info and document_info['documents']:
                             # 2. 分割文档
-                            chunk_info = {'chunk_size': 1000, 'chunk_overlap': 200}
-                            split_result = RAGService._split_document(document_info['documents'], chunk_info)
+                            split_result = RAGService._split_document(document_info['documents'], chunk_config)
                             
                             if split_result['success']:
                                 # 3. 向量化并添加到向量库
-                                success = vector_service.add_documents(split_result['split_documents'])
-                                if success:
-                                    loaded_chunks += split_result['split_documents_count']
+                                ingest_result = vector_service.ingest_documents(
+                                    split_result['split_documents'],
+                                    parents=split_result.get('parent_documents')
+                                )
+                                if ingest_result['success']:
+                                    loaded_chunks += ingest_result['added']
+                                    duplicate_chunks += ingest_result['dropped'] + ingest_result['linked']
                                 else:
                                     failed_files += 1
                                     print(f"⚠️  向量化文件 {file} 失败")
@@ -683,6 +790,7 @@ class RAGService:
             print(f"   - 成功加载: {processed_files - failed_files}")
             print(f"   - 加载失败: {failed_files}")
             print(f"   - 总向量数: {loaded_chunks}")
+            print(f"   - 近似重复片段: {duplicate_chunks}")
             
             return True
         except Exception as e:
@@ -0,0 +1,301 @@
+"""模型请求调度模块 - 按供应商和模型版本限制并发数与token速率，超出的请求排队，队列满时拒绝"""
+import time
+import threading
+import itertools
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional
+
+from app.core.config import config_manager
+
+
+class QueueFullError(Exception):
+    """等待队列已满，请求被拒绝（对应HTTP 429）"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(Exception):
+    """排队等待超时"""
+
+
+class _TokenBucket:
+    """token速率限制 - 容量为每分钟的token数，按 tpm/60 每秒匀速补充
+
+    放行请求时先扣除预估的输入token，请求结束后再扣除实际生成的token。余额允许为负，
+    为负时后续请求排队直到额度补回。
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: int) -> float:
+        """还需等待多少秒才能放行tokens个token（超过容量的请求只要求桶满）"""
+        needed = min(tokens, self.capacity) - self.level
+        return max(0.0, needed / self.rate) if self.rate else float('inf')
+
+
+class Ticket:
+    """一次模型调用的排队凭据"""
+
+    def __init__(self, ticket_id: int, chat_id: str, vendor: str, version: str):
+        self.id = ticket_id
+        self.chat_id = chat_id
+        self.vendor = vendor
+        self.version = version
+        self.tokens = 0
+        self.ready = False  # 准备阶段完成、预估token已知后才参与调度
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.ready_at = None
+        self.granted_at = None
+
+    @property
+    def version_key(self) -> str:
+        return f'{self.vendor}/{self.version}'
+
+    @property
+    def wait_ms(self) -> float:
+        """准备就绪后等待放行的时间（与准备阶段重叠的排队时间不计入）"""
+        start = self.ready_at if self.ready_at is not None else self.enqueued_at
+        end = self.granted_at if self.granted_at is not None else time.monotonic()
+        return round(max(0.0, end - start) * 1000, 1)
+
+
+class RequestScheduler:
+    """模型请求调度器（单例）
+
+    - 并发限制：每个供应商、每个模型版本同时进行的上游调用数
+    - token速率限制：每个供应商、每个模型版本每分钟的token数
+    - 公平排队：同一对话内按提交顺序（FIFO），不同对话之间轮流放行，
+      一个对话连续发出的大量请求不会让其他对话一直等待
+    - 背压：排队数达到 scheduler.max_queue 时新请求直接被拒绝
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        # chat_id -> deque[Ticket]，OrderedDict的顺序即对话之间的轮转顺序
+        self._queues: 'OrderedDict[str, deque]' = OrderedDict()
+        self._waiting = 0
+        self._running: Dict[str, int] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._refill_wait: Optional[float] = None
+        self.stats = {'granted': 0, 'rejected': 0, 'timed_out': 0, 'total_wait_ms': 0.0}
+
+    @classmethod
+    def get_instance(cls) -> 'RequestScheduler':
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    # ---------- 配置 ----------
+
+    @staticmethod
+    def _enabled() -> bool:
+        return bool(config_manager.get('scheduler.enabled', True))
+
+    @staticmethod
+    def _concurrency_limit(vendor: str, version_key: str) -> tuple:
+        """返回 (供应商并发上限, 版本并发上限)，0 表示不限制"""
+        vendor_limits = config_manager.get('scheduler.vendor_concurrency', {}) or {}
+        version_limits = config_manager.get('scheduler.version_concurrency', {}) or {}
+        return (vendor_limits.get(vendor, config_manager.get('scheduler.default_concurrency', 4)),
+                version_limits.get(version_key, 0))
+
+    def _bucket(self, key: str, setting: str) -> Optional[_TokenBucket]:
+        """获取key的token桶，未配置速率时返回None（配置变化时重建）"""
+        limit = (config_manager.get(setting, {}) or {}).get(key, 0)
+        if not limit:
+            self._buckets.pop(key, None)
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != float(limit):
+            bucket = self._buckets[key] = _TokenBucket(limit)
+        return bucket
+
+    def _buckets_for(self, ticket: Ticket):
+        return [bucket for bucket in (
+            self._bucket(ticket.vendor, 'scheduler.vendor_tokens_per_minute'),
+            self._bucket(ticket.version_key, 'scheduler.version_tokens_per_minute')
+        ) if bucket is not None]
+
+    # ---------- 排队和放行 ----------
+
+    def submit(self, chat_id: str, vendor: str, version: str) -> Optional[Ticket]:
+        """登记一次模型调用（不阻塞），队列已满时抛出QueueFullError
+
+        Returns:
+            Ticket，调度关闭时返回None
+        """
+        if not self._enabled():
+            return None
+        max_queue = config_manager.get('scheduler.max_queue', 32)
+        with self._cond:
+            if self._waiting >= max_queue:
+                self.stats['rejected'] += 1
+                raise QueueFullError(f'模型请求排队已满（{self._waiting}/{max_queue}），请稍后重试',
+                                     retry_after=max(1, int(self._refill_wait or 1)))
+            ticket = Ticket(next(self._ids), chat_id or '', vendor, version or '')
+            self._queues.setdefault(ticket.chat_id, deque()).append(ticket)
+            self._waiting += 1
+        return ticket
+
+    def acquire(self, ticket: Optional[Ticket], tokens: int = 0, timeout: Optional[float] = None) -> None:
+        """等待放行ticket，tokens为预估的输入token数
+
+        超时后ticket被移出队列并抛出QueueTimeoutError。
+        """
+        if ticket is None:
+            return
+        if timeout is None:
+            timeout = config_manager.get('scheduler.queue_timeout', 120)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            ticket.tokens = max(0, int(tokens))
+            ticket.ready = True
+            ticket.ready_at = time.monotonic()
+            self._dispatch_locked()
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove_locked(ticket)
+                    self.stats['timed_out'] += 1
+                    self._dispatch_locked()
+                    raise QueueTimeoutError(f'模型请求排队超时（{timeout}秒）')
+                # 因token速率受限时按补充时间醒来重新调度，否则等待其他请求释放
+                self._cond.wait(min(remaining, self._refill_wait) if self._refill_wait else remaining)
+                if not ticket.granted:
+                    self._dispatch_locked()
+
+    def try_acquire(self, ticket: Optional[Ticket], tokens: int = 0) -> bool:
+        """不等待：能立即放行时放行ticket并返回True，否则将ticket移出队列并返回False"""
+        if ticket is None:
+            return True
+        with self._cond:
+            ticket.tokens = max(0, int(tokens))
+            ticket.ready = True
+            ticket.ready_at = time.monotonic()
+            self._dispatch_locked()
+            if not ticket.granted:
+                ticket.released = True
+                self._remove_locked(ticket)
+                self._dispatch_locked()
+            return ticket.granted
+
+    def release(self, ticket: Optional[Ticket], output_tokens: int = 0) -> None:
+        """结束调用：归还并发名额并按实际生成的token扣减速率额度；未放行的ticket直接移出队列"""
+        if ticket is None:
+            return
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.granted:
+                for key in (ticket.vendor, ticket.version_key):
+                    self._running[key] = self._running.get(key, 1) - 1
+                    if self._running[key] <= 0:
+                        del self._running[key]
+                now = time.monotonic()
+                for bucket in self._buckets_for(ticket):
+                    bucket.refill(now)
+                    bucket.level -= max(0, int(output_tokens))
+            else:
+                self._remove_locked(ticket)
+            self._dispatch_locked()
+
+    def _remove_locked(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.chat_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[ticket.chat_id]
+
+    def _can_run(self, ticket: Ticket, now: float) -> tuple:
+        """返回 (能否放行, 因token速率需要等待的秒数)"""
+        vendor_limit, version_limit = self._concurrency_limit(ticket.vendor, ticket.version_key)
+        if vendor_limit and self._running.get(ticket.vendor, 0) >= vendor_limit:
+            return False, None
+        if version_limit and self._running.get(ticket.version_key, 0) >= version_limit:
+            return False, None
+        wait = 0.0
+        for bucket in self._buckets_for(ticket):
+            bucket.refill(now)
+            wait = max(wait, bucket.wait_time(ticket.tokens))
+        return wait <= 0, (wait or None)
+
+    def _dispatch_locked(self) -> None:
+        """按对话轮转查看各对话的队首请求，放行所有满足限制的请求"""
+        now = time.monotonic()
+        self._refill_wait = None
+        granted_any = True
+        while granted_any:
+            granted_any = False
+            for chat_id in list(self._queues):
+                queue = self._queues.get(chat_id)
+                if not queue or not queue[0].ready:
+                    continue
+                ticket = queue[0]
+                allowed, wait = self._can_run(ticket, now)
+                if not allowed:
+                    if wait is not None:
+                        self._refill_wait = min(self._refill_wait or wait, wait)
+                    continue
+                queue.popleft()
+                self._waiting -= 1
+                # 放行的对话移到轮转顺序末尾
+                del self._queues[chat_id]
+                if queue:
+                    self._queues[chat_id] = queue
+                for key in (ticket.vendor, ticket.version_key):
+                    self._running[key] = self._running.get(key, 0) + 1
+                for bucket in self._buckets_for(ticket):
+                    bucket.level -= ticket.tokens
+                ticket.granted = True
+                ticket.granted_at = time.monotonic()
+                self.stats['granted'] += 1
+                self.stats['total_wait_ms'] += ticket.wait_ms
+                granted_any = True
+        self._cond.notify_all()
+
+    # ---------- 状态 ----------
+
+    def snapshot(self) -> Dict[str, Any]:
+        """队列深度、进行中的调用数和token额度"""
+        with self._cond:
+            now = time.monotonic()
+            queued_by_model: Dict[str, int] = {}
+            for queue in self._queues.values():
+                for ticket in queue:
+                    queued_by_model[ticket.version_key] = queued_by_model.get(ticket.version_key, 0) + 1
+            for bucket in self._buckets.values():
+                bucket.refill(now)
+            granted = self.stats['granted']
+            return {
+                'enabled': self._enabled(),
+                'queued': self._waiting,
+                'max_queue': config_manager.get('scheduler.max_queue', 32),
+                'queued_chats': len(self._queues),
+                'queued_by_model': queued_by_model,
+                'running': dict(self._running),
+                'token_budget': {key: round(bucket.level) for key, bucket in self._buckets.items()},
+                'granted': granted,
+                'rejected': self.stats['rejected'],
+                'timed_out': self.stats['timed_out'],
+                'avg_wait_ms': round(self.stats['total_wait_ms'] / granted, 1) if granted else 0.0
+            }
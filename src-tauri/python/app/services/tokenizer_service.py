@@ -0,0 +1,275 @@
+# app/services/tokenizer_service.py
+"""分词服务 - 按模型懒加载本地分词器，批量统计token数并缓存结果"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import config_manager
+
+# CJK统一表意文字、日文假名和韩文音节，这些字符通常每个字符约占一个token
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+# 分词器不可用（未配置、加载失败或仍在后台加载）时使用的字符估算
+ESTIMATE = 'estimate'
+
+
+def _estimate(text: str) -> int:
+    """估算文本的token数：CJK字符按每字1个token，其余字符按每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class _TiktokenTokenizer:
+    """tiktoken编码（OpenAI系列模型），编码文件缓存在用户数据目录"""
+
+    def __init__(self, encoding_name: str):
+        os.environ.setdefault('TIKTOKEN_CACHE_DIR', os.path.join(TokenizerService.tokenizer_dir(), 'tiktoken'))
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(texts)]
+
+
+class _HuggingFaceTokenizer:
+    """HuggingFace tokenizers格式的分词器（tokenizer.json）"""
+
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer
+        self._tokenizer = Tokenizer.from_file(path)
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(encoding.ids) for encoding in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+
+class TokenizerService:
+    """分词服务
+
+    - 分词器规格：tiktoken:<编码名>、hf:<目录名>（目录中的tokenizer.json）或 estimate
+    - 各模型使用的分词器按 版本 > 供应商 > 默认 的顺序从配置中选择，首次使用时在后台线程加载，
+      加载完成前和加载失败后按字符估算，统计请求不会等待分词器下载
+    - 文本的token数按 (分词器, 文本摘要) 缓存在内存LRU中；消息的token数按分词器保存在消息的tokenCounts中
+    """
+
+    _tokenizers: Dict[str, Any] = {}
+    _loading: Dict[str, threading.Event] = {}
+    _failed: Dict[str, str] = {}
+    _lock = threading.Lock()
+    _counts: 'OrderedDict[Tuple[str, bytes], int]' = OrderedDict()
+    _counts_lock = threading.Lock()
+
+    @staticmethod
+    def tokenizer_dir() -> str:
+        """本地分词器目录：<用户数据目录>/models/tokenizers"""
+        return config_manager.get('tokenizer.tokenizer_dir') or os.path.join(
+            config_manager.get_user_data_dir(), 'models', 'tokenizers')
+
+    @staticmethod
+    def resolve(vendor: Optional[str] = None, version: Optional[str] = None) -> str:
+        """模型使用的分词器规格，未指定模型时为默认分词器（RAG片段等与模型无关的文本）"""
+        default = config_manager.get('tokenizer.default', ESTIMATE)
+        if not vendor:
+            return default
+        spec = config_manager.get('tokenizer.version_tokenizers', {}).get(f'{vendor}/{version or ""}')
+        spec = spec or config_manager.get('tokenizer.vendor_tokenizers', {}).get(vendor) or default
+        # 模型专用的分词器不可用时改用默认分词器
+        return default if spec in TokenizerService._failed else spec
+
+    @staticmethod
+    def _find_tokenizer_file(name: str) -> Optional[str]:
+        """在本地分词器目录和嵌入模型目录中查找 <name>/tokenizer.json"""
+        candidates = [os.path.join(TokenizerService.tokenizer_dir(), name, 'tokenizer.json'),
+                      os.path.join(config_manager.get_user_data_dir(), 'models', 'embedding', name, 'tokenizer.json')]
+        return next((path for path in candidates if os.path.isfile(path)), None)
+
+    @staticmethod
+    def _load(spec: str) -> None:
+        """加载分词器，结果记录到已加载或失败列表中"""
+        event = TokenizerService._loading[spec]
+        try:
+            kind, _, name = spec.partition(':')
+            if kind == 'tiktoken':
+                tokenizer = _TiktokenTokenizer(name)
+            elif kind == 'hf':
+                path = TokenizerService._find_tokenizer_file(name)
+                if path is None:
+                    raise FileNotFoundError(f'未找到 {name}/tokenizer.json')
+                tokenizer = _HuggingFaceTokenizer(path)
+            else:
+                raise ValueError(f'未知的分词器: {spec}')
+            with TokenizerService._lock:
+                TokenizerService._tokenizers[spec] = tokenizer
+            print(f"✅ 分词器 {spec} 加载完成")
+        except Exception as e:
+            with TokenizerService._lock:
+                TokenizerService._failed[spec] = str(e)
+            print(f"⚠️ 分词器 {spec} 不可用，改为按字符估算token数: {e}")
+        finally:
+            with TokenizerService._lock:
+                TokenizerService._loading.pop(spec, None)
+            event.set()
+
+    @staticmethod
+    def get_tokenizer(spec: str, wait: bool = False) -> Tuple[str, Any]:
+        """获取分词器，首次使用时开始加载
+
+        Args:
+            spec: 分词器规格
+            wait: 是否等待加载完成；为False时加载期间返回字符估算
+
+        Returns:
+            tuple: (实际使用的分词器名称, 分词器实例；按字符估算时为None)
+        """
+        if spec == ESTIMATE:
+            return ESTIMATE, None
+        with TokenizerService._lock:
+            tokenizer = TokenizerService._tokenizers.get(spec)
+            if tokenizer is not None:
+                return spec, tokenizer
+            if spec in TokenizerService._failed:
+                return ESTIMATE, None
+            event = TokenizerService._loading.get(spec)
+            start = event is None
+            if start:
+                event = TokenizerService._loading[spec] = threading.Event()
+        if start:
+            if wait:
+                TokenizerService._load(spec)
+            else:
+                threading.Thread(target=TokenizerService._load, args=(spec,), daemon=True,
+                                 name=f'tokenizer-{spec}').start()
+        if wait:
+            event.wait()
+            return TokenizerService.get_tokenizer(spec)
+        return ESTIMATE, None
+
+    @staticmethod
+    def tokenizer_name(vendor: Optional[str] = None, version: Optional[str] = None) -> str:
+        """模型当前实际使用的分词器名称（未加载完成时为estimate）"""
+        return TokenizerService.get_tokenizer(TokenizerService.resolve(vendor, version))[0]
+
+    @staticmethod
+    def _count_batch(texts: List[str], vendor: Optional[str], version: Optional[str],
+                     cache: bool) -> Tuple[str, List[int]]:
+        """批量统计token数，返回 (实际使用的分词器名称, 各文本的token数)；按字符估算时名称为estimate"""
+        name, tokenizer = TokenizerService.get_tokenizer(TokenizerService.resolve(vendor, version))
+        if tokenizer is None:
+            return ESTIMATE, [_estimate(text) for text in texts]
+        if not cache:
+            try:
+                return name, tokenizer.count_batch([text or '' for text in texts])
+            except Exception as e:
+                print(f"⚠️ 分词器 {name} 统计失败，按字符估算: {e}")
+                return ESTIMATE, [_estimate(text) for text in texts]
+
+        counts: List[Optional[int]] = [None] * len(texts)
+        keys = [(name, hashlib.blake2b((text or '').encode('utf-8'), digest_size=16).digest()) for text in texts]
+        with TokenizerService._counts_lock:
+            for i, key in enumerate(keys):
+                if key in TokenizerService._counts:
+                    TokenizerService._counts.move_to_end(key)
+                    counts[i] = TokenizerService._counts[key]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            try:
+                computed = tokenizer.count_batch([texts[i] or '' for i in missing])
+            except Exception as e:
+                print(f"⚠️ 分词器 {name} 统计失败，按字符估算: {e}")
+                return ESTIMATE, [count if count is not None else _estimate(texts[i]) for i, count in enumerate(counts)]
+            max_entries = config_manager.get('tokenizer.cache_size', 20000)
+            with TokenizerService._counts_lock:
+                for i, count in zip(missing, computed):
+                    counts[i] = count
+                    TokenizerService._counts[keys[i]] = count
+                while len(TokenizerService._counts) > max_entries:
+                    TokenizerService._counts.popitem(last=False)
+        return name, counts
+
+    @staticmethod
+    def count_batch(texts: List[str], vendor: Optional[str] = None, version: Optional[str] = None,
+                    cache: bool = True) -> List[int]:
+        """批量统计token数，已缓存的文本不再重新分词，其余文本一次性交给分词器
+
+        cache为False时不读写内存缓存，用于截断时试探的大量一次性前缀，避免挤掉消息和片段的计数
+        """
+        return TokenizerService._count_batch(texts, vendor, version, cache)[1]
+
+    @staticmethod
+    def count(text: str, vendor: Optional[str] = None, version: Optional[str] = None, cache: bool = True) -> int:
+        """统计单段文本的token数"""
+        return TokenizerService.count_batch([text], vendor, version, cache)[0]
+
+    @staticmethod
+    def message_tokens(messages: List[Dict[str, Any]], vendor: Optional[str] = None,
+                       version: Optional[str] = None) -> List[int]:
+        """各条消息内容的token数
+
+        结果按分词器名称保存在消息的tokenCounts中，之后的统计直接读取；
+        缺少当前分词器计数的消息一次性批量统计。分词器未就绪时的字符估算不保存，
+        分词器加载完成后重新统计。
+        """
+        name = TokenizerService.tokenizer_name(vendor, version)
+        counts = [(msg.get('tokenCounts') or {}).get(name) if name != ESTIMATE else None for msg in messages]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            used, computed = TokenizerService._count_batch([messages[i].get('content') or '' for i in missing],
+                                                           vendor, version, True)
+            for i, count in zip(missing, computed):
+                counts[i] = count
+                if used != ESTIMATE:
+                    messages[i].setdefault('tokenCounts', {})[used] = count
+        return counts
+
+    @staticmethod
+    def count_messages(messages: List[Dict[str, Any]], vendor: Optional[str] = None,
+                       version: Optional[str] = None) -> int:
+        """一次请求中全部消息的token数（含每条消息的格式开销）"""
+        overhead = config_manager.get('tokenizer.message_overhead', 4)
+        return sum(TokenizerService.message_tokens(messages, vendor, version)) + overhead * len(messages)
+
+    @staticmethod
+    def annotate_documents(documents: List[Any]) -> None:
+        """入库时用默认分词器统计片段的token数，写入元数据的token_count和tokenizer
+
+        默认分词器未就绪时不写入，检索后按当时的分词器统计
+        """
+        if not documents:
+            return
+        name, counts = TokenizerService._count_batch([doc.page_content for doc in documents], None, None, True)
+        if name == ESTIMATE:
+            return
+        for doc, count in zip(documents, counts):
+            doc.metadata['token_count'] = count
+            doc.metadata['tokenizer'] = name
+
+    @staticmethod
+    def document_tokens(documents: List[Any]) -> List[int]:
+        """片段的token数：入库时记录的计数与当前默认分词器一致时直接使用，否则重新统计"""
+        name = TokenizerService.tokenizer_name()
+        counts: List[Optional[int]] = []
+        for doc in documents:
+            metadata = doc.metadata or {}
+            counts.append(metadata['token_count'] if metadata.get('tokenizer') == name
+                          and metadata.get('token_count') is not None else None)
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            for i, count in zip(missing, TokenizerService.count_batch([documents[i].page_content for i in missing])):
+                counts[i] = count
+        return counts
+
+    @staticmethod
+    def status() -> Dict[str, Any]:
+        """已加载、加载中和加载失败的分词器"""
+        with TokenizerService._lock:
+            return {
+                'default': config_manager.get('tokenizer.default', ESTIMATE),
+                'loaded': sorted(TokenizerService._tokenizers),
+                'loading': sorted(TokenizerService._loading),
+                'failed': dict(TokenizerService._failed),
+                'cached_counts': len(TokenizerService._counts)
+            }
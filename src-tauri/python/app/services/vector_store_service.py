@@ -1,9 +1,11 @@
 """向量存储服务 - 处理嵌入模型和向量数据库的核心功能"""
 import os
+import json
+import uuid
+import shutil
 import logging
+import threading
 from typing import List, Dict, Any, Optional
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 from app.core.config import config_manager
 
 # 配置日志系统
@@ -28,17 +30,26 @@ class VectorStoreService:
     # 类级别的缓存设置
     _CACHE_SIZE = 100  # 缓存大小限制
     _CACHE_TTL = 3600  # 缓存过期时间（秒）
+    _PREFETCH_HISTORY = 32  # 参与前缀相近匹配的最近预取查询数量
+    _PREFETCH_WAIT_TIMEOUT = 30  # 等待正在执行的预取检索的最长时间（秒）
+    
+    # 记录重新嵌入切换后当前生效存储的文件
+    ACTIVE_STORE_FILE = 'active_store.json'
+    # 重新嵌入生成的存储名称前缀
+    SHADOW_STORE_PREFIX = 'neovai_'
     
     # 单例实例
     _instance = None
     _lock = None  # 用于线程安全的单例实现
     
-    def __init__(self, vector_db_path=None, embedder_model='all-MiniLM-L6-v2'):
+    def __init__(self, vector_db_path=None, embedder_model='all-MiniLM-L6-v2', store_name=None):
         """初始化向量存储服务
         
         Args:
             vector_db_path: 向量数据库的存储路径
             embedder_model: 使用的嵌入模型名称
+            store_name: 存储名称（Chroma集合名 / mmap子目录名），缺省时读取active_store.json，
+                        没有记录时使用旧版本的默认位置
         """
         # 使用配置管理器获取用户数据目录
         self.config_manager = config_manager
@@ -50,8 +61,26 @@ class VectorStoreService:
         )
         
         self.embedder_model = embedder_model
+        # 向量库引擎：chroma 或 mmap（进程内内存映射矩阵）
+        self.vector_db_type = self.config_manager.get('rag.vector_db_type', 'chroma')
+        # 嵌入向量输出维度（Matryoshka截断），0 表示使用模型完整维度
+        self.embedding_dimension = int(self.config_manager.get('rag.embedding_dimension', 0) or 0)
+        # Chroma集合的HNSW索引参数，space/M/construction_ef仅在创建集合时生效
+        self.hnsw_config = self._load_hnsw_config()
+        self.store_name = store_name
+        if store_name is None:
+            self._load_active_store()
+        self._reembedding_job = None  # 正在运行或最近一次的重新嵌入任务
         self._embeddings = None  # 改为私有属性，通过getter访问
         self._vector_store = None  # 改为私有属性，通过getter访问
+        # 向量库记录的维度与配置不一致时为 (记录的维度, 配置的维度)；此时向量库保持打开以便清空或重新嵌入，但禁止写入和检索
+        self._dimension_mismatch = None
+        self._store_lock = threading.RLock()  # 保护向量库的初始化与清空
+        self._statistics = None  # 懒加载的统计计数器
+        self._deduplicator = None  # 懒加载的近似重复片段检测器
+        self._parent_store = None  # 懒加载的父窗口存储（父子分块模式）
+        # 知识库文件根目录，统计时用于由源文件路径推导所属文件夹
+        self.files_dir = os.path.join(self.user_data_dir, 'Retrieval-Augmented Generation', 'files')
         self._directories_ensured = False  # 目录是否已创建
         
         # 创建标准的embedding模型目录
@@ -59,6 +88,15 @@ class VectorStoreService:
         
         # 初始化查询缓存
         self._query_cache = {}  # 缓存字典：key为查询特征，value为(结果, 时间戳)
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0  # 清空向量库时递增，丢弃清空前发起的检索结果
+        
+        # 预取检索：用户输入时提前把草稿的检索结果写入查询缓存
+        self._prefetch_pending = None  # 等待执行的最新草稿 (缓存键, 查询, 检索参数)，新草稿会覆盖旧草稿
+        self._prefetch_inflight = {}  # 正在执行的检索：缓存键 -> threading.Event
+        self._prefetched_queries = []  # 最近预取的 (查询, 检索参数部分的缓存键, 缓存键)，用于前缀相近匹配
+        self._prefetch_worker = None
+        self.prefetch_stats = {'requested': 0, 'executed': 0, 'exact_hits': 0, 'prefix_hits': 0, 'waited': 0}
         
         # 只进行基本的属性初始化，不执行耗时操作
         # 资源密集型操作将在实际使用时懒加载
@@ -76,34 +114,80 @@ class VectorStoreService:
     def vector_store(self):
         """获取向量存储实例（懒加载）"""
         if self._vector_store is None:
-            logger.info("Vector store not initialized, starting initialization...")
-            if self.embeddings is None:  # 确保嵌入模型已初始化
-                logger.info("Embeddings not available, initializing first...")
-                self._ensure_directories()
-                self._init_embeddings()
-            self._init_vector_store()
+            with self._store_lock:
+                if self._vector_store is None:
+                    logger.info("Vector store not initialized, starting initialization...")
+                    if self.embeddings is None:  # 确保嵌入模型已初始化
+                        logger.info("Embeddings not available, initializing first...")
+                        self._ensure_directories()
+                        self._init_embeddings()
+                    self._init_vector_store()
         return self._vector_store
     
+    @property
+    def statistics(self):
+        """获取统计计数器（懒加载，旧版本的向量库首次访问时遍历一次回填）"""
+        if self._statistics is None:
+            with self._store_lock:
+                if self._statistics is None and self.vector_store:
+                    from app.utils.RagUtils.vector_stats import VectorStatistics
+                    statistics = VectorStatistics(self._statistics_path(), base_dir=self.files_dir)
+                    if not statistics.initialized:
+                        logger.info("统计计数器不存在，遍历向量库回填...")
+                        statistics.rebuild(self._iter_store_records())
+                    self._statistics = statistics
+        return self._statistics
+    
+    @property
+    def deduplicator(self):
+        """获取近似重复片段检测器（懒加载，旧版本的向量库首次访问时遍历一次计算签名）"""
+        if self._deduplicator is None:
+            with self._store_lock:
+                if self._deduplicator is None and self.vector_store:
+                    from app.utils.RagUtils.chunk_dedup import ChunkDeduplicator
+                    deduplicator = ChunkDeduplicator(
+                        self._dedup_path(),
+                        threshold=float(self.config_manager.get('rag.dedup_threshold', 0.9)),
+                        num_perm=int(self.config_manager.get('rag.dedup_num_perm', 128)),
+                        bands=int(self.config_manager.get('rag.dedup_bands', 16))
+                    )
+                    if not deduplicator.initialized:
+                        logger.info("片段签名不存在，遍历向量库计算签名...")
+                        deduplicator.rebuild(self._iter_store_records())
+                    self._deduplicator = deduplicator
+        return self._deduplicator
+    
+    @property
+    def parent_store(self):
+        """获取父窗口存储（懒加载）"""
+        if self._parent_store is None:
+            with self._store_lock:
+                if self._parent_store is None:
+                    from app.utils.RagUtils.parent_store import ParentDocumentStore
+                    os.makedirs(self.vector_db_path, exist_ok=True)
+                    self._parent_store = ParentDocumentStore(self._parent_store_path())
+        return self._parent_store
+    
     @classmethod
-    def get_instance(cls, vector_db_path=None, embedder_model='all-MiniLM-L6-v2'):
+    def get_instance(cls, vector_db_path=None, embedder_model=None):
         """获取单例实例
         
         Args:
             vector_db_path: 向量数据库的存储路径
-            embedder_model: 使用的嵌入模型名称
+            embedder_model: 使用的嵌入模型名称，缺省时读取config['rag']['embedder_model']
             
         Returns:
             VectorStoreService: 向量存储服务单例实例
         """
         # 延迟初始化锁，避免导入时的循环依赖
         if cls._lock is None:
-            import threading
             cls._lock = threading.Lock()
         
         # 双重检查锁定模式 - 线程安全的单例实现
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
+                    embedder_model = embedder_model or config_manager.get('rag.embedder_model', 'all-MiniLM-L6-v2')
                     cls._instance = cls(vector_db_path, embedder_model)
         return cls._instance
     
@@ -163,28 +247,20 @@ class VectorStoreService:
                             model_path = local_cache_path
                         else:
                             # 5. 检查HuggingFace缓存路径
+                            hf_model_dir = 'models--' + self.embedder_model.replace('/', '--')
                             hf_cache_path = os.path.join(os.path.expanduser('~'), '.cache', 'huggingface', 'hub', 
-                                                       f'models--{self.embedder_model.replace('/', '--')}', 'snapshots')
+                                                       hf_model_dir, 'snapshots')
                             if os.path.exists(hf_cache_path):
                                 model_path = hf_cache_path
             
             # 加载模型
             if model_path:
                 logger.info(f"找到嵌入模型路径: {model_path}")
-                self._embeddings = HuggingFaceEmbeddings(
-                    model_name=model_path,
-                    model_kwargs={'device': 'cpu'},
-                    encode_kwargs={'normalize_embeddings': True}
-                )
+                self._embeddings = self._create_embeddings(model_path)
             else:
                 # 从HuggingFace下载模型
                 logger.info(f"从HuggingFace下载嵌入模型: {self.embedder_model}")
-                self._embeddings = HuggingFaceEmbeddings(
-                    model_name=self.embedder_model,
-                    model_kwargs={'device': 'cpu'},
-                    encode_kwargs={'normalize_embeddings': True},
-                    cache_folder=self.embedding_models_dir
-                )
+                self._embeddings = self._create_embeddings(self.embedder_model, cache_folder=self.embedding_models_dir)
                 model_path = self.embedder_model
             
             logger.info(f"嵌入模型初始化成功: {model_path}")
@@ -198,11 +274,7 @@ class VectorStoreService:
                 alternative_cache_dir = os.path.join(os.path.dirname(__file__), '.cache', 'sentence-transformers', self.embedder_model)
                 if os.path.exists(alternative_cache_dir):
                     logger.info(f"尝试使用替代本地缓存模型: {alternative_cache_dir}")
-                    self._embeddings = HuggingFaceEmbeddings(
-                        model_name=alternative_cache_dir,
-                        model_kwargs={'device': 'cpu'},
-                        encode_kwargs={'normalize_embeddings': True}
-                    )
+                    self._embeddings = self._create_embeddings(alternative_cache_dir)
                     return True
             except Exception as alt_error:
                 logger.error(f"替代模型加载也失败: {alt_error}")
@@ -210,6 +282,33 @@ class VectorStoreService:
             self._embeddings = None
             return False
     
+    def _create_embeddings(self, model_path: str, cache_folder: Optional[str] = None):
+        """按照config['rag']中选择的推理后端创建嵌入模型实例
+        
+        Args:
+            model_path: 本地模型路径或HuggingFace模型名称
+            cache_folder: HuggingFace下载缓存目录
+            
+        Returns:
+            Embeddings: 嵌入模型实例
+        """
+        from app.utils.RagUtils.embedding_backend import EmbeddingBackend
+        
+        backend = self.config_manager.get('rag.embedding_backend', 'pytorch')
+        logger.info(f"使用嵌入推理后端: {backend}")
+        return EmbeddingBackend.create(
+            model_path,
+            backend=backend,
+            cache_folder=cache_folder,
+            export_root=os.path.join(self.embedding_models_dir, 'onnx'),
+            options={
+                'batch_size': self.config_manager.get('rag.embedding_batch_size', 32),
+                'dimension': self.embedding_dimension,
+                'onnx_quantize': self.config_manager.get('rag.onnx_quantize', True),
+                'onnx_intra_op_threads': self.config_manager.get('rag.onnx_intra_op_threads', 0)
+            }
+        )
+    
     def _init_vector_store(self) -> bool:
         """初始化向量存储
         
@@ -222,32 +321,250 @@ class VectorStoreService:
                 logger.error("无法初始化向量存储：嵌入模型未初始化")
                 return False
             
-            # 如果向量库路径存在，则加载现有的向量库
-            if os.path.exists(self.vector_db_path):
-                self._vector_store = Chroma(
-                    persist_directory=self.vector_db_path,
-                    embedding_function=self._embeddings
-                )
-                logger.info("向量库加载成功")
-            else:
-                # 如果没有现有向量库，创建一个空的
-                self._vector_store = Chroma(
-                    persist_directory=self.vector_db_path,
-                    embedding_function=self._embeddings
-                )
-                logger.info("向量库创建成功")
+            # 重新打开时按配置的维度重新检查
+            if self._dimension_mismatch:
+                self.embedding_dimension = self._dimension_mismatch[1]
+                self._dimension_mismatch = None
+            
+            if self.vector_db_type == 'mmap':
+                # 进程内内存映射向量库，数据放在独立子目录中，避免与Chroma文件混在一起
+                from app.utils.RagUtils.mmap_vector_store import MmapVectorStore
+                options = {
+                    'persist_directory': self._store_directory(),
+                    'embedding_function': self._embeddings,
+                    'quantization': self.config_manager.get('rag.vector_quantization', 'none'),
+                    'rescore_multiplier': self.config_manager.get('rag.rescore_multiplier', 4)
+                }
+                try:
+                    self._vector_store = MmapVectorStore(dimension=self.embedding_dimension or None, **options)
+                except ValueError:
+                    # 不检查维度重新打开，维度确实不一致时保持打开但禁止写入和检索
+                    store = MmapVectorStore(**options)
+                    if not self.embedding_dimension or store.dimension in (None, self.embedding_dimension):
+                        raise
+                    self._vector_store = store
+                    self._set_dimension_mismatch(store.dimension)
+                else:
+                    # 配置为完整维度时不会在打开时检查，与模型实际输出的维度比较（如之前截断过维度）
+                    recorded = self._vector_store.dimension
+                    if not self.embedding_dimension and recorded and recorded != self._model_output_dimension():
+                        self._set_dimension_mismatch(recorded)
+                logger.info(f"内存映射向量库加载成功，当前向量数: {self._vector_store.count()}")
+                return True
+            
+            from langchain_chroma import Chroma
             
+            # 如果向量库路径存在，则加载现有的向量库；否则创建一个空的
+            is_existing = os.path.exists(self.vector_db_path)
+            self._vector_store = Chroma(
+                collection_name=self._collection_name(),
+                persist_directory=self.vector_db_path,
+                embedding_function=self._embeddings,
+                collection_metadata=self._collection_metadata()
+            )
+            
+            # 检查集合记录的维度与当前配置是否一致，避免不同维度的向量混在同一集合中
+            recorded_metadata = self._vector_store._collection.metadata or {}
+            recorded_dimension = int(recorded_metadata.get('embedding_dimension', 0) or 0)
+            if recorded_dimension != self.embedding_dimension:
+                self._set_dimension_mismatch(recorded_dimension)
+            
+            if is_existing:
+                self._apply_hnsw_config(recorded_metadata)
+            
+            logger.info("向量库加载成功" if is_existing else "向量库创建成功")
             return True
         except Exception as e:
             logger.error(f"向量库初始化失败: {e}")
             self._vector_store = None
             return False
     
-    def add_documents(self, documents: List[Any]) -> bool:
+    def _model_output_dimension(self) -> int:
+        """嵌入模型实际输出的向量维度（配置了截断维度时即为该维度，否则嵌入一段文本得到）"""
+        if self.embedding_dimension:
+            return self.embedding_dimension
+        return len(self._embeddings.embed_query('dimension'))
+    
+    def _set_dimension_mismatch(self, recorded_dimension: int) -> None:
+        """记录维度不一致：向量库按记录的维度视为当前维度，重新嵌入时以配置的维度为目标"""
+        self._dimension_mismatch = (recorded_dimension, self.embedding_dimension)
+        self.embedding_dimension = recorded_dimension
+        logger.warning(self._dimension_mismatch_message())
+    
+    def _dimension_mismatch_message(self) -> str:
+        recorded, configured = self._dimension_mismatch
+        return (f'向量库记录的维度为 {recorded or "完整维度"}，与配置的 {configured or "完整维度"} 不一致，'
+                f'请清空向量库或执行重新嵌入')
+    
+    def _load_hnsw_config(self) -> Dict[str, Any]:
+        """从config['rag']读取HNSW索引参数"""
+        return {
+            'space': self.config_manager.get('rag.hnsw_space', 'l2'),
+            'M': int(self.config_manager.get('rag.hnsw_m', 16)),
+            'construction_ef': int(self.config_manager.get('rag.hnsw_construction_ef', 100)),
+            'search_ef': int(self.config_manager.get('rag.hnsw_search_ef', 100))
+        }
+    
+    def _load_active_store(self) -> None:
+        """读取重新嵌入切换后记录的当前存储
+        
+        向量库中的向量必须用生成它们的模型编码查询，因此记录的模型优先于配置；
+        更换模型需要通过重新嵌入迁移。
+        """
+        pointer_path = os.path.join(self.vector_db_path, self.ACTIVE_STORE_FILE)
+        if not os.path.exists(pointer_path):
+            return
+        try:
+            with open(pointer_path, 'r', encoding='utf-8') as f:
+                pointer = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取{self.ACTIVE_STORE_FILE}失败，使用默认存储: {e}")
+            return
+        if pointer.get('vector_db_type') != self.vector_db_type:
+            return
+        
+        self.store_name = pointer.get('store_name')
+        recorded_model = pointer.get('embedder_model')
+        if recorded_model and recorded_model != self.embedder_model:
+            logger.warning(f"向量库由 {recorded_model} 生成，忽略配置的 {self.embedder_model}，"
+                           f"如需更换模型请执行重新嵌入")
+            self.embedder_model = recorded_model
+        self.embedding_dimension = int(pointer.get('embedding_dimension', self.embedding_dimension) or 0)
+    
+    def _write_active_store(self) -> None:
+        """原子地写入当前生效的存储（先写临时文件再替换）"""
+        pointer_path = os.path.join(self.vector_db_path, self.ACTIVE_STORE_FILE)
+        temp_path = pointer_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'vector_db_type': self.vector_db_type,
+                'store_name': self.store_name,
+                'embedder_model': self.embedder_model,
+                'embedding_dimension': self.embedding_dimension
+            }, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, pointer_path)
+    
+    def _collection_name(self) -> str:
+        """Chroma集合名称，未记录时使用langchain_chroma的默认集合"""
+        return self.store_name or 'langchain'
+    
+    def _store_directory(self) -> str:
+        """当前向量库引擎的数据目录"""
+        if self.vector_db_type == 'mmap':
+            return os.path.join(self.vector_db_path, self.store_name or 'mmap_index')
+        return self.vector_db_path
+    
+    def _statistics_path(self) -> str:
+        """统计计数器旁路文件路径（Chroma的多个集合共用同一目录，按集合名区分）"""
+        if self.vector_db_type == 'chroma' and self.store_name:
+            return os.path.join(self.vector_db_path, f'vector_stats_{self.store_name}.db')
+        return os.path.join(self._store_directory(), 'vector_stats.db')
+    
+    def _dedup_path(self) -> str:
+        """片段签名旁路文件路径（签名只与文本有关，重新嵌入切换存储后继续使用）"""
+        return os.path.join(self.vector_db_path, 'chunk_dedup.db')
+    
+    def _dedup_active(self) -> bool:
+        """是否已经有片段签名需要维护"""
+        return self._deduplicator is not None or os.path.exists(self._dedup_path())
+    
+    def _parent_store_path(self) -> str:
+        """父窗口存储旁路文件路径（父窗口文本与嵌入模型无关，重新嵌入切换存储后继续使用）"""
+        return os.path.join(self.vector_db_path, 'parent_docs.db')
+    
+    def _parent_store_active(self) -> bool:
+        """是否已经保存过父窗口"""
+        return self._parent_store is not None or os.path.exists(self._parent_store_path())
+    
+    def _iter_store_records(self, page_size: int = 5000):
+        """分页遍历向量库中的全部片段，返回(片段ID, 元数据, 文本)，仅用于回填统计计数器"""
+        if self.vector_db_type == 'mmap':
+            yield from self._vector_store.iter_records(page_size)
+            return
+        
+        collection = self._vector_store._collection
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(include=['metadatas', 'documents'], limit=page_size, offset=offset)
+            yield from zip(page['ids'], page['metadatas'], page['documents'])
+    
+    def _record_embedding_info(self) -> None:
+        """在统计信息中记录嵌入模型和向量维度（维度只在首次写入后读取一次）"""
+        statistics = self.statistics
+        if statistics.get_info('embedding_model') != self.embedder_model:
+            statistics.set_info('embedding_model', self.embedder_model)
+        if statistics.get_info('dimension'):
+            return
+        
+        dimension = self.embedding_dimension
+        if not dimension:
+            if self.vector_db_type == 'mmap':
+                dimension = self._vector_store.dimension
+            else:
+                sample = self._vector_store._collection.get(limit=1, include=['embeddings'])
+                if sample['embeddings'] is not None and len(sample['embeddings']):
+                    dimension = len(sample['embeddings'][0])
+        if dimension:
+            statistics.set_info('dimension', dimension)
+    
+    def _collection_metadata(self) -> Dict[str, Any]:
+        """创建Chroma集合时写入的元数据（包括HNSW索引参数）"""
+        return {
+            'embedder_model': self.embedder_model,
+            'embedding_dimension': self.embedding_dimension,
+            'hnsw:space': self.hnsw_config['space'],
+            'hnsw:M': self.hnsw_config['M'],
+            'hnsw:construction_ef': self.hnsw_config['construction_ef'],
+            'hnsw:search_ef': self.hnsw_config['search_ef']
+        }
+    
+    def _apply_hnsw_config(self, recorded_metadata: Dict[str, Any]) -> None:
+        """对已存在的集合应用HNSW参数
+        
+        search_ef可以随时修改；space、M和construction_ef在建索引时确定，
+        与配置不一致时以集合记录的值为准并提示需要重建。
+        
+        Args:
+            recorded_metadata: 集合中记录的元数据
+        """
+        # 旧版本创建的集合没有记录HNSW参数，使用Chroma的默认值
+        recorded_space = recorded_metadata.get('hnsw:space', 'l2')
+        for key in ('space', 'M', 'construction_ef'):
+            recorded = recorded_metadata.get(f'hnsw:{key}')
+            if recorded is not None and recorded != self.hnsw_config[key]:
+                logger.warning(f"集合的HNSW参数 {key}={recorded} 与配置的 {self.hnsw_config[key]} 不一致，"
+                               f"需要重建向量库才能生效")
+        self.hnsw_config['space'] = recorded_space
+        
+        search_ef = self.hnsw_config['search_ef']
+        if recorded_metadata.get('hnsw:search_ef') == search_ef:
+            return
+        collection = self._vector_store._collection
+        try:
+            # Chroma 1.x 通过configuration修改search_ef
+            collection.modify(configuration={'hnsw': {'ef_search': search_ef}})
+        except Exception:
+            # 旧版本Chroma通过元数据修改
+            metadata = {k: v for k, v in recorded_metadata.items() if k not in ('hnsw:space', 'hnsw:M', 'hnsw:construction_ef')}
+            metadata['hnsw:search_ef'] = search_ef
+            collection.modify(metadata=metadata)
+        logger.info(f"已将集合的HNSW search_ef调整为 {search_ef}")
+    
+    def _to_l2_distance(self, score: float) -> float:
+        """将Chroma返回的距离换算为归一化向量的平方欧氏距离，使score_threshold在不同space下含义一致"""
+        if self.vector_db_type == 'chroma' and self.hnsw_config['space'] in ('cosine', 'ip'):
+            # cosine/ip空间的距离为 1 - 相似度，平方欧氏距离为 2 - 2 * 相似度
+            return 2.0 * score
+        return score
+    
+    def add_documents(self, documents: List[Any], ids: Optional[List[str]] = None) -> bool:
         """将文档片段添加到向量库中
         
         Args:
             documents: 文档片段列表
+            ids: 片段ID列表，缺省时自动生成
             
         Returns:
             bool: 是否成功添加
@@ -261,8 +578,29 @@ class VectorStoreService:
                 logger.error("向量存储未初始化")
                 return False
             
-            # 将文档片段添加到向量库
-            self.vector_store.add_documents(documents)
+            if self._dimension_mismatch:
+                logger.error(self._dimension_mismatch_message())
+                return False
+            
+            ids = ids or [str(uuid.uuid4()) for _ in documents]
+            with self._store_lock:
+                # 先加载统计计数器，避免首次回填时把本次写入的片段重复计入
+                statistics = self.statistics
+                
+                # 将文档片段添加到向量库
+                self.vector_store.add_documents(documents, ids=ids)
+                
+                # 增量更新统计计数器
+                statistics.record_add(documents)
+                self._record_embedding_info()
+                
+                # 重新嵌入期间的写入同步记录到任务中，切换前在影子向量库上重放
+                if self._reembedding_job and self._reembedding_job.running:
+                    from langchain_core.documents import Document
+                    self._reembedding_job.record_add([
+                        Document(page_content=doc.page_content, metadata=doc.metadata, id=doc_id)
+                        for doc, doc_id in zip(documents, ids)
+                    ])
             
             logger.info(f"成功将 {len(documents)} 个文档片段添加到向量库")
             return True
@@ -270,67 +608,315 @@ class VectorStoreService:
             logger.error(f"添加文档失败: {e}")
             return False
     
+    def ingest_documents(self, documents: List[Any], parents: Optional[List[Any]] = None) -> Dict[str, Any]:
+        """入库：先检测近似重复片段，再把其余片段嵌入写入向量库
+        
+        config['rag']['dedup_mode']为link时重复片段只记录与已存储片段的链接，
+        已存储片段的文件被删除时自动重新入库；为drop时直接丢弃；为off时不去重。
+        
+        Args:
+            documents: 分割后的文档片段列表（父子分块模式下为子片段）
+            parents: 父子分块模式下的父窗口列表，先于子片段保存到父窗口存储
+            
+        Returns:
+            dict: success、added（写入的片段数）、dropped、linked、bytes_saved（未嵌入的文本字节数）
+        """
+        # 入库时统计一次片段的token数，检索后组装上下文时直接使用
+        from app.services.tokenizer_service import TokenizerService
+        TokenizerService.annotate_documents(list(documents) + list(parents or []))
+        
+        if parents:
+            self.parent_store.add_documents(parents)
+        
+        mode = self.config_manager.get('rag.dedup_mode', 'link')
+        if mode not in ('link', 'drop') or not documents:
+            added = self.add_documents(documents)
+            return {'success': added, 'added': len(documents) if added else 0,
+                    'dropped': 0, 'linked': 0, 'bytes_saved': 0}
+        
+        try:
+            ids = [str(uuid.uuid4()) for _ in documents]
+            with self._store_lock:
+                deduplicator = self.deduplicator
+                if deduplicator is None:
+                    logger.error("向量存储未初始化")
+                    return {'success': False, 'added': 0, 'dropped': 0, 'linked': 0, 'bytes_saved': 0}
+                
+                result = deduplicator.deduplicate(documents, ids)
+                kept = [documents[i] for i in result['keep']]
+                if kept and not self.add_documents(kept, ids=[ids[i] for i in result['keep']]):
+                    return {'success': False, 'added': 0, 'dropped': 0, 'linked': 0, 'bytes_saved': 0}
+                summary = deduplicator.commit(documents, result, mode)
+            
+            if result['duplicates']:
+                logger.info(f"检测到 {len(result['duplicates'])} 个近似重复片段（{mode}），"
+                            f"少嵌入 {summary['bytes_saved']} 字节文本")
+            return {'success': True, 'added': len(kept), 'dropped': summary['dropped'],
+                    'linked': summary['linked'], 'bytes_saved': summary['bytes_saved']}
+        except Exception as e:
+            logger.error(f"片段去重失败，直接写入全部片段: {e}")
+            added = self.add_documents(documents)
+            return {'success': added, 'added': len(documents) if added else 0,
+                    'dropped': 0, 'linked': 0, 'bytes_saved': 0}
+    
     def clear_vector_store(self) -> bool:
         """清空向量库
         
+        直接删除并重建集合（mmap引擎将数据文件整体移走后重建），不读取任何片段ID，
+        耗时与向量数量无关；查询缓存在同一步骤中失效。
+        
         Returns:
             bool: 是否成功清空
         """
-        max_retries = 3
-        retry_delay = 1  # 秒
-        
-        for attempt in range(max_retries):
+        with self._store_lock:
+            # 清空后旧内容不再需要迁移，取消正在运行的重新嵌入任务
+            if self._reembedding_job and self._reembedding_job.running:
+                self._reembedding_job.cancel()
+            
             try:
                 # 检查向量存储是否初始化
                 if not self.vector_store:
                     logger.error("向量存储未初始化")
                     return False
                 
-                # 获取集合并清空
-                if hasattr(self.vector_store, '_collection'):
-                    try:
-                        # 尝试使用不同的方式清空集合
-                        # 方法1: 尝试删除所有文档，不指定where条件
-                        self.vector_store._collection.delete()
-                        logger.info("向量库清空成功")
-                        return True
-                    except Exception as e1:
-                        try:
-                            # 方法2: 使用更明确的删除方式
-                            # 获取所有文档ID然后删除
-                            all_ids = self.vector_store._collection.get()['ids']
-                            if all_ids:
-                                self.vector_store._collection.delete(ids=all_ids)
-                            logger.info("向量库清空成功")
-                            return True
-                        except Exception as e2:
-                            logger.warning(f"尝试清空集合失败: {e1}, {e2}")
-                            # 继续执行备选方案
+                if self.vector_db_type == 'mmap' and not self._dimension_mismatch:
+                    self._vector_store.reset()
                 else:
-                    # 备选方案：重新初始化向量存储
-                    import shutil
-                    # 关闭向量存储（如果有方法）
-                    if hasattr(self.vector_store, 'delete_collection'):
-                        self.vector_store.delete_collection()
-                    
-                    # 删除向量库目录
-                    if os.path.exists(self.vector_db_path):
-                        shutil.rmtree(self.vector_db_path)
-                    
-                    # 重新初始化
-                    return self._init_vector_store()
-            
+                    # 删除集合后按当前配置重建，新集合使用最新的HNSW参数和维度（与嵌入模型的输出维度一致）
+                    self._vector_store.delete_collection()
+                    self._vector_store = None
+                    if self._dimension_mismatch:
+                        self.embedding_dimension = self._dimension_mismatch[1]
+                        self._dimension_mismatch = None
+                    self.hnsw_config = self._load_hnsw_config()
+                    if not self._init_vector_store():
+                        return False
+                
+                self.statistics.reset()
+                if self._dedup_active():
+                    self.deduplicator.reset()
+                if self._parent_store_active():
+                    self.parent_store.reset()
+                self._invalidate_cache()
+                logger.info("向量库清空成功")
+                return True
             except Exception as e:
-                logger.error(f"清空向量库失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(retry_delay)
+                logger.error(f"清空向量库失败: {e}")
+                # 集合可能已被删除，下次访问时重新初始化
+                self._vector_store = None
+                self._invalidate_cache()
+                return False
+    
+    def delete_documents_by_source(self, sources: List[str]) -> bool:
+        """删除指定源文件的全部片段
+        
+        Args:
+            sources: 源文件路径列表（与片段元数据中的source一致）
+            
+        Returns:
+            bool: 是否成功删除
+        """
+        if not sources:
+            return True
+        
+        try:
+            if not self.vector_store:
+                logger.error("向量存储未初始化")
+                return False
+            
+            with self._store_lock:
+                if self.vector_db_type == 'mmap':
+                    self._vector_store.delete_by_source(sources)
+                else:
+                    self._vector_store._collection.delete(where={'source': {'$in': list(sources)}})
                 
-        return False
+                self.statistics.record_delete(sources)
+                self._invalidate_cache()
+                if self._reembedding_job and self._reembedding_job.running:
+                    self._reembedding_job.record_delete(sources)
+                
+                if self._parent_store_active():
+                    self.parent_store.delete_by_source(sources)
+                
+                # 链接到被删除片段的其他文件的重复片段重新入库
+                if self._dedup_active():
+                    restored = self.deduplicator.remove_sources(sources)
+                    if restored:
+                        logger.info(f"恢复 {len(restored)} 个链接到被删除文件的重复片段")
+                        self.ingest_documents(restored)
+            logger.info(f"已从向量库删除 {len(sources)} 个文件的片段")
+            return True
+        except Exception as e:
+            logger.error(f"按源文件删除片段失败: {e}")
+            return False
+    
+    def existing_ids(self, ids: List[str]) -> set:
+        """返回ids中已存在于向量库的片段ID"""
+        if not ids:
+            return set()
+        if self.vector_db_type == 'mmap':
+            return self.vector_store.existing_ids(ids)
+        return set(self.vector_store._collection.get(ids=list(ids), include=[])['ids'])
+    
+    def start_reembedding(self, embedder_model: Optional[str] = None,
+                          embedding_dimension: Optional[int] = None) -> Dict[str, Any]:
+        """启动后台重新嵌入任务：用新模型从已存储的片段文本构建影子向量库，完成后原子切换
+        
+        只修改了输出维度（包括打开时发现向量库维度与配置不一致）时同样可以重新嵌入
+        
+        Args:
+            embedder_model: 新的嵌入模型，缺省时使用config['rag']['embedder_model']
+            embedding_dimension: 新的输出维度，缺省时使用config['rag']['embedding_dimension']
+            
+        Returns:
+            dict: 任务状态
+        """
+        from app.utils.RagUtils.reembedding import ReembeddingJob
+        
+        embedder_model = embedder_model or self.config_manager.get('rag.embedder_model', self.embedder_model)
+        if embedding_dimension is None:
+            embedding_dimension = self.config_manager.get('rag.embedding_dimension', 0)
+        embedding_dimension = int(embedding_dimension or 0)
+        
+        with self._store_lock:
+            if self._reembedding_job and self._reembedding_job.running:
+                raise ValueError('已有重新嵌入任务正在运行')
+            # 先打开向量库：维度不一致时embedding_dimension改为向量库记录的维度，只改了维度也会按配置的维度重新嵌入
+            if not self.vector_store:
+                raise RuntimeError('向量存储未初始化，无法读取已存储的片段，请先清空向量库')
+            if embedder_model == self.embedder_model and embedding_dimension == self.embedding_dimension:
+                raise ValueError(f'向量库已经使用 {embedder_model}（{embedding_dimension or "默认"}维）生成，无需重新嵌入')
+            
+            self._drop_orphan_stores()
+            shadow = VectorStoreService(
+                self.vector_db_path,
+                embedder_model,
+                store_name=f'{self.SHADOW_STORE_PREFIX}{uuid.uuid4().hex[:12]}'
+            )
+            shadow.embedding_dimension = embedding_dimension
+            self._reembedding_job = ReembeddingJob(
+                self,
+                shadow,
+                batch_size=self.config_manager.get('rag.reembed_batch_size', 64),
+                duty_cycle=self.config_manager.get('rag.reembed_duty_cycle', 0.5)
+            )
+            self._reembedding_job.start()
+            return self._reembedding_job.get_status()
+    
+    def get_reembedding_status(self) -> Optional[Dict[str, Any]]:
+        """获取最近一次重新嵌入任务的状态，没有任务时返回None"""
+        return self._reembedding_job.get_status() if self._reembedding_job else None
+    
+    def iter_reembedding_records(self, page_size: int = 500):
+        """遍历任务开始时向量库中的片段，返回(片段ID, 元数据, 文本)
+        
+        mmap引擎按行号遍历到开始时的行数；Chroma按源文件分页读取，
+        不受任务期间其他文件的删除影响。任务期间的新增和删除由任务记录后重放。
+        """
+        if self.vector_db_type == 'mmap':
+            yield from self._vector_store.iter_records(page_size, max_row=self._vector_store.row_count())
+            return
+        
+        collection = self._vector_store._collection
+        sources = list(self.statistics.snapshot(detailed=True)['files'].keys())
+        for source in sources:
+            offset = 0
+            while True:
+                page = collection.get(where={'source': source}, include=['metadatas', 'documents'],
+                                      limit=page_size, offset=offset)
+                if not page['ids']:
+                    break
+                yield from zip(page['ids'], page['metadatas'], page['documents'])
+                offset += len(page['ids'])
+    
+    def switch_to_shadow(self, job) -> bool:
+        """重放任务期间的变更后切换到影子向量库，并删除旧存储
+        
+        任务在持有存储锁时才标记为completed，此前提交的写入和删除都会被记录并在这里重放。
+        
+        Args:
+            job: 已完成复制的重新嵌入任务
+            
+        Returns:
+            bool: 是否已切换；等待存储锁期间任务被取消时返回False
+        """
+        shadow = job.shadow
+        with self._store_lock:
+            if job.cancelled:
+                return False
+            job.replay_pending_changes()
+            
+            old_service = VectorStoreService(self.vector_db_path, self.embedder_model, store_name=self.store_name)
+            old_service._vector_store = self._vector_store
+            old_service._statistics = self._statistics
+            
+            self.store_name = shadow.store_name
+            self.embedder_model = shadow.embedder_model
+            self.embedding_dimension = shadow.embedding_dimension
+            self.hnsw_config = shadow.hnsw_config
+            self._embeddings = shadow._embeddings
+            self._vector_store = shadow._vector_store
+            self._dimension_mismatch = None
+            self._statistics = shadow._statistics
+            self._write_active_store()
+            self._invalidate_cache()
+            
+            self.config_manager.set('rag.embedder_model', self.embedder_model)
+            self.config_manager.set('rag.embedding_dimension', self.embedding_dimension)
+            job.status['state'] = 'completed'
+        
+        try:
+            self.drop_store(old_service)
+        except Exception as e:
+            logger.warning(f"删除旧向量库失败: {e}")
+        return True
+    
+    def drop_store(self, service: 'VectorStoreService') -> None:
+        """删除另一个VectorStoreService指向的存储及其统计文件（不能是当前生效的存储）"""
+        if service.store_name == self.store_name:
+            raise ValueError('不能删除当前生效的向量库')
+        
+        if service._vector_store is not None:
+            service._vector_store.delete_collection()
+        elif self.vector_db_type == 'chroma':
+            # 未打开过的集合通过当前客户端删除
+            self.vector_store._client.delete_collection(service._collection_name())
+        
+        if self.vector_db_type == 'mmap':
+            shutil.rmtree(service._store_directory(), ignore_errors=True)
+        else:
+            if service._statistics is not None:
+                service._statistics._conn.close()
+            if os.path.exists(service._statistics_path()):
+                os.remove(service._statistics_path())
+    
+    def _drop_orphan_stores(self) -> None:
+        """删除之前的重新嵌入任务中断后遗留的影子存储"""
+        if self.vector_db_type == 'mmap':
+            names = [n for n in os.listdir(self.vector_db_path)
+                     if os.path.isdir(os.path.join(self.vector_db_path, n))]
+        else:
+            names = [c if isinstance(c, str) else c.name for c in self.vector_store._client.list_collections()]
+        
+        for name in names:
+            if name.startswith(self.SHADOW_STORE_PREFIX) and name != self.store_name:
+                logger.info(f"删除遗留的影子向量库: {name}")
+                self.drop_store(VectorStoreService(self.vector_db_path, self.embedder_model, store_name=name))
+    
+    def _invalidate_cache(self) -> None:
+        """清空查询缓存，并使清空前发起、尚未返回的检索结果不再写入缓存"""
+        with self._cache_lock:
+            self._query_cache.clear()
+            self._prefetched_queries.clear()
+            self._prefetch_pending = None
+            self._cache_generation += 1
     
-    def get_vector_statistics(self) -> Dict[str, Any]:
-        """获取向量库统计信息
+    def get_vector_statistics(self, detailed: bool = False) -> Dict[str, Any]:
+        """获取向量库统计信息（读取增量维护的计数器，不访问向量库）
         
+        Args:
+            detailed: 是否包含按文件夹和文件的片段数明细
+            
         Returns:
             dict: 向量库统计信息
         """
@@ -345,19 +931,18 @@ class VectorStoreService:
             stats = {
                 'status': 'ok',
                 'embedding_model': self.embedder_model,
-                'vector_store_type': 'chroma',
-                'vector_store_path': self.vector_db_path,
-                'total_vectors': 0
+                'embedding_dimension': self.embedding_dimension or None,
+                'vector_store_type': self.vector_db_type,
+                'hnsw_config': self.hnsw_config if self.vector_db_type == 'chroma' else None,
+                'vector_store_path': self.vector_db_path
             }
-            
-            # 尝试获取向量数量
-            if hasattr(self.vector_store, '_collection'):
-                try:
-                    stats['total_vectors'] = self.vector_store._collection.count()
-                except Exception as e:
-                    logger.error(f"获取向量数量失败: {e}")
-                    stats['total_vectors'] = 0
-            
+            if self._dimension_mismatch:
+                stats['warning'] = self._dimension_mismatch_message()
+            stats.update({k: v for k, v in self.statistics.snapshot(detailed).items() if v is not None})
+            if self._dedup_active():
+                stats['dedup'] = self.deduplicator.snapshot()
+            if self._parent_store_active():
+                stats.update(self.parent_store.snapshot())
             return stats
         except Exception as e:
             logger.error(f"获取向量库统计信息失败: {e}")
@@ -367,33 +952,303 @@ class VectorStoreService:
                 'total_vectors': 0
             }
     
-    def _update_cache(self, cache_key: str, result: List[Any], current_time: float) -> None:
+    def _search_with_vectors(self, query: str, k: int):
+        """检索候选并返回候选向量
+        
+        Returns:
+            tuple: (文档列表, 平方欧氏距离列表, 候选向量矩阵, 查询向量)
+        """
+        import numpy as np
+        
+        query_embedding = self.embeddings.embed_query(query)
+        if self.vector_db_type == 'mmap':
+            pairs, vectors = self.vector_store.similarity_search_with_vectors(query_embedding, k)
+            return [doc for doc, _ in pairs], [score for _, score in pairs], vectors, query_embedding
+        
+        from langchain_core.documents import Document
+        result = self.vector_store._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            include=['documents', 'metadatas', 'distances', 'embeddings']
+        )
+        documents = [
+            Document(page_content=text, metadata=metadata or {}, id=doc_id)
+            for doc_id, text, metadata in zip(result['ids'][0], result['documents'][0], result['metadatas'][0])
+        ]
+        distances = [self._to_l2_distance(d) for d in result['distances'][0]]
+        vectors = np.asarray(result['embeddings'][0], dtype=np.float32) if documents else np.zeros((0, 0), dtype=np.float32)
+        return documents, distances, vectors, query_embedding
+    
+    def _mmr_search(self, query: str, k: int, score_threshold: Optional[float] = None) -> List[Any]:
+        """最大边际相关性检索：召回候选池后选出既相关又彼此不重复的k个片段"""
+        from app.utils.RagUtils.mmr import maximal_marginal_relevance
+        
+        pool_size = max(int(self.config_manager.get('rag.mmr_fetch_k', 20)), 2 * k)
+        documents, distances, vectors, query_embedding = self._search_with_vectors(query, pool_size)
+        
+        if score_threshold is not None:
+            keep = [i for i, distance in enumerate(distances) if distance <= score_threshold]
+            documents = [documents[i] for i in keep]
+            vectors = vectors[keep]
+        
+        selected = maximal_marginal_relevance(
+            query_embedding, vectors, k,
+            lambda_mult=float(self.config_manager.get('rag.mmr_lambda', 0.5))
+        )
+        return [documents[i] for i in selected]
+    
+    @property
+    def reranker(self):
+        """获取config['rag']中配置的交叉编码器重排序器"""
+        from app.utils.RagUtils.reranker import CrossEncoderReranker
+        
+        model_name = self.config_manager.get('rag.rerank_model', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+        rerank_models_dir = os.path.join(self.user_data_dir, 'models', 'rerank')
+        # 标准用户数据目录下有同名模型时优先使用本地模型
+        local_path = os.path.join(rerank_models_dir, model_name)
+        return CrossEncoderReranker.get(
+            local_path if os.path.exists(local_path) else model_name,
+            cache_folder=rerank_models_dir,
+            batch_size=self.config_manager.get('rag.rerank_batch_size', 16),
+            cache_size=self.config_manager.get('rag.rerank_cache_size', 10000)
+        )
+    
+    def _rerank(self, query: str, documents: List[Any], k: int) -> List[Any]:
+        """用交叉编码器重排序候选，失败时退回向量检索的顺序"""
+        if len(documents) <= 1:
+            return documents[:k]
+        try:
+            import time
+            start = time.perf_counter()
+            ranked = self.reranker.rerank(query, documents, k)
+            logger.info(f"重排序 {len(documents)} 个候选，耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+            return [doc for doc, _ in ranked]
+        except Exception as e:
+            logger.error(f"重排序失败，使用向量检索结果: {e}")
+            return documents[:k]
+    
+    def _update_cache(self, cache_key: str, result: List[Any], current_time: float,
+                      generation: Optional[int] = None) -> None:
         """更新查询缓存
         
         Args:
             cache_key: 缓存键
             result: 搜索结果
             current_time: 当前时间戳
+            generation: 发起检索时的缓存代数，与当前代数不一致时说明期间向量库已被清空，不写入缓存
+        """
+        with self._cache_lock:
+            if generation is not None and generation != self._cache_generation:
+                return
+            
+            # 添加新的缓存项
+            self._query_cache[cache_key] = (result, current_time)
+            
+            # 如果缓存大小超过限制，移除最旧的缓存项
+            if len(self._query_cache) > self._CACHE_SIZE:
+                # 找到最旧的缓存项
+                oldest_key = min(self._query_cache.keys(), 
+                               key=lambda k: self._query_cache[k][1])
+                # 移除最旧的缓存项
+                del self._query_cache[oldest_key]
+                logger.debug(f"缓存大小超过限制，移除最旧项: {oldest_key[:50]}...")
+    
+    def _resolve_search_params(self, k: int, score_threshold: Optional[float], rerank: Optional[bool],
+                               rerank_candidates: Optional[int], retrieval_mode: Optional[str]) -> Dict[str, Any]:
+        """补全检索参数缺省值，并计算召回数量和参数部分的缓存键"""
+        # 父子分块模式下先检索更多子片段，映射到父窗口并去重后保留前k个
+        child_k = k
+        if self.config_manager.get('rag.indexing_mode', 'standard') == 'parent_child':
+            child_k = k * max(1, int(self.config_manager.get('rag.parent_fetch_multiplier', 3)))
+        
+        # 启用重排序时先召回更多候选，重排后保留前child_k个
+        if rerank is None:
+            rerank = self.config_manager.get('rag.rerank_enabled', False)
+        fetch_k = child_k
+        if rerank:
+            fetch_k = max(child_k, int(rerank_candidates or self.config_manager.get('rag.rerank_candidates', 20)))
+        
+        retrieval_mode = retrieval_mode or self.config_manager.get('rag.retrieval_mode', 'vector')
+        return {
+            'k': k,
+            'child_k': child_k,
+            'fetch_k': fetch_k,
+            'score_threshold': score_threshold,
+            'rerank': bool(rerank),
+            'retrieval_mode': retrieval_mode,
+            # 缓存键中查询之后的部分：k值、分数阈值、重排序候选数、检索方式和子片段数量
+            'key_suffix': f"{k}:{score_threshold}:{fetch_k if rerank else 0}:{retrieval_mode}:{child_k}"
+        }
+    
+    def _get_cached_result(self, cache_key: str, current_time: float):
+        """读取未过期的缓存结果，返回 (结果或None, 当前缓存代数)"""
+        with self._cache_lock:
+            generation = self._cache_generation
+            cached = self._query_cache.get(cache_key)
+            if cached is not None and current_time - cached[1] >= self._CACHE_TTL:
+                # 缓存过期，移除
+                del self._query_cache[cache_key]
+                logger.debug(f"查询缓存过期: {cache_key[:50]}...")
+                cached = None
+        return (cached[0] if cached is not None else None), generation
+    
+    def _execute_search(self, query: str, params: Dict[str, Any]) -> List[Any]:
+        """不经过缓存直接执行检索"""
+        if self._dimension_mismatch:
+            raise ValueError(self._dimension_mismatch_message())
+        fetch_k = params['fetch_k']
+        score_threshold = params['score_threshold']
+        
+        # 根据检索方式和是否设置了分数阈值选择不同的搜索方法
+        if params['retrieval_mode'] == 'mmr':
+            logger.info(f"执行MMR检索，k={fetch_k}, 分数阈值={score_threshold}")
+            result = self._mmr_search(query, fetch_k, score_threshold)
+            logger.info(f"搜索完成，找到 {len(result)} 个相关文档")
+        elif score_threshold is not None:
+            # 执行带分数的相似性搜索
+            logger.info(f"执行带分数的相似性搜索，k={fetch_k}, 分数阈值={score_threshold}")
+            results_with_scores = self.vector_store.similarity_search_with_score(query, k=fetch_k)
+            
+            # 过滤结果
+            filtered_results = []
+            for doc, score in results_with_scores:
+                if self._to_l2_distance(score) <= score_threshold:
+                    filtered_results.append(doc)
+            
+            logger.info(f"搜索完成，找到 {len(filtered_results)} 个相关文档（分数阈值: {score_threshold}）")
+            result = filtered_results
+        else:
+            # 执行普通相似性搜索
+            logger.info(f"执行普通相似性搜索，k={fetch_k}")
+            results = self.vector_store.similarity_search(query, k=fetch_k)
+            logger.info(f"搜索完成，找到 {len(results)} 个相关文档")
+            result = results
+        
+        if params['rerank']:
+            result = self._rerank(query, result, params['child_k'])
+        return self._expand_to_parents(result, params['k'])
+    
+    def _expand_to_parents(self, documents: List[Any], k: int) -> List[Any]:
+        """把命中的子片段替换为所属的父窗口，同一父窗口只保留排名最前的一次，返回前k个"""
+        parent_ids = [doc.metadata['parent_id'] for doc in documents if (doc.metadata or {}).get('parent_id')]
+        if not parent_ids:
+            return documents[:k]
+        
+        parents = self.parent_store.get_documents(parent_ids)
+        expanded, seen = [], set()
+        for doc in documents:
+            parent_id = (doc.metadata or {}).get('parent_id')
+            # 父窗口缺失（例如旧数据）时保留子片段本身
+            key = parent_id if parent_id in parents else id(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            expanded.append(parents[parent_id] if parent_id in parents else doc)
+            if len(expanded) >= k:
+                break
+        return expanded
+    
+    @staticmethod
+    def _is_prefix_similar(query: str, other: str, min_ratio: float) -> bool:
+        """两个查询的公共前缀是否占较长查询的min_ratio以上（用户输入中的草稿与最终发送的问题）"""
+        query, other = query.strip(), other.strip()
+        if not query or not other:
+            return False
+        if query == other:
+            return True
+        common = len(os.path.commonprefix([query, other]))
+        return common / max(len(query), len(other)) >= min_ratio
+    
+    def _find_prefetched(self, query: str, key_suffix: str, current_time: float):
+        """查找与查询相同或前缀相近的预取结果
+        
+        Returns:
+            tuple: (已完成的结果或None, 匹配到的预取缓存键或None, 预取仍在执行时需要等待的Event或None)
         """
-        # 添加新的缓存项
-        self._query_cache[cache_key] = (result, current_time)
-        
-        # 如果缓存大小超过限制，移除最旧的缓存项
-        if len(self._query_cache) > self._CACHE_SIZE:
-            # 找到最旧的缓存项
-            oldest_key = min(self._query_cache.keys(), 
-                           key=lambda k: self._query_cache[k][1])
-            # 移除最旧的缓存项
-            del self._query_cache[oldest_key]
-            logger.debug(f"缓存大小超过限制，移除最旧项: {oldest_key[:50]}...")
-    
-    def search_documents(self, query: str, k: int = 5, score_threshold: Optional[float] = None) -> List[Any]:
+        min_ratio = float(self.config_manager.get('rag.prefetch_prefix_ratio', 0.8))
+        with self._cache_lock:
+            # 最近的预取优先
+            for prefetched_query, suffix, cache_key in reversed(self._prefetched_queries):
+                if suffix != key_suffix or not self._is_prefix_similar(query, prefetched_query, min_ratio):
+                    continue
+                event = self._prefetch_inflight.get(cache_key)
+                if event is not None:
+                    return None, cache_key, event
+                cached = self._query_cache.get(cache_key)
+                if cached is not None and current_time - cached[1] < self._CACHE_TTL:
+                    return cached[0], cache_key, None
+        return None, None, None
+    
+    def prefetch(self, query: str, k: int = 5, score_threshold: Optional[float] = None,
+                 rerank: Optional[bool] = None, rerank_candidates: Optional[int] = None,
+                 retrieval_mode: Optional[str] = None) -> str:
+        """预取检索：在后台线程中计算查询向量和检索结果并写入查询缓存
+        
+        参数与search_documents一致。用户输入时连续的草稿只保留最新一条等待执行，
+        与正在执行或已缓存的检索相同的草稿直接跳过。
+        
+        Returns:
+            str: cached（已有缓存）、in_flight（正在检索）或 scheduled（已排队）
+        """
+        import time
+        
+        params = self._resolve_search_params(k, score_threshold, rerank, rerank_candidates, retrieval_mode)
+        cache_key = f"{query}:{params['key_suffix']}"
+        cached, _ = self._get_cached_result(cache_key, time.time())
+        with self._cache_lock:
+            self.prefetch_stats['requested'] += 1
+            if cached is not None:
+                return 'cached'
+            if cache_key in self._prefetch_inflight:
+                return 'in_flight'
+            self._prefetch_pending = (cache_key, query, params)
+            if self._prefetch_worker is None or not self._prefetch_worker.is_alive():
+                self._prefetch_worker = threading.Thread(target=self._run_prefetch, name='rag-prefetch', daemon=True)
+                self._prefetch_worker.start()
+        return 'scheduled'
+    
+    def _run_prefetch(self) -> None:
+        """预取线程：依次执行最新的草稿检索，没有待执行的草稿时退出"""
+        import time
+        
+        while True:
+            with self._cache_lock:
+                pending, self._prefetch_pending = self._prefetch_pending, None
+                if pending is None:
+                    self._prefetch_worker = None
+                    return
+                cache_key, query, params = pending
+                if cache_key in self._prefetch_inflight:
+                    continue
+                event = threading.Event()
+                self._prefetch_inflight[cache_key] = event
+                self._prefetched_queries.append((query, params['key_suffix'], cache_key))
+                del self._prefetched_queries[:-self._PREFETCH_HISTORY]
+                generation = self._cache_generation
+                self.prefetch_stats['executed'] += 1
+            try:
+                current_time = time.time()
+                if self.vector_store:
+                    self._update_cache(cache_key, self._execute_search(query, params), current_time, generation)
+            except Exception as e:
+                logger.error(f"预取检索失败: {e}")
+            finally:
+                with self._cache_lock:
+                    self._prefetch_inflight.pop(cache_key, None)
+                event.set()
+    
+    def search_documents(self, query: str, k: int = 5, score_threshold: Optional[float] = None,
+                         rerank: Optional[bool] = None, rerank_candidates: Optional[int] = None,
+                         retrieval_mode: Optional[str] = None) -> List[Any]:
         """搜索相关文档
 
         Args:
             query: 查询文本
             k: 返回结果数量
             score_threshold: 相似度分数阈值，低于该阈值的结果将被过滤
+            rerank: 是否使用交叉编码器重排序，缺省时读取config['rag']['rerank_enabled']
+            rerank_candidates: 重排序前从向量库召回的候选数量
+            retrieval_mode: vector（相似度检索）或 mmr（最大边际相关性），缺省时读取config['rag']['retrieval_mode']
             
         Returns:
             list: 相关文档列表
@@ -408,45 +1263,35 @@ class VectorStoreService:
                 logger.error("搜索失败：向量存储未初始化")
                 return []
             
-            # 构建缓存键：包含查询、k值和分数阈值
-            cache_key = f"{query}:{k}:{score_threshold}"
+            params = self._resolve_search_params(k, score_threshold, rerank, rerank_candidates, retrieval_mode)
+            
+            # 构建缓存键：包含查询、k值、分数阈值、重排序候选数和检索方式
+            cache_key = f"{query}:{params['key_suffix']}"
             current_time = time.time()
             
             # 检查缓存
-            if cache_key in self._query_cache:
-                cached_result, cache_time = self._query_cache[cache_key]
-                # 检查缓存是否过期
-                if current_time - cache_time < self._CACHE_TTL:
-                    logger.debug(f"查询缓存命中: {query[:50]}...")
-                    return cached_result
-                else:
-                    # 缓存过期，移除
-                    del self._query_cache[cache_key]
-                    logger.debug(f"查询缓存过期: {query[:50]}...")
-            
-            # 根据是否设置了分数阈值选择不同的搜索方法
-            if score_threshold is not None:
-                # 执行带分数的相似性搜索
-                logger.info(f"执行带分数的相似性搜索，k={k}, 分数阈值={score_threshold}")
-                results_with_scores = self.vector_store.similarity_search_with_score(query, k=k)
-                
-                # 过滤结果
-                filtered_results = []
-                for doc, score in results_with_scores:
-                    if score <= score_threshold:
-                        filtered_results.append(doc)
-                
-                logger.info(f"搜索完成，找到 {len(filtered_results)} 个相关文档（分数阈值: {score_threshold}）")
-                result = filtered_results
-            else:
-                # 执行普通相似性搜索
-                logger.info(f"执行普通相似性搜索，k={k}")
-                results = self.vector_store.similarity_search(query, k=k)
-                logger.info(f"搜索完成，找到 {len(results)} 个相关文档")
-                result = results
+            cached, generation = self._get_cached_result(cache_key, current_time)
+            if cached is not None:
+                logger.debug(f"查询缓存命中: {query[:50]}...")
+                if any(key == cache_key for _, _, key in self._prefetched_queries):
+                    self.prefetch_stats['exact_hits'] += 1
+                return cached
+            
+            # 检查输入时预取的结果：相同或前缀相近的草稿已检索完成时直接复用，仍在检索时等待其完成
+            prefetched, inflight_key, event = self._find_prefetched(query, params['key_suffix'], current_time)
+            if event is not None:
+                event.wait(self._PREFETCH_WAIT_TIMEOUT)
+                self.prefetch_stats['waited'] += 1
+                prefetched, _ = self._get_cached_result(inflight_key, time.time())
+            if prefetched is not None:
+                self.prefetch_stats['exact_hits' if inflight_key == cache_key else 'prefix_hits'] += 1
+                logger.info(f"使用预取的检索结果: {query[:50]}...")
+                return prefetched
+            
+            result = self._execute_search(query, params)
             
             # 更新缓存
-            self._update_cache(cache_key, result, current_time)
+            self._update_cache(cache_key, result, current_time, generation)
             
             return result
         except Exception as e:
@@ -454,4 +1299,4 @@ class VectorStoreService:
             logger.error(f"错误类型: {type(e).__name__}")
             import traceback
             logger.error(f"错误堆栈: {traceback.format_exc()}")
-            return []
\ No newline at end of file
+            return []
@@ -2,5 +2,6 @@
 from .document_loader import DocumentLoader
 from .text_splitter import TextSplitter
 from .vector_service import VectorService
+from .context_assembler import ContextAssembler
 
-__all__ = ["DocumentLoader", "TextSplitter", "VectorService"]
\ No newline at end of file
+__all__ = ["DocumentLoader", "TextSplitter", "VectorService", "ContextAssembler"]
\ No newline at end of file
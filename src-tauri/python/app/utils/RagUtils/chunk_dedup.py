@@ -0,0 +1,299 @@
+"""片段去重模块 - 入库前用MinHash + LSH找出近似重复的片段，跳过或链接到已存储的片段"""
+import re
+import json
+import zlib
+import hashlib
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import numpy as np
+
+
+class ChunkDeduplicator:
+    """近似重复片段检测器 - 签名、LSH分桶和链接关系持久化在SQLite旁路文件中
+
+    每个片段按字符n-gram计算MinHash签名，签名切成若干段(band)分桶，
+    只有至少一个分桶相同的片段才会比较签名，估计的Jaccard相似度达到阈值即视为重复。
+    link模式下重复片段不嵌入，只记录它与已存储片段的链接；已存储片段所在的文件被删除时，
+    链接到它的片段由调用方重新入库，其他文件的内容不会因此丢失。
+    """
+
+    # 用于计算哈希排列的固定种子，保证签名在多次运行之间一致
+    _SEED = 20240601
+
+    def __init__(self, db_path: str, threshold: float = 0.9, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5):
+        """初始化去重器
+
+        Args:
+            db_path: 旁路SQLite文件路径
+            threshold: 估计的Jaccard相似度达到该值时视为重复
+            num_perm: MinHash签名长度
+            bands: LSH分段数量，num_perm需能被其整除
+            shingle_size: 字符n-gram的长度
+        """
+        if num_perm % bands:
+            raise ValueError('num_perm必须能被bands整除')
+        self.db_path = db_path
+        self.threshold = float(threshold)
+        self.num_perm = int(num_perm)
+        self.bands = int(bands)
+        self.rows = self.num_perm // self.bands
+        self.shingle_size = int(shingle_size)
+        self._lock = threading.RLock()
+
+        rng = np.random.RandomState(self._SEED)
+        # 乘法-移位哈希：(a * x + b) mod 2^64 的高32位，a为64位随机奇数（乘积需要在2^64处回绕）
+        self._a = np.frombuffer(rng.bytes(8 * self.num_perm), dtype=np.uint64) | np.uint64(1)
+        self._b = np.frombuffer(rng.bytes(8 * self.num_perm), dtype=np.uint64)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS dedup_info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            ''')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunk_signatures (
+                chunk_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_signatures_source ON chunk_signatures (source)')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                bucket INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_buckets_bucket ON lsh_buckets (bucket)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_buckets_chunk ON lsh_buckets (chunk_id)')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunk_links (
+                link_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                canonical_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                similarity REAL NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_links_canonical ON chunk_links (canonical_id)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_links_source ON chunk_links (source)')
+
+        self._info = dict(self._conn.execute("SELECT key, value FROM dedup_info").fetchall())
+        if 'linked_chunks' not in self._info:
+            # 旧版本创建的文件没有当前链接数的计数器，统计一次后回填
+            with self._lock:
+                self._set_info({'linked_chunks': self._conn.execute("SELECT COUNT(*) FROM chunk_links").fetchone()[0]})
+
+    @property
+    def initialized(self) -> bool:
+        """签名是否已经与向量库内容对齐"""
+        return self._info.get('initialized') == '1'
+
+    def _set_info(self, values: Dict[str, Any]) -> None:
+        """写入信息和计数器（调用方持有锁）"""
+        self._info.update({key: str(value) for key, value in values.items()})
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO dedup_info (key, value) VALUES (?, ?)",
+                                   [(key, str(value)) for key, value in values.items()])
+
+    def _counter(self, key: str) -> int:
+        return int(self._info.get(key, 0))
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """计算文本的MinHash签名，空文本返回None"""
+        normalized = re.sub(r'\s+', ' ', (text or '').lower()).strip()
+        if not normalized:
+            return None
+        size = self.shingle_size
+        shingles = {normalized[i:i + size] for i in range(max(1, len(normalized) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # 每个排列取所有n-gram哈希的最小值，一次矩阵运算得到整条签名
+        permuted = (hashes[:, None] * self._a[None, :] + self._b[None, :]) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _buckets(self, signature: np.ndarray) -> List[int]:
+        """签名每一段对应的LSH分桶（段序号参与哈希，不同段的分桶互不冲突）"""
+        buckets = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                     digest_size=8, person=band.to_bytes(4, 'little')).digest()
+            buckets.append(int.from_bytes(digest, 'little', signed=True))
+        return buckets
+
+    def _stored_candidates(self, buckets: List[int]) -> Dict[str, np.ndarray]:
+        """查询与分桶相同的已存储片段签名"""
+        placeholders = ','.join('?' * len(buckets))
+        rows = self._conn.execute(f'''
+        SELECT chunk_id, signature FROM chunk_signatures WHERE chunk_id IN (
+            SELECT DISTINCT chunk_id FROM lsh_buckets WHERE bucket IN ({placeholders})
+        )
+        ''', buckets).fetchall()
+        return {chunk_id: np.frombuffer(blob, dtype=np.uint32) for chunk_id, blob in rows}
+
+    def deduplicate(self, documents: List[Any], ids: List[str]) -> Dict[str, Any]:
+        """找出与已存储片段或本批前面片段近似重复的片段
+
+        Args:
+            documents: 待入库的Document列表
+            ids: 与documents一一对应的片段ID
+
+        Returns:
+            dict: keep（保留的下标）、duplicates（(下标, 重复对象的片段ID, 相似度)列表），
+                  以及提交时需要的签名，交给commit在片段成功写入后持久化
+        """
+        keep, duplicates, signatures = [], [], {}
+        batch_buckets = {}  # 本批已保留片段的分桶 -> 片段ID
+        with self._lock:
+            for index, (doc, chunk_id) in enumerate(zip(documents, ids)):
+                signature = self.signature(doc.page_content)
+                if signature is None:
+                    keep.append(index)
+                    continue
+                buckets = self._buckets(signature)
+
+                candidates = self._stored_candidates(buckets)
+                for bucket in buckets:
+                    for other_id in batch_buckets.get(bucket, ()):
+                        candidates[other_id] = signatures[other_id][0]
+
+                best_id, best_similarity = None, 0.0
+                for other_id, other_signature in candidates.items():
+                    similarity = float(np.mean(signature == other_signature))
+                    if similarity > best_similarity:
+                        best_id, best_similarity = other_id, similarity
+
+                if best_id is not None and best_similarity >= self.threshold:
+                    duplicates.append((index, best_id, round(best_similarity, 4)))
+                else:
+                    keep.append(index)
+                    signatures[chunk_id] = (signature, buckets, (doc.metadata or {}).get('source', ''))
+                    for bucket in buckets:
+                        batch_buckets.setdefault(bucket, []).append(chunk_id)
+        return {'keep': keep, 'duplicates': duplicates, 'signatures': signatures}
+
+    def commit(self, documents: List[Any], result: Dict[str, Any], mode: str = 'link') -> Dict[str, int]:
+        """片段写入向量库后持久化签名，并按模式记录重复片段
+
+        Args:
+            documents: 传给deduplicate的Document列表
+            result: deduplicate的返回值
+            mode: link（记录链接，源片段删除时恢复）或 drop（直接丢弃）
+
+        Returns:
+            dict: 本次的 checked、dropped、linked、bytes_saved
+        """
+        saved = sum(len(documents[index].page_content.encode('utf-8')) for index, _, _ in result['duplicates'])
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_signatures (chunk_id, source, signature) VALUES (?, ?, ?)",
+                    [(chunk_id, source, signature.tobytes())
+                     for chunk_id, (signature, _, source) in result['signatures'].items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO lsh_buckets (bucket, chunk_id) VALUES (?, ?)",
+                    [(bucket, chunk_id) for chunk_id, (_, buckets, _) in result['signatures'].items()
+                     for bucket in buckets]
+                )
+                if mode == 'link':
+                    self._conn.executemany(
+                        "INSERT INTO chunk_links (canonical_id, source, similarity, content, metadata) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(canonical_id, (documents[index].metadata or {}).get('source', ''), similarity,
+                          documents[index].page_content, json.dumps(documents[index].metadata or {}, ensure_ascii=False))
+                         for index, canonical_id, similarity in result['duplicates']]
+                    )
+            summary = {
+                'checked': len(documents),
+                'dropped': len(result['duplicates']) if mode != 'link' else 0,
+                'linked': len(result['duplicates']) if mode == 'link' else 0,
+                'bytes_saved': saved
+            }
+            self._set_info({
+                'chunks_checked': self._counter('chunks_checked') + summary['checked'],
+                'chunks_dropped': self._counter('chunks_dropped') + summary['dropped'],
+                'chunks_linked': self._counter('chunks_linked') + summary['linked'],
+                'linked_chunks': self._counter('linked_chunks') + summary['linked'],
+                'bytes_saved': self._counter('bytes_saved') + saved
+            })
+        return summary
+
+    def remove_sources(self, sources: Iterable[str]) -> List[Any]:
+        """删除指定源文件的签名和链接
+
+        Returns:
+            list: 链接到被删除片段、但自身所在文件仍然保留的片段（Document），调用方需要重新入库
+        """
+        from langchain_core.documents import Document
+
+        sources = list(sources)
+        if not sources:
+            return []
+        placeholders = ','.join('?' * len(sources))
+        with self._lock:
+            with self._conn:
+                unlinked = self._conn.execute(f"DELETE FROM chunk_links WHERE source IN ({placeholders})",
+                                              sources).rowcount
+                removed_ids = f"SELECT chunk_id FROM chunk_signatures WHERE source IN ({placeholders})"
+                orphaned = self._conn.execute(
+                    f"SELECT content, metadata FROM chunk_links WHERE canonical_id IN ({removed_ids})", sources
+                ).fetchall()
+                unlinked += self._conn.execute(f"DELETE FROM chunk_links WHERE canonical_id IN ({removed_ids})",
+                                               sources).rowcount
+                self._conn.execute(f"DELETE FROM lsh_buckets WHERE chunk_id IN ({removed_ids})", sources)
+                self._conn.execute(f"DELETE FROM chunk_signatures WHERE source IN ({placeholders})", sources)
+            if unlinked:
+                self._set_info({'linked_chunks': self._counter('linked_chunks') - unlinked})
+        return [Document(page_content=content, metadata=json.loads(metadata)) for content, metadata in orphaned]
+
+    def rebuild(self, records: Iterable[Tuple[str, Dict[str, Any], str]]) -> None:
+        """由向量库中已有的 (片段ID, 元数据, 文本) 重建签名（旧版本的向量库首次去重时使用）"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunk_signatures")
+                self._conn.execute("DELETE FROM lsh_buckets")
+                for chunk_id, metadata, content in records:
+                    signature = self.signature(content)
+                    if signature is None:
+                        continue
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO chunk_signatures (chunk_id, source, signature) VALUES (?, ?, ?)",
+                        (chunk_id, (metadata or {}).get('source', ''), signature.tobytes())
+                    )
+                    self._conn.executemany("INSERT INTO lsh_buckets (bucket, chunk_id) VALUES (?, ?)",
+                                           [(bucket, chunk_id) for bucket in self._buckets(signature)])
+            self._set_info({'initialized': 1})
+
+    def reset(self) -> None:
+        """清空签名、链接和计数器（清空向量库时调用）"""
+        with self._lock:
+            with self._conn:
+                for table in ('chunk_signatures', 'lsh_buckets', 'chunk_links', 'dedup_info'):
+                    self._conn.execute(f"DELETE FROM {table}")
+            self._info = {}
+            self._set_info({'initialized': 1, 'linked_chunks': 0})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """去重统计：累计检查和跳过的片段数、节省的文本字节数，以及当前的链接数（均读取计数器）"""
+        checked = self._counter('chunks_checked')
+        skipped = self._counter('chunks_dropped') + self._counter('chunks_linked')
+        return {
+            'threshold': self.threshold,
+            'chunks_checked': checked,
+            'chunks_dropped': self._counter('chunks_dropped'),
+            'chunks_linked': self._counter('chunks_linked'),
+            'linked_chunks': self._counter('linked_chunks'),
+            'bytes_saved': self._counter('bytes_saved'),
+            'saved_ratio': round(skipped / checked, 4) if checked else 0.0
+        }
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
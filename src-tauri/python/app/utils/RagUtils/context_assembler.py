@@ -0,0 +1,208 @@
+"""上下文组装模块 - 将检索到的文档片段按token预算打包为RAG提示"""
+import os
+import re
+from typing import List, Dict, Any, Optional
+
+# 句子结束位置，用于截断时尽量保留完整句子
+_SENTENCE_END_PATTERN = re.compile(r'[。！？；.!?;\n]')
+
+
+def estimate_tokens(text: str) -> int:
+    """用默认分词器统计文本的token数（分词器不可用时按字符估算）"""
+    from app.services.tokenizer_service import TokenizerService
+    return TokenizerService.count(text)
+
+
+class ContextAssembler:
+    """RAG上下文组装器 - 合并相邻片段、去除近似重复片段，并在token预算内按来源排列"""
+
+    # 判定为近似重复的字符n-gram Jaccard相似度阈值
+    DUPLICATE_THRESHOLD = 0.9
+    # 截断时剩余预算低于该值则不再截断加入
+    MIN_TRUNCATED_TOKENS = 64
+
+    @staticmethod
+    def assemble(documents: List[Any], token_budget: int = 1500) -> Dict[str, Any]:
+        """将检索结果组装为上下文
+
+        Args:
+            documents: 按相关度降序排列的Document列表
+            token_budget: 上下文可使用的token数
+
+        Returns:
+            dict: 包含上下文文本、token估算和打包统计的字典
+        """
+        result = {
+            'context': '',
+            'tokens': 0,
+            'retrieved_chunks': len(documents),
+            'merged_blocks': 0,
+            'duplicates_removed': 0,
+            'blocks_used': 0,
+            'truncated': False
+        }
+        if not documents:
+            return result
+
+        unique = ContextAssembler._deduplicate(documents)
+        result['duplicates_removed'] = len(documents) - len(unique)
+
+        blocks = ContextAssembler._merge_adjacent(unique)
+        result['merged_blocks'] = len(blocks)
+
+        packed = ContextAssembler._pack(blocks, token_budget, result)
+        result['blocks_used'] = len(packed)
+        result['context'] = ContextAssembler._format(packed)
+        result['tokens'] = estimate_tokens(result['context'])
+        return result
+
+    @staticmethod
+    def _shingles(text: str, n: int = 5) -> set:
+        """生成去除空白后的字符n-gram集合"""
+        normalized = re.sub(r'\s+', '', text).lower()
+        if len(normalized) <= n:
+            return {normalized}
+        return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+    @staticmethod
+    def _deduplicate(documents: List[Any]) -> List[Dict[str, Any]]:
+        """去除近似重复的片段，保留相关度更高（排在前面）的一个"""
+        kept = []
+        for rank, doc in enumerate(documents):
+            shingles = ContextAssembler._shingles(doc.page_content)
+            duplicate = False
+            for item in kept:
+                union = len(shingles | item['shingles'])
+                if union and len(shingles & item['shingles']) / union >= ContextAssembler.DUPLICATE_THRESHOLD:
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append({'doc': doc, 'rank': rank, 'shingles': shingles})
+        return kept
+
+    @staticmethod
+    def _merge_adjacent(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """合并同一来源中重叠或相邻的片段
+
+        依据分割时记录的start_index定位片段，重叠部分只保留一次；
+        没有start_index的旧片段不参与合并。
+        """
+        groups = {}
+        blocks = []
+        for item in items:
+            metadata = item['doc'].metadata or {}
+            if metadata.get('start_index') is None:
+                blocks.append(ContextAssembler._new_block(item))
+                continue
+            key = (metadata.get('source', ''), metadata.get('page'))
+            groups.setdefault(key, []).append(item)
+
+        for group in groups.values():
+            group.sort(key=lambda x: x['doc'].metadata['start_index'])
+            current = None
+            for item in group:
+                start = int(item['doc'].metadata['start_index'])
+                text = item['doc'].page_content
+                if current is not None and start <= current['end']:
+                    # 与前一块重叠或紧邻：跳过重叠部分后拼接
+                    overlap = current['end'] - start
+                    if overlap < len(text):
+                        current['text'] += text[overlap:]
+                        current['end'] = start + len(text)
+                    current['rank'] = min(current['rank'], item['rank'])
+                    current['chunks'] += 1
+                    continue
+                current = ContextAssembler._new_block(item)
+                blocks.append(current)
+
+        return blocks
+
+    @staticmethod
+    def _new_block(item: Dict[str, Any]) -> Dict[str, Any]:
+        """由单个片段创建文本块"""
+        metadata = item['doc'].metadata or {}
+        start = int(metadata.get('start_index') or 0)
+        return {
+            'text': item['doc'].page_content,
+            'source': metadata.get('source', ''),
+            'page': metadata.get('page'),
+            'start': start,
+            'end': start + len(item['doc'].page_content),
+            'rank': item['rank'],
+            'chunks': 1,
+            'doc': item['doc']
+        }
+
+    @staticmethod
+    def _pack(blocks: List[Dict[str, Any]], token_budget: int, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """按相关度依次放入预算，放不下的块在句子边界处截断"""
+        ContextAssembler._count_blocks(blocks)
+        packed = []
+        remaining = token_budget
+        for block in sorted(blocks, key=lambda b: b['rank']):
+            cost = block['tokens'] + estimate_tokens(ContextAssembler._header(block)) + 1
+            if cost <= remaining:
+                packed.append(block)
+                remaining -= cost
+                continue
+            if remaining >= ContextAssembler.MIN_TRUNCATED_TOKENS:
+                header_cost = estimate_tokens(ContextAssembler._header(block)) + 1
+                truncated = ContextAssembler._truncate(block['text'], remaining - header_cost)
+                if truncated:
+                    packed.append(dict(block, text=truncated))
+                    result['truncated'] = True
+                break
+            # 剩余预算不足以截断加入，继续尝试后面更短的块
+        return packed
+
+    @staticmethod
+    def _count_blocks(blocks: List[Dict[str, Any]]) -> None:
+        """统计各文本块的token数：单个片段直接使用入库时记录的计数，合并后的块批量统计"""
+        from app.services.tokenizer_service import TokenizerService
+
+        single = [block for block in blocks if block['chunks'] == 1]
+        for block, count in zip(single, TokenizerService.document_tokens([block['doc'] for block in single])):
+            block['tokens'] = count
+        merged = [block for block in blocks if block['chunks'] > 1]
+        for block, count in zip(merged, TokenizerService.count_batch([block['text'] for block in merged])):
+            block['tokens'] = count
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> Optional[str]:
+        """截断到max_tokens以内，优先在句子结束处截断"""
+        if max_tokens <= 0:
+            return None
+        from app.services.tokenizer_service import TokenizerService
+
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            # 试探的前缀只用一次，不写入token数缓存
+            if TokenizerService.count(text[:mid], cache=False) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        cut = text[:low]
+        boundaries = [m.end() for m in _SENTENCE_END_PATTERN.finditer(cut)]
+        if boundaries and boundaries[-1] >= len(cut) // 2:
+            cut = cut[:boundaries[-1]]
+        return cut.strip() or None
+
+    @staticmethod
+    def _header(block: Dict[str, Any]) -> str:
+        """文本块的来源标注"""
+        header = f"来源：{os.path.basename(block['source']) or '未知'}"
+        if block['page'] is not None:
+            header += f" 第{int(block['page']) + 1}页"
+        return header
+
+    @staticmethod
+    def _format(blocks: List[Dict[str, Any]]) -> str:
+        """按来源分组输出：来源按最相关块的排名排序，同一来源内按原文位置排序"""
+        best_rank = {}
+        for block in blocks:
+            best_rank[block['source']] = min(best_rank.get(block['source'], block['rank']), block['rank'])
+        ordered = sorted(blocks, key=lambda b: (best_rank[b['source']], b['source'],
+                                                 b['page'] if b['page'] is not None else -1, b['start']))
+        return "\n\n".join(f"[{i + 1}] {ContextAssembler._header(block)}\n{block['text'].strip()}"
+                           for i, block in enumerate(ordered))
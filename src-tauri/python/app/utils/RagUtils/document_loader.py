@@ -2,17 +2,16 @@
 import os
 import time
 from typing import List, Dict, Any
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, Docx2txtLoader
 
 class DocumentLoader:
     """文档加载器类 - 处理各种格式文档的加载"""
     
-    # 支持的文件扩展名及其对应的加载器
+    # 支持的文件扩展名及其对应的加载器（langchain_community导入较慢，首次加载文档时才导入）
     SUPPORTED_EXTENSIONS = {
-        'txt': TextLoader,
-        'pdf': PyPDFLoader,
-        'doc': Docx2txtLoader,
-        'docx': Docx2txtLoader
+        'txt': 'TextLoader',
+        'pdf': 'PyPDFLoader',
+        'doc': 'Docx2txtLoader',
+        'docx': 'Docx2txtLoader'
     }
     
     # 文档缓存，格式: {file_path: (mtime, document_info)}
@@ -46,7 +45,8 @@ class DocumentLoader:
         try:
             # 根据文件类型选择合适的加载器
             if file_extension in DocumentLoader.SUPPORTED_EXTENSIONS:
-                loader_class = DocumentLoader.SUPPORTED_EXTENSIONS[file_extension]
+                from langchain_community import document_loaders
+                loader_class = getattr(document_loaders, DocumentLoader.SUPPORTED_EXTENSIONS[file_extension])
                 
                 # TextLoader需要指定编码
                 if file_extension == 'txt':
@@ -0,0 +1,285 @@
+"""嵌入后端模块 - 提供可插拔的嵌入模型推理后端（PyTorch / ONNX Runtime）"""
+import os
+import json
+import logging
+from typing import List, Dict, Any, Optional
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxEmbeddings(Embeddings):
+    """基于ONNX Runtime的嵌入模型 - 支持int8动态量化导出，适合纯CPU推理"""
+
+    def __init__(self, model_dir: str, pooling: str = 'mean', intra_op_threads: int = 0,
+                 batch_size: int = 32, max_length: int = 512, model_file: str = 'model.onnx'):
+        """初始化ONNX嵌入模型
+
+        Args:
+            model_dir: 已导出的ONNX模型目录（包含分词器文件）
+            pooling: 池化方式，支持 mean / cls / lasttoken
+            intra_op_threads: 单个算子内部使用的线程数，0 表示由onnxruntime自动决定
+            batch_size: 每批推理的文本数量
+            max_length: 分词后的最大长度
+            model_file: 模型文件名
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.pooling = pooling
+        self.batch_size = max(1, int(batch_size))
+        self.max_length = max_length
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            session_options.intra_op_num_threads = int(intra_op_threads)
+
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=session_options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """批量编码文本，按长度排序分批以减少padding开销"""
+        import numpy as np
+
+        if not texts:
+            return []
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        for start in range(0, len(order), self.batch_size):
+            batch_indices = order[start:start + self.batch_size]
+            batch_texts = [texts[i] for i in batch_indices]
+
+            encoded = self.tokenizer(
+                batch_texts,
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='np'
+            )
+            attention_mask = encoded['attention_mask'].astype(np.int64)
+
+            feeds = {}
+            for name in self.input_names:
+                if name in encoded:
+                    feeds[name] = encoded[name].astype(np.int64)
+                elif name == 'position_ids':
+                    feeds[name] = np.clip(np.cumsum(attention_mask, axis=1) - 1, 0, None)
+            hidden_states = self.session.run(None, feeds)[0]
+
+            vectors = self._pool(hidden_states, attention_mask)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.clip(norms, 1e-12, None)
+
+            for idx, vector in zip(batch_indices, vectors):
+                results[idx] = vector.astype(np.float32).tolist()
+
+        return results
+
+    def _pool(self, hidden_states, attention_mask):
+        """根据池化方式将token向量聚合为句向量"""
+        import numpy as np
+
+        if self.pooling == 'cls':
+            return hidden_states[:, 0]
+        if self.pooling == 'lasttoken':
+            # 兼容左右两种padding：取每行最后一个有效token
+            last = attention_mask.shape[1] - 1 - np.argmax(attention_mask[:, ::-1], axis=1)
+            return hidden_states[np.arange(hidden_states.shape[0]), last]
+
+        mask = attention_mask[..., None].astype(hidden_states.dtype)
+        return (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入文档列表"""
+        return self._encode(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入查询文本"""
+        return self._encode([text])[0]
+
+
+class TruncatedEmbeddings(Embeddings):
+    """Matryoshka维度截断包装器 - 截取前dimension维并重新归一化，索引和查询共用同一实例保证一致"""
+
+    def __init__(self, base: Embeddings, dimension: int):
+        """初始化截断包装器
+
+        Args:
+            base: 输出完整维度向量的嵌入模型
+            dimension: 截断后的维度
+        """
+        self.base = base
+        self.dimension = int(dimension)
+
+    def _truncate(self, vectors: List[List[float]]) -> List[List[float]]:
+        """截断并重新归一化"""
+        import numpy as np
+
+        if not vectors:
+            return []
+        matrix = np.asarray(vectors, dtype=np.float32)[:, :self.dimension]
+        matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+        return matrix.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入文档列表"""
+        return self._truncate(self.base.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入查询文本"""
+        return self._truncate([self.base.embed_query(text)])[0]
+
+
+class EmbeddingBackend:
+    """嵌入后端工厂类 - 根据配置创建对应的嵌入模型实例"""
+
+    # 支持的后端名称
+    SUPPORTED_BACKENDS = ['pytorch', 'onnx']
+
+    # 导出目录中记录导出信息的文件名
+    _EXPORT_INFO_FILE = 'neovai_onnx.json'
+
+    @staticmethod
+    def create(model_path: str, backend: str = 'pytorch', cache_folder: Optional[str] = None,
+               export_root: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> Embeddings:
+        """创建嵌入模型实例
+
+        Args:
+            model_path: 本地模型路径或HuggingFace模型名称
+            backend: 推理后端，pytorch 或 onnx
+            cache_folder: HuggingFace下载缓存目录
+            export_root: ONNX导出模型的根目录
+            options: 后端参数（batch_size、dimension、onnx_quantize、onnx_intra_op_threads）
+
+        Returns:
+            Embeddings: LangChain兼容的嵌入模型实例
+        """
+        options = options or {}
+        embeddings = EmbeddingBackend._create_base(model_path, backend, cache_folder, export_root, options)
+
+        dimension = int(options.get('dimension') or 0)
+        if dimension > 0:
+            embeddings = TruncatedEmbeddings(embeddings, dimension)
+        return embeddings
+
+    @staticmethod
+    def _create_base(model_path: str, backend: str, cache_folder: Optional[str],
+                     export_root: Optional[str], options: Dict[str, Any]) -> Embeddings:
+        """创建输出完整维度向量的嵌入模型实例"""
+        backend = (backend or 'pytorch').lower()
+        if backend not in EmbeddingBackend.SUPPORTED_BACKENDS:
+            raise ValueError(f'不支持的嵌入后端: {backend}')
+
+        batch_size = int(options.get('batch_size', 32))
+
+        if backend == 'onnx':
+            export_dir = EmbeddingBackend.export_onnx(
+                model_path,
+                export_root or os.path.join(cache_folder or '.', 'onnx'),
+                quantize=options.get('onnx_quantize', True),
+                cache_folder=cache_folder
+            )
+            with open(os.path.join(export_dir, EmbeddingBackend._EXPORT_INFO_FILE), 'r', encoding='utf-8') as f:
+                export_info = json.load(f)
+            return OnnxEmbeddings(
+                export_dir,
+                pooling=export_info.get('pooling', 'mean'),
+                intra_op_threads=options.get('onnx_intra_op_threads', 0),
+                batch_size=batch_size,
+                model_file=export_info.get('model_file', 'model.onnx')
+            )
+
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        kwargs = {
+            'model_name': model_path,
+            'model_kwargs': {'device': 'cpu'},
+            'encode_kwargs': {'normalize_embeddings': True, 'batch_size': batch_size}
+        }
+        if cache_folder:
+            kwargs['cache_folder'] = cache_folder
+        return HuggingFaceEmbeddings(**kwargs)
+
+    @staticmethod
+    def export_onnx(model_path: str, export_root: str, quantize: bool = True,
+                    cache_folder: Optional[str] = None) -> str:
+        """将模型导出为ONNX格式（可选int8动态量化），已导出时直接复用
+
+        Args:
+            model_path: 本地模型路径或HuggingFace模型名称
+            export_root: 导出根目录
+            quantize: 是否进行int8动态量化
+            cache_folder: HuggingFace下载缓存目录
+
+        Returns:
+            str: 导出后的模型目录
+        """
+        slug = os.path.basename(os.path.normpath(model_path)) if os.path.exists(model_path) \
+            else model_path.replace('/', '--')
+        export_dir = os.path.join(export_root, f"{slug}-{'int8' if quantize else 'fp32'}")
+        info_path = os.path.join(export_dir, EmbeddingBackend._EXPORT_INFO_FILE)
+        if os.path.exists(info_path):
+            return export_dir
+
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        logger.info(f"导出ONNX嵌入模型: {model_path} -> {export_dir}")
+        os.makedirs(export_dir, exist_ok=True)
+        model = ORTModelForFeatureExtraction.from_pretrained(model_path, export=True, cache_dir=cache_folder)
+        model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(model_path, cache_dir=cache_folder).save_pretrained(export_dir)
+
+        model_file = 'model.onnx'
+        if quantize:
+            import platform
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            if platform.machine().lower() in ('arm64', 'aarch64'):
+                qconfig = AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+            else:
+                qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=model_file)
+            quantizer.quantize(save_dir=export_dir, quantization_config=qconfig)
+            model_file = 'model_quantized.onnx'
+
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'source_model': model_path,
+                'model_file': model_file,
+                'quantized': bool(quantize),
+                'pooling': EmbeddingBackend._detect_pooling(model_path, cache_folder)
+            }, f, ensure_ascii=False, indent=2)
+
+        return export_dir
+
+    @staticmethod
+    def _detect_pooling(model_path: str, cache_folder: Optional[str] = None) -> str:
+        """读取sentence-transformers的池化配置，确保与PyTorch路径的向量一致"""
+        config_path = os.path.join(model_path, '1_Pooling', 'config.json')
+        if not os.path.exists(config_path):
+            try:
+                from huggingface_hub import hf_hub_download
+                config_path = hf_hub_download(model_path, '1_Pooling/config.json', cache_dir=cache_folder)
+            except Exception:
+                return 'mean'
+
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                pooling_config = json.load(f)
+        except Exception:
+            return 'mean'
+
+        if pooling_config.get('pooling_mode_lasttoken'):
+            return 'lasttoken'
+        if pooling_config.get('pooling_mode_cls_token'):
+            return 'cls'
+        return 'mean'
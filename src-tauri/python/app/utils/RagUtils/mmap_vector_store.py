@@ -0,0 +1,544 @@
+"""内存映射向量库模块 - 进程内的轻量级向量存储引擎"""
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import threading
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# 字节的置位数查找表（numpy<2.0 没有 np.bitwise_count 时使用）
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """按字节计算置位数"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values]
+
+
+class MmapVectorStore:
+    """内存映射向量库 - 向量以连续float32矩阵追加写入文件并通过内存映射检索，
+    文本和元数据保存在SQLite旁路文件中
+
+    检索使用NumPy矩阵乘法加argpartition，返回的分数与Chroma默认的l2空间一致
+    （归一化向量的平方欧氏距离），因此score_threshold的含义保持不变。
+
+    启用量化时，内存中只常驻int8（每维1字节）或1-bit符号码（每维1位）的压缩码，
+    先用压缩码对全库做粗排，再从磁盘上的全精度向量中读取候选行做精确重排。
+    """
+
+    VECTORS_FILE = 'vectors.f32'
+    METADATA_FILE = 'metadata.db'
+
+    # 支持的量化模式及其压缩码文件
+    QUANTIZATION_MODES = ('none', 'int8', 'binary')
+    CODES_FILES = {
+        'int8': 'codes.i8',
+        'binary': 'codes.b1'
+    }
+    INT8_SCALES_FILE = 'codes.scale.f32'
+
+    # 清空时旧数据文件移入的回收目录前缀
+    TRASH_PREFIX = '.trash-'
+
+    # 粗排时每次处理的行数，限制压缩码转换带来的临时内存
+    _SCAN_BLOCK_ROWS = 65536
+
+    def __init__(self, persist_directory: str, embedding_function, quantization: str = 'none',
+                 rescore_multiplier: int = 4, dimension: Optional[int] = None):
+        """初始化向量库
+
+        Args:
+            persist_directory: 存储目录
+            embedding_function: LangChain兼容的嵌入模型
+            quantization: 量化模式，none / int8 / binary
+            rescore_multiplier: 量化粗排时召回 k * rescore_multiplier 个候选再精确重排
+            dimension: 期望的向量维度，与已记录的维度不一致时拒绝打开
+        """
+        if quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(f'不支持的向量量化模式: {quantization}')
+
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self.rescore_multiplier = max(1, int(rescore_multiplier))
+        self._configured_dimension = int(dimension) if dimension else None
+        self._lock = threading.RLock()
+
+        os.makedirs(persist_directory, exist_ok=True)
+        self._purge_trash()
+        self._vectors_path = os.path.join(persist_directory, self.VECTORS_FILE)
+        self._conn = sqlite3.connect(os.path.join(persist_directory, self.METADATA_FILE), check_same_thread=False)
+        self._init_schema()
+
+        self._dimension = self._get_info('dimension')
+        self._dimension = int(self._dimension) if self._dimension else None
+        if dimension:
+            if self._dimension is None:
+                with self._conn:
+                    self._set_info('dimension', int(dimension))
+                self._dimension = int(dimension)
+            elif self._dimension != int(dimension):
+                self._conn.close()
+                raise ValueError(f'向量库记录的维度为 {self._dimension}，与配置的 {dimension} 不一致，请重建向量库')
+        self._matrix = None  # 懒加载的内存映射矩阵
+        self._live = np.zeros(0, dtype=bool)  # 每行是否有效（未删除）
+        self._codes = None  # 常驻内存的量化压缩码
+        self._code_scales = None  # int8量化的每行缩放系数
+        self._recover()
+        self._load_codes()
+
+    def _data_files(self) -> List[str]:
+        """全部数据文件名"""
+        return [self.VECTORS_FILE, self.METADATA_FILE, self.INT8_SCALES_FILE, *self.CODES_FILES.values()]
+
+    def _purge_trash(self) -> None:
+        """删除上次清空后未删完的回收目录（例如后台删除过程中进程退出）"""
+        for name in os.listdir(self.persist_directory):
+            if name.startswith(self.TRASH_PREFIX):
+                shutil.rmtree(os.path.join(self.persist_directory, name), ignore_errors=True)
+
+    def _init_schema(self) -> None:
+        """创建元数据表结构"""
+        with self._conn:
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS store_info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            ''')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT,
+                deleted INTEGER DEFAULT 0
+            )
+            ''')
+
+    def _get_info(self, key: str) -> Optional[str]:
+        """读取存储信息"""
+        row = self._conn.execute("SELECT value FROM store_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value: Any) -> None:
+        """写入存储信息（调用方负责提交事务）"""
+        self._conn.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _recover(self) -> None:
+        """启动时对齐向量文件与元数据：截断未提交的追加写入，加载删除标记"""
+        committed_rows = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+
+        if self._dimension and os.path.exists(self._vectors_path):
+            row_bytes = self._dimension * 4
+            file_rows = os.path.getsize(self._vectors_path) // row_bytes
+            if file_rows != committed_rows or os.path.getsize(self._vectors_path) % row_bytes:
+                # 追加日志中存在未提交的尾部数据（例如写入过程中进程退出），截断到已提交的行数
+                logger.warning(f"向量文件行数({file_rows})与元数据({committed_rows})不一致，截断到已提交部分")
+                committed_rows = min(file_rows, committed_rows)
+                with open(self._vectors_path, 'r+b') as f:
+                    f.truncate(committed_rows * row_bytes)
+                with self._conn:
+                    self._conn.execute("DELETE FROM chunks WHERE row >= ?", (committed_rows,))
+
+        self._live = np.ones(committed_rows, dtype=bool)
+        deleted_rows = [r[0] for r in self._conn.execute("SELECT row FROM chunks WHERE deleted = 1")]
+        if deleted_rows:
+            self._live[deleted_rows] = False
+
+    @property
+    def matrix(self):
+        """获取向量矩阵的内存映射视图（追加写入后自动刷新）"""
+        rows = len(self._live)
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            if rows == 0 or not self._dimension:
+                self._matrix = np.zeros((0, self._dimension or 0), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                         shape=(rows, self._dimension))
+        return self._matrix
+
+    def _code_row_bytes(self) -> int:
+        """每行压缩码占用的字节数"""
+        if self.quantization == 'binary':
+            return (self._dimension + 7) // 8
+        return self._dimension
+
+    def _encode_codes(self, vectors: np.ndarray):
+        """将归一化向量编码为压缩码
+
+        Returns:
+            tuple: (压缩码, int8缩放系数或None)
+        """
+        if self.quantization == 'binary':
+            return np.packbits(vectors > 0, axis=1), None
+
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.clip(scales, 1e-12, None).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+
+    def _append_codes(self, codes: np.ndarray, scales: Optional[np.ndarray]) -> None:
+        """追加压缩码到文件"""
+        with open(os.path.join(self.persist_directory, self.CODES_FILES[self.quantization]), 'ab') as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(os.path.join(self.persist_directory, self.INT8_SCALES_FILE), 'ab') as f:
+                f.write(scales.tobytes())
+
+    def _load_codes(self) -> None:
+        """加载压缩码到内存；切换量化模式后缺失的部分从全精度向量回填"""
+        if self.quantization == 'none' or not self._dimension:
+            return
+
+        rows = len(self._live)
+        row_bytes = self._code_row_bytes()
+        codes_path = os.path.join(self.persist_directory, self.CODES_FILES[self.quantization])
+        scales_path = os.path.join(self.persist_directory, self.INT8_SCALES_FILE)
+        code_dtype = np.int8 if self.quantization == 'int8' else np.uint8
+
+        stored_rows = os.path.getsize(codes_path) // row_bytes if os.path.exists(codes_path) else 0
+        if self.quantization == 'int8':
+            scale_rows = os.path.getsize(scales_path) // 4 if os.path.exists(scales_path) else 0
+            stored_rows = min(stored_rows, scale_rows)
+        stored_rows = min(stored_rows, rows)
+
+        # 截断未提交的尾部数据
+        if os.path.exists(codes_path):
+            with open(codes_path, 'r+b') as f:
+                f.truncate(stored_rows * row_bytes)
+        if self.quantization == 'int8' and os.path.exists(scales_path):
+            with open(scales_path, 'r+b') as f:
+                f.truncate(stored_rows * 4)
+
+        if stored_rows < rows:
+            logger.info(f"回填 {rows - stored_rows} 行{self.quantization}压缩码")
+            matrix = self.matrix
+            for start in range(stored_rows, rows, self._SCAN_BLOCK_ROWS):
+                block = np.asarray(matrix[start:min(start + self._SCAN_BLOCK_ROWS, rows)])
+                self._append_codes(*self._encode_codes(block))
+
+        self._codes = np.fromfile(codes_path, dtype=code_dtype).reshape(rows, row_bytes) \
+            if rows else np.zeros((0, row_bytes), dtype=code_dtype)
+        if self.quantization == 'int8':
+            self._code_scales = np.fromfile(scales_path, dtype=np.float32) if rows else np.zeros(0, dtype=np.float32)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        """转换为float32并做L2归一化"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """嵌入并追加文档片段
+
+        Args:
+            documents: 文档片段列表
+            ids: 片段ID列表，缺省时自动生成
+
+        Returns:
+            list: 新增片段的ID列表
+        """
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata or {} for doc in documents]
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    def add_embeddings(self, texts: List[str], vectors, metadatas: Optional[List[Dict[str, Any]]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        """追加已计算好的向量
+
+        Args:
+            texts: 文本列表
+            vectors: 与文本一一对应的向量
+            metadatas: 元数据列表
+            ids: 片段ID列表，缺省时自动生成
+
+        Returns:
+            list: 片段ID列表
+        """
+        if not texts:
+            return []
+        vectors = self._normalize(vectors)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        with self._lock:
+            if self._dimension is None:
+                self._dimension = int(vectors.shape[1])
+                with self._conn:
+                    self._set_info('dimension', self._dimension)
+            elif vectors.shape[1] != self._dimension:
+                raise ValueError(f'向量维度不匹配: 期望 {self._dimension}，实际 {vectors.shape[1]}')
+
+            start_row = len(self._live)
+            # 先追加向量再提交元数据，进程中断时由_recover截断未提交部分
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            if self.quantization != 'none':
+                if self._codes is None:
+                    self._load_codes()
+                codes, scales = self._encode_codes(vectors)
+                self._append_codes(codes, scales)
+
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, id, content, metadata) VALUES (?, ?, ?, ?)",
+                    [(start_row + i, ids[i], texts[i], json.dumps(metadatas[i], ensure_ascii=False))
+                     for i in range(len(texts))]
+                )
+
+            self._live = np.concatenate([self._live, np.ones(len(texts), dtype=bool)])
+            if self.quantization != 'none':
+                self._codes = np.concatenate([self._codes, codes]) if len(self._codes) else codes
+                if scales is not None:
+                    self._code_scales = np.concatenate([self._code_scales, scales])
+
+        return ids
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """从分数向量中取出分数最高的k个行号（按分数降序）"""
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        return top[np.argsort(-scores[top])]
+
+    def _load_documents(self, rows: List[int]) -> Dict[int, Document]:
+        """按行号批量读取文档"""
+        if not rows:
+            return {}
+        placeholders = ','.join('?' * len(rows))
+        with self._lock:
+            records = self._conn.execute(
+                f"SELECT row, id, content, metadata FROM chunks WHERE row IN ({placeholders})",
+                [int(r) for r in rows]
+            ).fetchall()
+        return {
+            row: Document(page_content=content, metadata=json.loads(metadata) if metadata else {}, id=doc_id)
+            for row, doc_id, content, metadata in records
+        }
+
+    def _approximate_scores(self, query: np.ndarray, codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+        """用压缩码分块计算近似相似度（越大越相似）"""
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+
+        if self.quantization == 'binary':
+            query_bits = np.packbits(query > 0)
+            for start in range(0, codes.shape[0], self._SCAN_BLOCK_ROWS):
+                block = codes[start:start + self._SCAN_BLOCK_ROWS]
+                # 汉明距离越小越相似，取负数作为分数
+                scores[start:start + len(block)] = -_popcount(np.bitwise_xor(block, query_bits)).sum(axis=1, dtype=np.int32)
+            return scores
+
+        for start in range(0, codes.shape[0], self._SCAN_BLOCK_ROWS):
+            block = codes[start:start + self._SCAN_BLOCK_ROWS]
+            scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+        return scores
+
+    def _search_rows(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """检索最相似的k行
+
+        Returns:
+            tuple: (行号数组, 精确余弦相似度数组)，按相似度降序
+        """
+        with self._lock:
+            matrix = self.matrix
+            live = self._live
+            codes = self._codes
+            scales = self._code_scales
+        if matrix.shape[0] == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        if self.quantization == 'none':
+            scores = matrix @ query
+            scores = np.where(live[:len(scores)], scores, -np.inf)
+            rows = np.array([r for r in self._top_k(scores, k) if np.isfinite(scores[r])], dtype=np.int64)
+            return rows, scores[rows]
+
+        # 第一阶段：压缩码粗排，召回 k * rescore_multiplier 个候选
+        approx = self._approximate_scores(query, codes, scales)
+        approx = np.where(live[:len(approx)], approx, -np.inf)
+        candidates = self._top_k(approx, k * self.rescore_multiplier)
+        candidates = np.sort(candidates[np.isfinite(approx[candidates])])
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+
+        # 第二阶段：按行号顺序读取候选的全精度向量做精确重排
+        exact = np.asarray(matrix[candidates]) @ query
+        order = np.argsort(-exact)[:k]
+        return candidates[order], exact[order]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4) -> List[Tuple[Document, float]]:
+        """按查询向量检索，返回(文档, 距离)列表，距离越小越相似"""
+        rows, sims = self._search_rows(self._normalize(embedding)[0], k)
+        documents = self._load_documents([int(r) for r in rows])
+        # 归一化向量的平方欧氏距离 = 2 - 2 * 余弦相似度，与Chroma默认的l2空间一致
+        return [(documents[int(r)], float(2.0 - 2.0 * sim)) for r, sim in zip(rows, sims) if int(r) in documents]
+
+    def similarity_search_with_vectors(self, embedding, k: int = 4) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        """按查询向量检索，同时返回候选的全精度向量（供MMR等需要候选向量的检索方式使用）
+
+        Returns:
+            tuple: ((文档, 距离)列表, 与列表一一对应的向量矩阵)
+        """
+        rows, sims = self._search_rows(self._normalize(embedding)[0], k)
+        documents = self._load_documents([int(r) for r in rows])
+        kept = [i for i, r in enumerate(rows) if int(r) in documents]
+        pairs = [(documents[int(rows[i])], float(2.0 - 2.0 * sims[i])) for i in kept]
+        if not kept:
+            return pairs, np.zeros((0, self._dimension or 0), dtype=np.float32)
+        return pairs, np.asarray(self.matrix[rows[kept]])
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """按查询文本检索，返回(文档, 距离)列表"""
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """按查询文本检索，仅返回文档"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def delete(self, ids: Optional[List[str]] = None) -> None:
+        """按ID标记删除片段（向量文件保持追加写入，不做原地修改）"""
+        if not ids:
+            return
+        placeholders = ','.join('?' * len(ids))
+        with self._lock:
+            rows = [r[0] for r in self._conn.execute(
+                f"SELECT row FROM chunks WHERE id IN ({placeholders})", list(ids))]
+            with self._conn:
+                self._conn.execute(f"UPDATE chunks SET deleted = 1 WHERE id IN ({placeholders})", list(ids))
+            if rows:
+                self._live[rows] = False
+
+    def delete_by_source(self, sources: List[str]) -> int:
+        """按元数据中的source标记删除片段
+
+        Returns:
+            int: 删除的片段数量
+        """
+        if not sources:
+            return 0
+        placeholders = ','.join('?' * len(sources))
+        with self._lock:
+            rows = [r[0] for r in self._conn.execute(
+                f"SELECT row FROM chunks WHERE deleted = 0 AND json_extract(metadata, '$.source') IN ({placeholders})",
+                list(sources))]
+            if rows:
+                with self._conn:
+                    self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+                self._live[rows] = False
+        return len(rows)
+
+    def existing_ids(self, ids: List[str]) -> set:
+        """返回ids中仍然有效（未删除）的片段ID"""
+        if not ids:
+            return set()
+        placeholders = ','.join('?' * len(ids))
+        with self._lock:
+            return {r[0] for r in self._conn.execute(
+                f"SELECT id FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", list(ids))}
+
+    def row_count(self) -> int:
+        """已写入的行数（包括已标记删除的行）"""
+        return len(self._live)
+
+    def iter_records(self, page_size: int = 5000, max_row: Optional[int] = None):
+        """按行号分页遍历有效片段
+
+        Args:
+            page_size: 每页读取的行数
+            max_row: 只遍历行号小于max_row的片段，用于固定遍历开始时的快照
+
+        Yields:
+            tuple: (片段ID, 元数据, 文本)
+        """
+        last_row = -1
+        max_row = len(self._live) if max_row is None else max_row
+        while True:
+            with self._lock:
+                records = self._conn.execute(
+                    "SELECT row, id, content, metadata FROM chunks "
+                    "WHERE deleted = 0 AND row > ? AND row < ? ORDER BY row LIMIT ?",
+                    (last_row, max_row, page_size)
+                ).fetchall()
+            if not records:
+                return
+            for _, doc_id, content, metadata in records:
+                yield doc_id, (json.loads(metadata) if metadata else {}), content
+            last_row = records[-1][0]
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """向量库记录的向量维度"""
+        return self._dimension
+
+    def count(self) -> int:
+        """获取有效片段数量"""
+        return int(self._live.sum())
+
+    def memory_bytes(self) -> int:
+        """检索时常驻内存的索引字节数（量化时仅为压缩码，否则为全精度矩阵）"""
+        if self.quantization == 'none' or self._codes is None:
+            return len(self._live) * (self._dimension or 0) * 4
+        scale_bytes = self._code_scales.nbytes if self._code_scales is not None else 0
+        return int(self._codes.nbytes + scale_bytes)
+
+    def reset(self) -> None:
+        """清空向量库
+
+        将现有数据文件整体改名移入回收目录后重新建表，耗时与数据量无关；
+        回收目录在后台线程中删除。
+        """
+        with self._lock:
+            self._matrix = None
+            self._codes = None
+            self._code_scales = None
+            self._conn.close()
+
+            trash_dir = os.path.join(self.persist_directory, f'{self.TRASH_PREFIX}{uuid.uuid4().hex}')
+            os.makedirs(trash_dir)
+            for name in self._data_files():
+                path = os.path.join(self.persist_directory, name)
+                if os.path.exists(path):
+                    os.replace(path, os.path.join(trash_dir, name))
+
+            self._conn = sqlite3.connect(os.path.join(self.persist_directory, self.METADATA_FILE), check_same_thread=False)
+            self._init_schema()
+            self._dimension = self._configured_dimension
+            if self._dimension:
+                with self._conn:
+                    self._set_info('dimension', self._dimension)
+            self._live = np.zeros(0, dtype=bool)
+            self._load_codes()
+
+        threading.Thread(target=shutil.rmtree, args=(trash_dir,), kwargs={'ignore_errors': True},
+                         daemon=True).start()
+
+    def delete_collection(self) -> None:
+        """删除全部数据文件并关闭连接"""
+        with self._lock:
+            self._matrix = None
+            self._codes = None
+            self._conn.close()
+            for name in self._data_files():
+                path = os.path.join(self.persist_directory, name)
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,49 @@
+"""最大边际相关性（MMR）模块 - 在候选片段中选出既相关又彼此不重复的结果"""
+from typing import List
+import numpy as np
+
+
+def maximal_marginal_relevance(query_embedding, candidate_embeddings, k: int = 4,
+                               lambda_mult: float = 0.5) -> List[int]:
+    """按MMR从候选中选出k个片段
+
+    每一步的分数为 lambda * sim(查询, 候选) - (1 - lambda) * max(sim(候选, 已选))。
+    候选之间的相似度矩阵一次性用矩阵乘法算出，每选出一个片段只用一次向量化的
+    np.maximum更新“与已选集合的最大相似度”，不做逐对的Python循环。
+
+    Args:
+        query_embedding: 查询向量
+        candidate_embeddings: 候选向量矩阵，每行一个候选
+        k: 选出的数量
+        lambda_mult: 相关性权重，1 等价于普通相似度检索，越小越强调多样性
+
+    Returns:
+        list: 选中候选的下标，按选中顺序排列
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or candidates.shape[0] == 0 or k <= 0:
+        return []
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+
+    # 归一化后内积即余弦相似度
+    candidates = candidates / np.clip(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12, None)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    k = min(k, candidates.shape[0])
+    selected = [int(np.argmax(relevance))]
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(candidates.shape[0], dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+
+    return selected
@@ -0,0 +1,153 @@
+"""父文档存储模块 - 父子分块模式下保存父窗口文本，检索命中子片段后返回所属的父窗口"""
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable
+
+
+class ParentDocumentStore:
+    """父窗口文档存储 - 每个父窗口只保存一次，持久化在SQLite旁路文件中
+
+    向量库中只存放用于匹配的小片段（子片段），子片段元数据中的parent_id指向这里的父窗口。
+    父窗口文本与嵌入模型无关，重新嵌入切换存储后继续使用。
+    父窗口数量和文本字节数由计数器在写入和删除时增量维护，读取统计信息不扫描全表。
+    """
+
+    def __init__(self, db_path: str):
+        """初始化父文档存储
+
+        Args:
+            db_path: 旁路SQLite文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS parent_documents (
+                parent_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_parent_source ON parent_documents (source)')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS parent_stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+            ''')
+
+        counters = dict(self._conn.execute("SELECT key, value FROM parent_stats").fetchall())
+        if 'parent_documents' in counters and 'parent_bytes' in counters:
+            self._count = counters['parent_documents']
+            self._bytes = counters['parent_bytes']
+        else:
+            # 旧版本创建的文件没有计数器，统计一次全表后回填
+            self._count, self._bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM parent_documents"
+            ).fetchone()
+            with self._conn:
+                self._save_counters()
+
+    def _save_counters(self) -> None:
+        """把计数器写入旁路文件（调用方持有锁并处于事务中）"""
+        self._conn.executemany("INSERT OR REPLACE INTO parent_stats (key, value) VALUES (?, ?)",
+                               [('parent_documents', self._count), ('parent_bytes', self._bytes)])
+
+    def add_documents(self, documents: Iterable[Any]) -> int:
+        """保存父窗口（元数据中需要有parent_id）
+
+        Returns:
+            int: 保存的父窗口数量
+        """
+        # 同一批中重复的parent_id只保留最后一个，与INSERT OR REPLACE的结果一致
+        rows = list({
+            doc.metadata['parent_id']: (doc.metadata['parent_id'], doc.metadata.get('source', ''), doc.page_content,
+                                        json.dumps(doc.metadata, ensure_ascii=False))
+            for doc in documents
+        }.values())
+        if not rows:
+            return 0
+        parent_ids = [row[0] for row in rows]
+        placeholders = ','.join('?' * len(parent_ids))
+        with self._lock:
+            with self._conn:
+                # 被替换的父窗口先从计数器中减去
+                replaced, replaced_bytes = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM parent_documents "
+                    f"WHERE parent_id IN ({placeholders})",
+                    parent_ids
+                ).fetchone()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO parent_documents (parent_id, source, content, metadata) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._count += len(rows) - replaced
+                self._bytes += sum(len(row[2].encode('utf-8')) for row in rows) - replaced_bytes
+                self._save_counters()
+        return len(rows)
+
+    def get_documents(self, parent_ids: List[str]) -> Dict[str, Any]:
+        """按parent_id批量读取父窗口
+
+        Returns:
+            dict: parent_id -> Document，不存在的ID不出现在结果中
+        """
+        from langchain_core.documents import Document
+
+        parent_ids = list(dict.fromkeys(parent_ids))
+        if not parent_ids:
+            return {}
+        placeholders = ','.join('?' * len(parent_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT parent_id, content, metadata FROM parent_documents WHERE parent_id IN ({placeholders})",
+                parent_ids
+            ).fetchall()
+        return {
+            parent_id: Document(page_content=content, metadata=json.loads(metadata))
+            for parent_id, content, metadata in rows
+        }
+
+    def delete_by_source(self, sources: Iterable[str]) -> int:
+        """删除指定源文件的父窗口
+
+        Returns:
+            int: 删除的父窗口数量
+        """
+        sources = list(sources)
+        if not sources:
+            return 0
+        placeholders = ','.join('?' * len(sources))
+        with self._lock:
+            with self._conn:
+                removed_bytes = self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM parent_documents "
+                    f"WHERE source IN ({placeholders})",
+                    sources
+                ).fetchone()[0]
+                cursor = self._conn.execute(f"DELETE FROM parent_documents WHERE source IN ({placeholders})", sources)
+                self._count -= cursor.rowcount
+                self._bytes -= removed_bytes
+                self._save_counters()
+        return cursor.rowcount
+
+    def reset(self) -> None:
+        """清空全部父窗口（清空向量库时调用）"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM parent_documents")
+                self._count = self._bytes = 0
+                self._save_counters()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """父窗口数量和文本字节数（读取内存中的计数器）"""
+        with self._lock:
+            return {'parent_documents': self._count, 'parent_bytes': self._bytes}
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
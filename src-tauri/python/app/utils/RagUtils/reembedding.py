@@ -0,0 +1,154 @@
+"""重新嵌入模块 - 更换嵌入模型后在后台用新模型重建影子向量库"""
+import time
+import threading
+import logging
+from datetime import datetime
+from typing import List, Dict, Any
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+class ReembeddingJob:
+    """后台重新嵌入任务
+
+    从当前向量库中读取已存储的片段文本（不重新解析源文件），用新模型写入影子向量库，
+    全部完成后由VectorStoreService原子切换。任务运行期间对当前向量库的写入和删除会被记录，
+    切换前在影子向量库上重放，保证切换后内容一致。
+    """
+
+    def __init__(self, service, shadow, batch_size: int = 64, duty_cycle: float = 0.5):
+        """初始化任务
+
+        Args:
+            service: 当前生效的VectorStoreService
+            shadow: 使用新模型、指向影子存储的VectorStoreService
+            batch_size: 每批重新嵌入的片段数量
+            duty_cycle: 占空比（0~1），每批耗时t秒后休眠 t * (1 - duty_cycle) / duty_cycle 秒，为聊天请求让出CPU
+        """
+        self.service = service
+        self.shadow = shadow
+        self.batch_size = max(1, int(batch_size))
+        self.duty_cycle = min(1.0, max(0.05, float(duty_cycle)))
+
+        self._cancelled = threading.Event()
+        self._thread = None
+        # 任务运行期间对当前向量库的变更：('add', 文档列表) 或 ('delete', 源文件列表)
+        self._pending_changes = []
+        self.status = {
+            'state': 'pending',
+            'target_model': shadow.embedder_model,
+            'target_dimension': shadow.embedding_dimension or None,
+            'store_name': shadow.store_name,
+            'total': 0,
+            'processed': 0,
+            'started_at': None,
+            'finished_at': None,
+            'error': None
+        }
+
+    @property
+    def running(self) -> bool:
+        """任务是否仍在运行（切换完成前当前向量库的变更都需要记录）"""
+        return self.status['state'] in ('pending', 'running', 'switching')
+
+    @property
+    def cancelled(self) -> bool:
+        """任务是否已被取消"""
+        return self._cancelled.is_set()
+
+    def start(self) -> None:
+        """启动后台线程"""
+        self.status['started_at'] = datetime.now().isoformat()
+        self._thread = threading.Thread(target=self._run, name='reembedding', daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """取消任务，影子向量库会被删除"""
+        self._cancelled.set()
+
+    def record_add(self, documents: List[Document]) -> None:
+        """记录任务期间写入当前向量库的片段（调用方持有存储锁）"""
+        self._pending_changes.append(('add', list(documents)))
+
+    def record_delete(self, sources: List[str]) -> None:
+        """记录任务期间从当前向量库删除的源文件（调用方持有存储锁）"""
+        self._pending_changes.append(('delete', list(sources)))
+
+    def replay_pending_changes(self) -> None:
+        """在影子向量库上重放任务期间的变更（调用方持有存储锁）"""
+        for action, payload in self._pending_changes:
+            if action == 'delete':
+                self.shadow.delete_documents_by_source(payload)
+                continue
+            # 迭代复制时可能已经读到了其中的片段，跳过影子向量库中已存在的ID，避免重复
+            existing = self.shadow.existing_ids([doc.id for doc in payload])
+            documents = [doc for doc in payload if doc.id not in existing]
+            if documents:
+                self.shadow.add_documents(documents, ids=[doc.id for doc in documents])
+        self._pending_changes.clear()
+
+    def _throttle(self, elapsed: float) -> None:
+        """按占空比休眠"""
+        if self.duty_cycle < 1.0:
+            self._cancelled.wait(elapsed * (1.0 - self.duty_cycle) / self.duty_cycle)
+
+    def _run(self) -> None:
+        """任务主流程"""
+        self.status['state'] = 'running'
+        try:
+            if self.shadow.vector_store is None:
+                raise RuntimeError(f'影子向量库初始化失败（嵌入模型: {self.shadow.embedder_model}）')
+
+            self.status['total'] = self.service.statistics.total_chunks
+            logger.info(f"开始重新嵌入: {self.status['total']} 个片段 -> {self.shadow.embedder_model}")
+
+            batch = []
+            for doc_id, metadata, content in self.service.iter_reembedding_records(self.batch_size):
+                if self._cancelled.is_set():
+                    break
+                batch.append(Document(page_content=content, metadata=metadata or {}, id=doc_id))
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch)
+                    batch = []
+            if batch and not self._cancelled.is_set():
+                self._write_batch(batch)
+
+            if self._cancelled.is_set():
+                self._discard('cancelled')
+                return
+
+            self.status['state'] = 'switching'
+            if not self.service.switch_to_shadow(self):
+                # 等待存储锁期间向量库被清空，任务已取消
+                self._discard('cancelled')
+                return
+            logger.info(f"重新嵌入完成，已切换到 {self.shadow.embedder_model}")
+        except Exception as e:
+            logger.error(f"重新嵌入失败: {e}")
+            self.status['error'] = str(e)
+            self._discard('failed')
+        finally:
+            self.status['finished_at'] = datetime.now().isoformat()
+
+    def _write_batch(self, batch: List[Document]) -> None:
+        """嵌入并写入一批片段，然后按占空比休眠"""
+        start = time.perf_counter()
+        if not self.shadow.add_documents(batch, ids=[doc.id for doc in batch]):
+            raise RuntimeError('写入影子向量库失败')
+        self.status['processed'] += len(batch)
+        self._throttle(time.perf_counter() - start)
+
+    def _discard(self, state: str) -> None:
+        """删除影子向量库"""
+        self.status['state'] = state
+        try:
+            self.service.drop_store(self.shadow)
+        except Exception as e:
+            logger.warning(f"删除影子向量库失败: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取任务状态"""
+        status = dict(self.status)
+        status['progress'] = round(status['processed'] / status['total'], 4) if status['total'] else None
+        return status
@@ -0,0 +1,130 @@
+"""重排序模块 - 使用本地交叉编码器对检索候选重新打分"""
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """交叉编码器重排序器 - CPU批量推理，(查询哈希, 片段ID) 的分数缓存在LRU中"""
+
+    # 已加载的重排序器，按模型名称复用
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model_name: str, cache_folder: Optional[str] = None, batch_size: int = 16,
+                 cache_size: int = 10000, max_length: int = 512):
+        """初始化重排序器（模型在首次打分时加载）
+
+        Args:
+            model_name: 本地模型路径或HuggingFace模型名称
+            cache_folder: 模型下载缓存目录
+            batch_size: 每批推理的(查询, 片段)对数量
+            cache_size: 分数缓存的最大条目数
+            max_length: 查询和片段拼接后的最大token长度
+        """
+        self.model_name = model_name
+        self.cache_folder = cache_folder
+        self.batch_size = max(1, int(batch_size))
+        self.cache_size = max(0, int(cache_size))
+        self.max_length = max_length
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()  # (查询哈希, 片段ID) -> 分数
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def get(cls, model_name: str, **kwargs) -> 'CrossEncoderReranker':
+        """获取指定模型的重排序器实例"""
+        with cls._instances_lock:
+            if model_name not in cls._instances:
+                cls._instances[model_name] = cls(model_name, **kwargs)
+            return cls._instances[model_name]
+
+    @property
+    def model(self):
+        """获取交叉编码器模型（懒加载）"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    logger.info(f"加载重排序模型: {self.model_name}")
+                    kwargs = {'max_length': self.max_length, 'device': 'cpu'}
+                    if self.cache_folder:
+                        kwargs['cache_folder'] = self.cache_folder
+                    self._model = CrossEncoder(self.model_name, **kwargs)
+        return self._model
+
+    @staticmethod
+    def chunk_id(document: Any) -> str:
+        """片段ID：优先使用向量库中的ID，旧数据没有ID时使用内容哈希"""
+        doc_id = getattr(document, 'id', None)
+        if doc_id:
+            return str(doc_id)
+        return hashlib.sha1(document.page_content.encode('utf-8')).hexdigest()
+
+    def score(self, query: str, documents: List[Any]) -> List[float]:
+        """为每个片段计算与查询的相关度分数（越大越相关）
+
+        Args:
+            query: 查询文本
+            documents: Document列表
+
+        Returns:
+            list: 与documents一一对应的分数
+        """
+        query_hash = hashlib.sha1(query.encode('utf-8')).hexdigest()
+        keys = [(query_hash, self.chunk_id(doc)) for doc in documents]
+        scores: List[Optional[float]] = [None] * len(documents)
+
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        self.cache_hits += len(documents) - len(missing)
+        self.cache_misses += len(missing)
+
+        if missing:
+            pairs = [(query, documents[i].page_content) for i in missing]
+            predicted = self.model.predict(pairs, batch_size=self.batch_size, convert_to_numpy=True,
+                                           show_progress_bar=False)
+            with self._cache_lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    if self.cache_size:
+                        self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def rerank(self, query: str, documents: List[Any], k: int) -> List[Tuple[Any, float]]:
+        """重排序并保留前k个
+
+        Returns:
+            list: 按分数降序排列的(Document, 分数)列表
+        """
+        if not documents:
+            return []
+        scores = self.score(query, documents)
+        ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)
+        return ranked[:k]
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取分数缓存统计"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            'model': self.model_name,
+            'cache_entries': len(self._cache),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'hit_rate': round(self.cache_hits / total, 4) if total else None
+        }
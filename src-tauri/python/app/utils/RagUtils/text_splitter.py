@@ -1,6 +1,5 @@
 """文本分割工具模块 - 提供文档内容分割功能"""
 import uuid
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 
 class TextSplitter:
@@ -37,11 +36,14 @@ class TextSplitter:
             return result
         
         try:
-            # 创建文本分割器
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            
+            # 创建文本分割器，记录每个片段在原文中的起始位置（start_index），供组装上下文时合并相邻片段
             text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
-                separators=["\n\n", "\n", " ", ".", ",", ";"]
+                separators=["\n\n", "\n", " ", ".", ",", ";"],
+                add_start_index=True
             )
             
             # 执行文本分割
@@ -59,6 +61,68 @@ class TextSplitter:
         
         return result
     
+    @staticmethod
+    def split_parent_child(documents, parent_chunk_size=2000, parent_chunk_overlap=0,
+                           child_chunk_size=200, child_chunk_overlap=40):
+        """父子分块：先切出较大的父窗口，再把每个父窗口切成用于嵌入的小片段
+        
+        子片段元数据中的parent_id指向所属父窗口，start_index换算为在原文中的位置。
+        
+        Args:
+            documents: Document对象列表
+            parent_chunk_size: 父窗口大小
+            parent_chunk_overlap: 父窗口重叠大小，默认不重叠以避免重复保存文本
+            child_chunk_size: 子片段大小
+            child_chunk_overlap: 子片段重叠大小（只在同一父窗口内重叠）
+            
+        Returns:
+            dict: 与split_documents相同的结构，split_documents为子片段，
+                  另含parent_documents（父窗口列表）和parent_documents_count
+        """
+        result = TextSplitter.split_documents(documents, parent_chunk_size, parent_chunk_overlap)
+        result['parent_documents'] = []
+        result['parent_documents_count'] = 0
+        if not result['success']:
+            return result
+        
+        try:
+            from langchain_core.documents import Document
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            
+            child_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=child_chunk_size,
+                chunk_overlap=child_chunk_overlap,
+                separators=["\n\n", "\n", " ", ".", ",", ";"],
+                add_start_index=True
+            )
+            
+            parents = result['split_documents']
+            children = []
+            for parent in parents:
+                parent.metadata['parent_id'] = str(uuid.uuid4())
+                parent_start = parent.metadata.get('start_index') or 0
+                for child in child_splitter.split_documents([Document(page_content=parent.page_content,
+                                                                      metadata=dict(parent.metadata))]):
+                    child.metadata['start_index'] = parent_start + child.metadata.get('start_index', 0)
+                    children.append(child)
+            
+            result.update({
+                'chunk_size': child_chunk_size,
+                'chunk_overlap': child_chunk_overlap,
+                'parent_chunk_size': parent_chunk_size,
+                'parent_chunk_overlap': parent_chunk_overlap,
+                'parent_documents': parents,
+                'parent_documents_count': len(parents),
+                'split_documents': children,
+                'split_documents_count': len(children),
+                'sample_chunks': TextSplitter._generate_sample_chunks(children)
+            })
+        except Exception as e:
+            result['error'] = str(e)
+            result['success'] = False
+        
+        return result
+    
     @staticmethod
     def _generate_sample_chunks(split_documents, max_samples=3, preview_length=100):
         """生成样本块信息
@@ -103,6 +167,8 @@ class TextSplitter:
         Returns:
             list: 文本块列表
         """
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -29,17 +29,16 @@ class VectorService:
             if not vector_service:
                 return stats
             
-            # 从VectorStoreService获取信息
-            stats['embedding_model'] = vector_service.embedding_model_name
-            stats['vector_store_type'] = vector_service.vector_store_type
-            stats['vector_store_path'] = vector_service.vector_store_path
-            
-            # 尝试获取向量计数
-            try:
-                stats['total_vectors'] = len(vector_service.vector_store.get()['ids'])
-            except:
-                stats['total_vectors'] = 0
+            # 读取增量维护的计数器，不遍历向量库
+            store_stats = vector_service.get_vector_statistics()
+            if store_stats.get('status') != 'ok':
+                return stats
             
+            stats['embedding_model'] = store_stats.get('embedding_model')
+            stats['vector_store_type'] = store_stats.get('vector_store_type')
+            stats['vector_store_path'] = store_stats.get('vector_store_path')
+            stats['total_vectors'] = store_stats.get('total_vectors', 0)
+            stats['total_documents'] = store_stats.get('total_files', 0)
             stats['status'] = 'available'
             
         except Exception as e:
@@ -61,9 +60,11 @@ class VectorService:
         Returns:
             Dict: 向量化元数据
         """
+        from app.services.tokenizer_service import TokenizerService
+        
         metadata = {
             'document_count': len(documents),
-            'total_tokens_estimate': sum(len(doc.page_content) // 4 for doc in documents),  # 粗略估计tokens
+            'total_tokens_estimate': sum(TokenizerService.document_tokens(documents)),  # 入库时记录的片段token数
             'source_file': source_file,
             'document_id': document_id
         }
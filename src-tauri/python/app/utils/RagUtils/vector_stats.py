@@ -0,0 +1,189 @@
+"""向量库统计模块 - 维护片段数量、文本字节数等计数器，写入和删除时增量更新"""
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+
+class VectorStatistics:
+    """向量库统计计数器 - 按源文件记录片段数和文本字节数，持久化在SQLite旁路文件中
+
+    计数器常驻内存，读取统计信息不访问向量库；启动时从旁路文件加载，
+    旧版本创建的向量库没有旁路文件时由调用方遍历一次向量库回填。
+    """
+
+    def __init__(self, db_path: str, base_dir: Optional[str] = None):
+        """初始化统计计数器
+
+        Args:
+            db_path: 旁路SQLite文件路径
+            base_dir: 知识库文件根目录，用于由源文件路径推导所属文件夹
+        """
+        self.db_path = db_path
+        self.base_dir = base_dir
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            ''')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_stats (
+                source TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+            ''')
+
+        self._info = dict(self._conn.execute("SELECT key, value FROM stats_info").fetchall())
+        # 内存中的计数器：{source: {'folder': 文件夹, 'chunks': 片段数, 'bytes': 文本字节数}}
+        self._files = {
+            source: {'folder': folder, 'chunks': chunks, 'bytes': size}
+            for source, folder, chunks, size in self._conn.execute(
+                "SELECT source, folder, chunks, bytes FROM file_stats")
+        }
+        self._folders = {}
+        self._total_chunks = 0
+        self._total_bytes = 0
+        for entry in self._files.values():
+            self._add_to_totals(entry['folder'], entry['chunks'], entry['bytes'])
+
+    @property
+    def initialized(self) -> bool:
+        """计数器是否已经与向量库内容对齐"""
+        return self._info.get('initialized') == '1'
+
+    def get_info(self, key: str) -> Optional[str]:
+        """读取记录的信息（嵌入模型、维度等）"""
+        return self._info.get(key)
+
+    def set_info(self, key: str, value: Any) -> None:
+        """记录信息（嵌入模型、维度等）"""
+        with self._lock:
+            self._info[key] = str(value)
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO stats_info (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _folder_of(self, source: str) -> str:
+        """由源文件路径推导所属文件夹，知识库根目录下的文件返回空字符串"""
+        directory = os.path.dirname(source or '')
+        if self.base_dir and directory:
+            try:
+                relative = os.path.relpath(directory, self.base_dir)
+                if not relative.startswith('..'):
+                    return '' if relative == '.' else relative
+            except ValueError:
+                # Windows下不同盘符之间无法计算相对路径
+                pass
+        return directory
+
+    def _add_to_totals(self, folder: str, chunks: int, size: int) -> None:
+        """累加文件夹和总计数"""
+        entry = self._folders.setdefault(folder, {'chunks': 0, 'bytes': 0, 'files': 0})
+        entry['chunks'] += chunks
+        entry['bytes'] += size
+        self._total_chunks += chunks
+        self._total_bytes += size
+
+    def _apply(self, records: Iterable[Tuple[Dict[str, Any], str]]) -> None:
+        """按(元数据, 文本)累加计数器并写入旁路文件（调用方持有锁）"""
+        delta = {}
+        for metadata, content in records:
+            source = (metadata or {}).get('source', '')
+            entry = delta.setdefault(source, [0, 0])
+            entry[0] += 1
+            entry[1] += len((content or '').encode('utf-8'))
+
+        for source, (chunks, size) in delta.items():
+            entry = self._files.get(source)
+            if entry is None:
+                entry = self._files[source] = {'folder': self._folder_of(source), 'chunks': 0, 'bytes': 0}
+                self._folders.setdefault(entry['folder'], {'chunks': 0, 'bytes': 0, 'files': 0})['files'] += 1
+            entry['chunks'] += chunks
+            entry['bytes'] += size
+            self._add_to_totals(entry['folder'], chunks, size)
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_stats (source, folder, chunks, bytes) VALUES (?, ?, ?, ?)",
+                [(source, self._files[source]['folder'], self._files[source]['chunks'], self._files[source]['bytes'])
+                 for source in delta]
+            )
+
+    def record_add(self, documents: List[Any]) -> None:
+        """记录新增的文档片段"""
+        with self._lock:
+            self._apply((doc.metadata, doc.page_content) for doc in documents)
+
+    def record_delete(self, sources: List[str]) -> None:
+        """记录按源文件删除的片段"""
+        with self._lock:
+            removed = [source for source in sources if source in self._files]
+            for source in removed:
+                entry = self._files.pop(source)
+                self._add_to_totals(entry['folder'], -entry['chunks'], -entry['bytes'])
+                folder = self._folders[entry['folder']]
+                folder['files'] -= 1
+                if folder['files'] <= 0:
+                    del self._folders[entry['folder']]
+            if removed:
+                with self._conn:
+                    self._conn.executemany("DELETE FROM file_stats WHERE source = ?", [(s,) for s in removed])
+
+    def sources_in_folder(self, folder: str) -> List[str]:
+        """获取文件夹下所有已入库的源文件"""
+        with self._lock:
+            return [source for source, entry in self._files.items() if entry['folder'] == folder]
+
+    def rebuild(self, records: Iterable[Tuple[str, Dict[str, Any], str]]) -> None:
+        """遍历向量库中的全部(片段ID, 元数据, 文本)重建计数器"""
+        with self._lock:
+            self.reset()
+            self._apply((metadata, content) for _, metadata, content in records)
+            self.set_info('initialized', 1)
+
+    def reset(self) -> None:
+        """清零计数器（保留嵌入模型等信息）"""
+        with self._lock:
+            self._files.clear()
+            self._folders.clear()
+            self._total_chunks = 0
+            self._total_bytes = 0
+            with self._conn:
+                self._conn.execute("DELETE FROM file_stats")
+            self.set_info('initialized', 1)
+
+    @property
+    def total_chunks(self) -> int:
+        """片段总数"""
+        return self._total_chunks
+
+    def snapshot(self, detailed: bool = True) -> Dict[str, Any]:
+        """获取统计信息快照
+
+        Args:
+            detailed: 是否包含按文件夹和文件的明细
+
+        Returns:
+            dict: 统计信息
+        """
+        with self._lock:
+            dimension = int(self._info.get('dimension', 0) or 0) or None
+            snapshot = {
+                'total_vectors': self._total_chunks,
+                'total_files': len(self._files),
+                'total_text_bytes': self._total_bytes,
+                'vector_bytes': self._total_chunks * dimension * 4 if dimension else None,
+                'embedding_model': self._info.get('embedding_model'),
+                'embedding_dimension': dimension
+            }
+            if detailed:
+                snapshot['folders'] = {folder: dict(entry) for folder, entry in self._folders.items()}
+                snapshot['files'] = {source: dict(entry) for source, entry in self._files.items()}
+            return snapshot
@@ -0,0 +1 @@
+"""性能基准脚本包 - 在src-tauri/python目录下以 python -m benchmarks.<脚本名> 运行"""
@@ -0,0 +1,107 @@
+"""基准脚本公共工具 - 语料加载、计时统计和检索指标"""
+import os
+import random
+from typing import List, Optional, Sequence
+from app.core.config import config_manager
+
+
+def get_default_corpus_dir():
+    """获取RAG知识库文件目录"""
+    return os.path.join(config_manager.get_user_data_dir(), 'Retrieval-Augmented Generation', 'files')
+
+
+def load_corpus_chunks(corpus_dir: Optional[str] = None, limit: Optional[int] = None,
+                       chunk_size: int = 1000, chunk_overlap: int = 200):
+    """加载并分割本地语料，返回Document片段列表
+
+    Args:
+        corpus_dir: 语料目录，默认使用RAG知识库目录
+        limit: 最多返回的片段数量
+        chunk_size: 文本块大小
+        chunk_overlap: 文本块重叠大小
+
+    Returns:
+        list: 分割后的Document列表
+    """
+    from app.utils.RagUtils.document_loader import DocumentLoader
+    from app.utils.RagUtils.text_splitter import TextSplitter
+
+    corpus_dir = corpus_dir or get_default_corpus_dir()
+    supported = set(DocumentLoader.get_supported_extensions())
+    chunks = []
+
+    for root, _, files in os.walk(corpus_dir):
+        for file in sorted(files):
+            if file.startswith('.') or file.rsplit('.', 1)[-1].lower() not in supported:
+                continue
+            document_info = DocumentLoader.load_document(os.path.join(root, file))
+            if not document_info.get('documents'):
+                continue
+            split_result = TextSplitter.split_documents(document_info['documents'], chunk_size, chunk_overlap)
+            if split_result['success']:
+                chunks.extend(split_result['split_documents'])
+            if limit and len(chunks) >= limit:
+                return chunks[:limit]
+
+    return chunks
+
+
+def sample_queries(chunks, count: int = 50, seed: int = 42, max_chars: int = 120) -> List[str]:
+    """从语料片段中抽取查询文本（取片段开头的一段文字）"""
+    rng = random.Random(seed)
+    picked = rng.sample(chunks, min(count, len(chunks)))
+    return [doc.page_content.strip().replace('\n', ' ')[:max_chars] for doc in picked]
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """计算百分位数（线性插值）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def recall_at_k(expected: Sequence, actual: Sequence, k: int) -> float:
+    """计算recall@k：actual前k个结果覆盖expected前k个结果的比例"""
+    truth = set(list(expected)[:k])
+    if not truth:
+        return 1.0
+    return len(truth & set(list(actual)[:k])) / len(truth)
+
+
+def exact_top_k(matrix, queries, k: int):
+    """用内积对归一化向量做精确检索，返回每个查询的top-k行号"""
+    import numpy as np
+
+    scores = np.asarray(queries, dtype=np.float32) @ np.asarray(matrix, dtype=np.float32).T
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.arange(scores.shape[0])[:, None]
+    return np.take_along_axis(top, np.argsort(-scores[rows, top], axis=1), axis=1)
+
+
+def random_unit_vectors(count: int, dimension: int, seed: int = 0):
+    """生成随机单位向量，用于合成数据测试"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class PrecomputedEmbeddings:
+    """预先计算好向量的嵌入模型，使各向量库在相同向量上比较、排除嵌入耗时"""
+
+    def __init__(self, texts, vectors, query_vectors=None):
+        self._lookup = {text: list(map(float, vector)) for text, vector in zip(texts, vectors)}
+        if query_vectors is not None:
+            self._lookup.update(query_vectors)
+
+    def embed_documents(self, texts):
+        return [self._lookup[text] for text in texts]
+
+    def embed_query(self, text):
+        return self._lookup[text]
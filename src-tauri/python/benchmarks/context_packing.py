@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+对比RAG上下文的组装方式：旧方式（每个片段截取前200字符）与按token预算打包
+
+查询取自知识库片段的开头文本，在当前向量库上检索后分别组装，
+报告每个查询的提示token数和检索文本被保留的比例。
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.context_packing --queries 50 --k 8 --budget 1500
+"""
+import argparse
+from benchmarks.common import load_corpus_chunks, sample_queries, percentile
+
+
+def legacy_prompt(question, documents):
+    """旧版本ChatService.get_rag_enhanced_prompt的组装方式"""
+    context = "\n".join([f"参考文档{i+1}：{doc.page_content[:200]}..." for i, doc in enumerate(documents)])
+    return f"参考文档：{context}\n问题：{question}"
+
+
+def packed_prompt(question, documents, budget):
+    """按token预算打包的组装方式"""
+    from app.utils.RagUtils.context_assembler import ContextAssembler
+
+    assembled = ContextAssembler.assemble(documents, token_budget=budget)
+    return f"参考文档：\n{assembled['context']}\n\n问题：{question}", assembled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RAG上下文组装基准')
+    parser.add_argument('--corpus', help='语料目录，默认使用RAG知识库目录')
+    parser.add_argument('--queries', type=int, default=50, help='查询数量')
+    parser.add_argument('--k', type=int, default=8, help='每个查询检索的片段数')
+    parser.add_argument('--budget', type=int, default=1500, help='上下文token预算')
+    args = parser.parse_args()
+
+    from app.services.rag_service import get_vector_store_service
+    from app.utils.RagUtils.context_assembler import estimate_tokens
+
+    chunks = load_corpus_chunks(args.corpus, limit=2000)
+    if not chunks:
+        print("❌ 没有找到可用的语料")
+        return
+    vector_service = get_vector_store_service()
+    if not vector_service or not vector_service.vector_store:
+        print("❌ 向量库不可用")
+        return
+
+    queries = sample_queries(chunks, args.queries)
+    legacy_tokens, packed_tokens, legacy_kept, packed_kept = [], [], [], []
+    merged, duplicates, truncated = 0, 0, 0
+    for question in queries:
+        documents = vector_service.search_documents(question, k=args.k)
+        if not documents:
+            continue
+        retrieved_chars = sum(len(doc.page_content) for doc in documents)
+
+        legacy = legacy_prompt(question, documents)
+        packed, assembled = packed_prompt(question, documents, args.budget)
+        legacy_tokens.append(estimate_tokens(legacy))
+        packed_tokens.append(estimate_tokens(packed))
+        legacy_kept.append(sum(min(len(doc.page_content), 200) for doc in documents) / retrieved_chars)
+        packed_kept.append(min(1.0, len(assembled['context']) / retrieved_chars))
+        merged += assembled['retrieved_chunks'] - assembled['duplicates_removed'] - assembled['merged_blocks']
+        duplicates += assembled['duplicates_removed']
+        truncated += int(assembled['truncated'])
+
+    if not packed_tokens:
+        print("❌ 没有检索到任何结果")
+        return
+
+    print(f"📚 查询: {len(packed_tokens)}，k={args.k}，预算={args.budget} tokens")
+    print(f"\n{'方式':<10}{'平均tokens':>12}{'p50':>8}{'p95':>8}{'检索文本保留率':>16}")
+    for name, tokens, kept in (('截断200字', legacy_tokens, legacy_kept), ('预算打包', packed_tokens, packed_kept)):
+        print(f"{name:<10}{sum(tokens) / len(tokens):>12.1f}{percentile(tokens, 50):>8.0f}"
+              f"{percentile(tokens, 95):>8.0f}{sum(kept) / len(kept):>16.1%}")
+    print(f"\n合并的相邻片段: {merged}，去除的近似重复片段: {duplicates}，触发截断的查询: {truncated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+对比PyTorch与ONNX Runtime嵌入后端的吞吐量和检索一致性
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.embedding_backends --limit 500 --threads 4
+"""
+import argparse
+import time
+from app.core.config import config_manager
+from benchmarks.common import load_corpus_chunks, sample_queries, exact_top_k, recall_at_k
+
+
+def build_embeddings(backend, threads, batch_size, quantize):
+    """按指定后端创建嵌入模型（复用VectorStoreService的模型路径搜索逻辑）"""
+    from app.services.vector_store_service import VectorStoreService
+
+    config_manager.set('rag.embedding_backend', backend)
+    config_manager.set('rag.embedding_batch_size', batch_size)
+    config_manager.set('rag.onnx_intra_op_threads', threads)
+    config_manager.set('rag.onnx_quantize', quantize)
+    service = VectorStoreService(embedder_model=config_manager.get('rag.embedder_model'))
+    return service.embeddings
+
+
+def run_backend(backend, texts, queries, args):
+    """运行单个后端，返回(文档向量, 查询向量, 每秒片段数)"""
+    embeddings = build_embeddings(backend, args.threads, args.batch_size, not args.no_quantize)
+    if embeddings is None:
+        raise RuntimeError(f'{backend} 后端初始化失败')
+
+    # 预热，排除首次加载和图优化的耗时
+    embeddings.embed_documents(texts[:min(len(texts), args.batch_size)])
+
+    start = time.perf_counter()
+    doc_vectors = embeddings.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    query_vectors = [embeddings.embed_query(q) for q in queries]
+    return doc_vectors, query_vectors, len(texts) / elapsed if elapsed else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='嵌入后端基准测试')
+    parser.add_argument('--corpus', help='语料目录，默认使用RAG知识库目录')
+    parser.add_argument('--limit', type=int, default=500, help='参与测试的片段数量')
+    parser.add_argument('--queries', type=int, default=50, help='检索一致性测试的查询数量')
+    parser.add_argument('--k', type=int, default=5, help='检索一致性比较的top-k')
+    parser.add_argument('--threads', type=int, default=0, help='ONNX intra-op线程数，0为自动')
+    parser.add_argument('--batch-size', type=int, default=32, help='推理批大小')
+    parser.add_argument('--no-quantize', action='store_true', help='ONNX后端不做int8量化')
+    args = parser.parse_args()
+
+    import numpy as np
+
+    chunks = load_corpus_chunks(args.corpus, limit=args.limit)
+    if not chunks:
+        print("❌ 没有找到可用的语料")
+        return
+    texts = [doc.page_content for doc in chunks]
+    queries = sample_queries(chunks, args.queries)
+    print(f"📚 语料片段: {len(texts)}，查询: {len(queries)}")
+
+    results = {}
+    for backend in ('pytorch', 'onnx'):
+        print(f"🔄 测试后端: {backend}")
+        results[backend] = run_backend(backend, texts, queries, args)
+        print(f"   吞吐量: {results[backend][2]:.1f} 片段/秒")
+
+    torch_docs, torch_queries, torch_rate = results['pytorch']
+    onnx_docs, onnx_queries, onnx_rate = results['onnx']
+
+    torch_top = exact_top_k(torch_docs, torch_queries, args.k)
+    onnx_top = exact_top_k(onnx_docs, onnx_queries, args.k)
+    agreement = np.mean([recall_at_k(t, o, args.k) for t, o in zip(torch_top, onnx_top)])
+    cosine = np.mean(np.sum(np.asarray(torch_docs) * np.asarray(onnx_docs), axis=1))
+
+    print("\n=== 结果 ===")
+    print(f"PyTorch: {torch_rate:.1f} 片段/秒")
+    print(f"ONNX:    {onnx_rate:.1f} 片段/秒 （加速 {onnx_rate / torch_rate if torch_rate else 0:.2f}x）")
+    print(f"top-{args.k} 检索一致率: {agreement:.3f}")
+    print(f"文档向量平均余弦相似度: {cosine:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Matryoshka维度截断的召回率基准：在本地语料上比较不同输出维度相对完整维度的recall@k、
+索引大小和检索耗时
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.embedding_dimension --dimensions 1024 768 512 256 128
+"""
+import argparse
+import time
+from app.core.config import config_manager
+from benchmarks.common import exact_top_k, load_corpus_chunks, recall_at_k, sample_queries
+
+
+def truncate(matrix, dimension):
+    """截断并重新归一化（与TruncatedEmbeddings一致）"""
+    import numpy as np
+
+    truncated = matrix[:, :dimension].copy()
+    truncated /= np.clip(np.linalg.norm(truncated, axis=1, keepdims=True), 1e-12, None)
+    return truncated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='嵌入维度截断召回率基准')
+    parser.add_argument('--corpus', help='语料目录，默认使用RAG知识库目录')
+    parser.add_argument('--limit', type=int, default=2000, help='参与测试的片段数量')
+    parser.add_argument('--queries', type=int, default=100, help='查询数量')
+    parser.add_argument('--k', type=int, default=5, help='recall@k中的k')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[768, 512, 256, 128, 64],
+                        help='待测试的截断维度')
+    args = parser.parse_args()
+
+    import numpy as np
+    from app.services.vector_store_service import VectorStoreService
+
+    chunks = load_corpus_chunks(args.corpus, limit=args.limit)
+    if not chunks:
+        print("❌ 没有找到可用的语料")
+        return
+    queries = sample_queries(chunks, args.queries)
+
+    # 用完整维度编码一次，各截断维度在同一组向量上比较
+    config_manager.set('rag.embedding_dimension', 0)
+    embeddings = VectorStoreService(embedder_model=config_manager.get('rag.embedder_model')).embeddings
+    doc_matrix = np.asarray(embeddings.embed_documents([doc.page_content for doc in chunks]), dtype=np.float32)
+    query_matrix = np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+    full_dimension = doc_matrix.shape[1]
+    truth = exact_top_k(doc_matrix, query_matrix, args.k)
+    print(f"📚 语料片段: {len(chunks)}，查询: {len(queries)}，完整维度: {full_dimension}")
+
+    print(f"\n{'维度':>6}{'索引(MB)':>10}{'检索(ms/查询)':>16}{'recall@' + str(args.k):>12}")
+    for dimension in [full_dimension] + [d for d in args.dimensions if d < full_dimension]:
+        docs = truncate(doc_matrix, dimension)
+        qs = truncate(query_matrix, dimension)
+        start = time.perf_counter()
+        top = exact_top_k(docs, qs, args.k)
+        elapsed = (time.perf_counter() - start) * 1000 / len(qs)
+        recall = np.mean([recall_at_k(t, r, args.k) for t, r in zip(truth, top)])
+        print(f"{dimension:>6}{docs.nbytes / 1024 / 1024:>10.2f}{elapsed:>16.3f}{recall:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
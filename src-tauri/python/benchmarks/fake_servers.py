@@ -0,0 +1,221 @@
+"""本地假模型服务 - 在本机端口上模拟模型接口的流式响应，供驱动基准使用，不访问外部网络"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """模拟OpenAI兼容的 /chat/completions 接口
+
+    服务端参数保存在server对象上：
+    - tokens: 每次回复的增量数量
+    - first_token_delay: 发出第一个增量前的等待（秒），模拟排队和预填充
+    - token_interval: 相邻增量之间的间隔（秒），模拟解码速度
+
+    响应带有usage：提示词按字符计为token，与之前任一请求的公共前缀按64个token一块计为缓存命中，
+    模拟供应商的自动前缀缓存。
+    """
+    protocol_version = 'HTTP/1.1'
+    CACHE_BLOCK = 64
+
+    def log_message(self, format, *args):
+        pass
+
+    def _usage(self, payload):
+        """计算提示词token数和缓存命中的token数，并记录本次提示词"""
+        parts = []
+        for msg in payload.get('messages', []):
+            content = msg.get('content')
+            if isinstance(content, list):
+                content = ''.join(block.get('text', '') for block in content)
+            parts.append(f"{msg.get('role')}:{content}\n")
+        prompt = ''.join(parts)
+        cached = 0
+        for previous in self.server.prompts:
+            common = 0
+            for a, b in zip(previous, prompt):
+                if a != b:
+                    break
+                common += 1
+            cached = max(cached, common // self.CACHE_BLOCK * self.CACHE_BLOCK)
+        self.server.prompts.append(prompt)
+        return {'prompt_tokens': len(prompt), 'completion_tokens': self.server.tokens,
+                'total_tokens': len(prompt) + self.server.tokens,
+                'prompt_tokens_details': {'cached_tokens': cached}}
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        server.requests += 1
+        server.last_payload = payload
+        usage = self._usage(payload)
+
+        if not payload.get('stream'):
+            time.sleep(server.first_token_delay + server.token_interval * server.tokens)
+            body = json.dumps({
+                'id': 'fake',
+                'object': 'chat.completion',
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': '字' * server.tokens},
+                             'finish_reason': 'stop'}],
+                'usage': usage
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(server.first_token_delay)
+        for index in range(server.tokens):
+            if index and server.token_interval:
+                time.sleep(server.token_interval)
+            event = {
+                'id': 'fake',
+                'object': 'chat.completion.chunk',
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'delta': {'content': '字'}, 'finish_reason': None}]
+            }
+            self._write_chunk(f'data: {json.dumps(event)}\n\n'.encode())
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            event = {'id': 'fake', 'object': 'chat.completion.chunk', 'model': payload.get('model'),
+                     'choices': [], 'usage': usage}
+            self._write_chunk(f'data: {json.dumps(event)}\n\n'.encode())
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data: bytes):
+        """按chunked编码写出并立即刷新"""
+        self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def handle_one_request(self):
+        """客户端中途断开（驱动取消请求）时只计数，不打印异常"""
+        try:
+            BaseHTTPRequestHandler.handle_one_request(self)
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.disconnects += 1
+            self.close_connection = True
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """模拟Ollama的 /api/chat 和 /api/generate 接口
+
+    模型未加载或keep_alive已过期时，下一次请求先等待load_delay（秒）模拟从磁盘加载模型；
+    响应的最终块带有Ollama的耗时字段（纳秒）。最近一次请求体保存在 server.last_payload，
+    客户端中途断开的次数记录在 server.disconnects。
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @staticmethod
+    def _keep_alive_seconds(keep_alive):
+        """把keep_alive换算为秒（支持数字和 30s / 5m / 1h 形式），负数表示一直保留"""
+        if keep_alive is None:
+            return 300
+        if isinstance(keep_alive, (int, float)):
+            return float('inf') if keep_alive < 0 else keep_alive
+        units = {'s': 1, 'm': 60, 'h': 3600}
+        value = float(keep_alive[:-1]) * units[keep_alive[-1]]
+        return float('inf') if value < 0 else value
+
+    def _load_model(self, payload):
+        """按需模拟加载模型，返回加载耗时（纳秒）并刷新过期时间"""
+        server = self.server
+        model = payload.get('model')
+        now = time.monotonic()
+        load_ns = 0
+        if server.loaded.get(model, 0) <= now:
+            time.sleep(server.load_delay)
+            load_ns = int(server.load_delay * 1e9)
+            server.loads += 1
+        server.loaded[model] = time.monotonic() + self._keep_alive_seconds(payload.get('keep_alive'))
+        return load_ns
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        server.requests += 1
+        server.last_payload = payload
+        start = time.perf_counter()
+        load_ns = self._load_model(payload)
+
+        if self.path == '/api/generate':
+            # 不带提示词的generate请求只加载模型
+            self._send_json({'model': payload.get('model'), 'response': '', 'done': True,
+                             'total_duration': int((time.perf_counter() - start) * 1e9), 'load_duration': load_ns})
+            return
+
+        prompt_tokens = sum(len(msg.get('content', '')) for msg in payload.get('messages', []))
+        time.sleep(server.first_token_delay)
+        prompt_ns = int(server.first_token_delay * 1e9)
+
+        def final(content=''):
+            return {'model': payload.get('model'), 'message': {'role': 'assistant', 'content': content},
+                    'done': True, 'total_duration': int((time.perf_counter() - start) * 1e9),
+                    'load_duration': load_ns, 'prompt_eval_count': prompt_tokens,
+                    'prompt_eval_duration': prompt_ns, 'eval_count': server.tokens,
+                    'eval_duration': max(1, int(server.token_interval * server.tokens * 1e9))}
+
+        if payload.get('stream') is False:
+            time.sleep(server.token_interval * server.tokens)
+            self._send_json(final('字' * server.tokens))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for index in range(server.tokens):
+            if index and server.token_interval:
+                time.sleep(server.token_interval)
+            event = {'model': payload.get('model'), 'message': {'role': 'assistant', 'content': '字'}, 'done': False}
+            self._write_chunk((json.dumps(event) + '\n').encode())
+        self._write_chunk((json.dumps(final()) + '\n').encode())
+        self._write_chunk(b'')
+
+    _write_chunk = FakeOpenAIHandler._write_chunk
+    handle_one_request = FakeOpenAIHandler.handle_one_request
+
+
+def start_fake_server(handler_class=FakeOpenAIHandler, tokens=200, first_token_delay=0.0, token_interval=0.0,
+                      load_delay=0.0):
+    """在随机端口启动假模型服务（后台线程）
+
+    Returns:
+        tuple: (server, base_url)，用完后调用 server.shutdown()。
+        OpenAI兼容服务的base_url带 /v1 前缀，Ollama服务为根地址
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    server.tokens = tokens
+    server.first_token_delay = first_token_delay
+    server.token_interval = token_interval
+    server.load_delay = load_delay
+    server.requests = 0
+    server.loads = 0
+    server.disconnects = 0
+    server.loaded = {}
+    server.prompts = []
+    server.last_payload = None
+    threading.Thread(target=server.serve_forever, name='fake-model-server', daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    return server, base_url if handler_class is FakeOllamaHandler else f'{base_url}/v1'
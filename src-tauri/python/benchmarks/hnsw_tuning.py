@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+在用户实际的Chroma集合上扫描HNSW参数，报告recall@k与p50/p99检索延迟
+
+读取当前向量库中的全部向量，在临时的内存集合中按不同的M / construction_ef / search_ef重建索引，
+以暴力精确检索的结果作为基准计算召回率。查询取自集合中随机片段的开头文本，用当前嵌入模型编码。
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.hnsw_tuning --m 8 16 32 --construction-ef 100 200 --search-ef 10 50 100 200
+"""
+import argparse
+import time
+import uuid
+from benchmarks.common import percentile, recall_at_k
+
+
+def load_collection(vector_service, page_size=5000):
+    """分页读取集合中的全部向量和文本"""
+    import numpy as np
+
+    collection = vector_service.vector_store._collection
+    total = collection.count()
+    vectors, documents = [], []
+    for offset in range(0, total, page_size):
+        page = collection.get(include=['embeddings', 'documents'], limit=page_size, offset=offset)
+        vectors.extend(page['embeddings'])
+        documents.extend(page['documents'])
+    return np.asarray(vectors, dtype=np.float32), documents
+
+
+def exact_neighbors(matrix, queries, k, space):
+    """按集合的距离空间做暴力精确检索"""
+    import numpy as np
+
+    if space == 'l2':
+        scores = -(np.sum(matrix ** 2, axis=1)[None, :] - 2 * queries @ matrix.T)
+    elif space == 'cosine':
+        normed = matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+        scores = queries @ normed.T
+    else:
+        scores = queries @ matrix.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chroma HNSW参数调优基准')
+    parser.add_argument('--queries', type=int, default=200, help='查询数量')
+    parser.add_argument('--k', type=int, default=5, help='recall@k中的k')
+    parser.add_argument('--m', type=int, nargs='+', default=[8, 16, 32], help='待测试的M')
+    parser.add_argument('--construction-ef', type=int, nargs='+', default=[100, 200], help='待测试的construction_ef')
+    parser.add_argument('--search-ef', type=int, nargs='+', default=[10, 50, 100, 200], help='待测试的search_ef')
+    parser.add_argument('--batch-size', type=int, default=5000, help='重建索引时的写入批大小')
+    args = parser.parse_args()
+
+    import random
+    import chromadb
+    import numpy as np
+    from app.services.rag_service import get_vector_store_service
+
+    vector_service = get_vector_store_service()
+    if vector_service.vector_db_type != 'chroma' or not vector_service.vector_store:
+        print("❌ 当前向量库不是可用的Chroma集合")
+        return
+
+    space = vector_service.hnsw_config['space']
+    matrix, documents = load_collection(vector_service)
+    if len(matrix) == 0:
+        print("❌ 向量库为空")
+        return
+
+    rng = random.Random(42)
+    query_texts = [documents[i][:120] for i in rng.sample(range(len(documents)), min(args.queries, len(documents)))]
+    queries = np.asarray([vector_service.embeddings.embed_query(t) for t in query_texts], dtype=np.float32)
+    truth = exact_neighbors(matrix, queries, args.k, space)
+    ids = [str(i) for i in range(len(matrix))]
+    print(f"📚 集合向量: {matrix.shape[0]} x {matrix.shape[1]}，space={space}，查询: {len(queries)}")
+
+    client = chromadb.EphemeralClient()
+    print(f"\n{'M':>4}{'c_ef':>6}{'s_ef':>6}{'建索引(s)':>11}{'p50(ms)':>10}{'p99(ms)':>10}{'recall@' + str(args.k):>12}")
+    for m in args.m:
+        for construction_ef in args.construction_ef:
+            name = f'hnsw-tuning-{uuid.uuid4().hex[:8]}'
+            collection = client.create_collection(name, metadata={
+                'hnsw:space': space,
+                'hnsw:M': m,
+                'hnsw:construction_ef': construction_ef
+            })
+            start = time.perf_counter()
+            for offset in range(0, len(matrix), args.batch_size):
+                collection.add(ids=ids[offset:offset + args.batch_size],
+                               embeddings=matrix[offset:offset + args.batch_size].tolist())
+            build_seconds = time.perf_counter() - start
+
+            for search_ef in args.search_ef:
+                try:
+                    collection.modify(configuration={'hnsw': {'ef_search': search_ef}})
+                except Exception:
+                    collection.modify(metadata={'hnsw:search_ef': search_ef})
+
+                latencies, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=[])
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    recalls.append(recall_at_k(expected, [int(i) for i in result['ids'][0]], args.k))
+
+                print(f"{m:>4}{construction_ef:>6}{search_ef:>6}{build_seconds:>11.2f}"
+                      f"{percentile(latencies, 50):>10.2f}{percentile(latencies, 99):>10.2f}"
+                      f"{sum(recalls) / len(recalls):>12.3f}")
+            client.delete_collection(name)
+
+    print("\n💡 将选定的参数写入 config['rag'] 的 hnsw_m / hnsw_construction_ef / hnsw_search_ef，"
+          "其中 M 和 construction_ef 需要重建向量库后生效")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+比较langchain驱动与原生OpenAI兼容驱动的流式开销
+
+两个驱动请求同一个本地假模型服务（benchmarks.fake_servers）：
+- 首token延迟：服务端在first_token_delay后发出第一个增量，统计客户端收到第一个SSE块的时间
+- 单token开销：服务端不设间隔连续发出增量，(总耗时 - 服务端耗时) / 增量数 即驱动处理每个增量的开销
+第一轮请求用于建立连接和导入模块，不计入统计。
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.model_drivers --tokens 500 --rounds 20 --first-token-delay 0.05
+"""
+import time
+import argparse
+from benchmarks.common import percentile
+from benchmarks.fake_servers import start_fake_server
+
+
+def build_drivers(base_url):
+    """构造指向假服务的两个驱动"""
+    from app.models.vendors.openai_model import OpenAIModel
+    from app.models.vendors.openai_compatible_model import OpenAICompatibleModel
+
+    version = {'version_name': 'fake-model', 'name': 'fake-model', 'api_key': 'sk-fake',
+               'base_url': base_url, 'api_base_url': base_url}
+    return {
+        'langchain (ChatOpenAI)': OpenAIModel({'name': 'OpenAI'}, version),
+        'native (httpx)': OpenAICompatibleModel({'name': 'Deepseek'}, version),
+    }
+
+
+def run_stream(driver, messages):
+    """消费一次流式回复，返回 (首个SSE块耗时秒, 总耗时秒, 块数)"""
+    start = time.perf_counter()
+    first, chunks = None, 0
+    for _ in driver.chat_stream(messages, 0.7):
+        if first is None:
+            first = time.perf_counter() - start
+        chunks += 1
+    return first, time.perf_counter() - start, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模型驱动流式开销基准')
+    parser.add_argument('--tokens', type=int, default=500, help='每次回复的增量数量')
+    parser.add_argument('--rounds', type=int, default=20, help='每个驱动的请求次数')
+    parser.add_argument('--first-token-delay', type=float, default=0.05, help='假服务首个增量前的等待（秒）')
+    args = parser.parse_args()
+
+    messages = [{'role': 'system', 'content': '你是一个助手'}, {'role': 'user', 'content': '你好'}]
+
+    ttft_server, ttft_url = start_fake_server(tokens=1, first_token_delay=args.first_token_delay)
+    burst_server, burst_url = start_fake_server(tokens=args.tokens)
+    try:
+        ttft_drivers = build_drivers(ttft_url)
+        burst_drivers = build_drivers(burst_url)
+
+        print(f"📊 增量数={args.tokens}，请求次数={args.rounds}，服务端首token等待={args.first_token_delay * 1000:.0f}ms")
+        print(f"{'驱动':<24}{'TTFT p50':>10}{'TTFT p95':>10}{'首token附加':>12}{'单token开销':>12}{'吞吐':>14}")
+        for name in ttft_drivers:
+            run_stream(ttft_drivers[name], messages)
+            run_stream(burst_drivers[name], messages)
+
+            ttft = [run_stream(ttft_drivers[name], messages)[0] * 1000 for _ in range(args.rounds)]
+            totals = []
+            for _ in range(args.rounds):
+                _, total, chunks = run_stream(burst_drivers[name], messages)
+                totals.append(total)
+            per_token_us = percentile(totals, 50) / args.tokens * 1e6
+            print(f"{name:<24}{percentile(ttft, 50):>8.1f}ms{percentile(ttft, 95):>8.1f}ms"
+                  f"{percentile(ttft, 50) - args.first_token_delay * 1000:>10.1f}ms"
+                  f"{per_token_us:>10.1f}us{args.tokens / percentile(totals, 50):>10.0f} tok/s")
+    finally:
+        ttft_server.shutdown()
+        burst_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+比较历史窗口前移方式对提示词缓存命中率的影响
+
+模拟一段多轮对话，每轮用ChatService组装发送给模型的消息，请求本地假模型服务（benchmarks.fake_servers）。
+假服务按与之前请求的公共前缀计算缓存命中的token数（64个token一块），与供应商的自动前缀缓存类似。
+分别统计窗口逐条前移（step=1）和整块前移（chat.history_window_step）时的提示词token数和缓存命中率。
+对话只保存在内存中，不写入数据库。
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.prompt_cache --turns 30 --history 10 --steps 1 4 10
+"""
+import uuid
+import argparse
+from benchmarks.fake_servers import FakeOpenAIHandler, start_fake_server
+
+
+def run_conversation(base_url, turns, history, step, answer_chars, system_prompt):
+    """进行一段多轮对话，返回 (提示词token总数, 缓存命中token总数)"""
+    from app.core.config import config_manager
+    from app.core.data_manager import db
+    from app.services.chat_service import ChatService
+    from app.models.vendors.openai_compatible_model import OpenAICompatibleModel
+
+    config_manager.set('chat.history_messages', history)
+    config_manager.set('chat.history_window_step', step)
+    config_manager.set('chat.system_prompt', system_prompt)
+    driver = OpenAICompatibleModel({'name': 'Deepseek'}, {'version_name': 'fake-model', 'api_key': 'sk-fake',
+                                                          'api_base_url': base_url})
+    chat = {'id': str(uuid.uuid4()), 'title': 'prompt cache', 'messages': []}
+    db['chats'].append(chat)
+    prompt_tokens = cached_tokens = 0
+    try:
+        for turn in range(turns):
+            question = f'第{turn}轮问题：' + '问' * 40
+            chat['messages'].append({'role': 'user', 'content': question})
+            context = ChatService.get_chat_context(chat['id'])
+            messages = ChatService._build_model_messages(context, f'参考资料{turn}\n{question}')
+            driver.chat(messages, 0)
+            metrics = driver.last_metrics or {}
+            prompt_tokens += metrics.get('prompt_tokens', 0)
+            cached_tokens += metrics.get('cached_tokens', 0)
+            chat['messages'].append({'role': 'assistant', 'content': f'第{turn}轮回答：' + '答' * answer_chars})
+    finally:
+        db['chats'].remove(chat)
+    return prompt_tokens, cached_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description='提示词缓存命中率基准')
+    parser.add_argument('--turns', type=int, default=30, help='对话轮数')
+    parser.add_argument('--history', type=int, default=10, help='发送的最近历史消息数上限')
+    parser.add_argument('--steps', type=int, nargs='+', default=[1, 4, 10], help='要比较的窗口前移步长')
+    parser.add_argument('--answer-chars', type=int, default=400, help='每轮回答的字符数')
+    parser.add_argument('--system-prompt', default='你是一个乐于助人的助手。' * 20, help='系统提示词')
+    args = parser.parse_args()
+
+    print(f"{'step':>6} {'提示词tokens':>14} {'缓存命中tokens':>16} {'命中率':>8}")
+    for step in args.steps:
+        # 每种步长使用单独的假服务，缓存互不影响
+        server, base_url = start_fake_server(FakeOpenAIHandler, tokens=1)
+        try:
+            prompt, cached = run_conversation(base_url, args.turns, args.history, step,
+                                              args.answer_chars, args.system_prompt)
+        finally:
+            server.shutdown()
+        print(f"{step:>6} {prompt:>14} {cached:>16} {cached / prompt if prompt else 0:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+评估交叉编码器重排序的检索质量和延迟
+
+从知识库片段中间截取一句话作为查询，包含该句的片段视为相关片段。
+分别统计纯向量检索与“召回N个候选 + 重排序取前k个”的recall@k、MRR，
+以及重排序阶段首次打分和命中分数缓存时的延迟。
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.rerank_eval --queries 100 --k 3 --candidates 20
+"""
+import argparse
+import random
+import time
+from benchmarks.common import load_corpus_chunks, percentile
+
+
+def make_queries(chunks, count, seed=42, length=60):
+    """从片段中间截取文本作为查询"""
+    rng = random.Random(seed)
+    queries = []
+    for doc in rng.sample(chunks, min(count * 2, len(chunks))):
+        text = doc.page_content.replace('\n', ' ')
+        if len(text) < length * 2:
+            continue
+        start = rng.randint(len(text) // 4, len(text) // 2)
+        queries.append(text[start:start + length])
+        if len(queries) >= count:
+            break
+    return queries
+
+
+def evaluate(documents, query, k):
+    """计算单个查询的命中(recall@k)和倒数排名"""
+    for rank, doc in enumerate(documents[:k]):
+        if query in doc.page_content.replace('\n', ' '):
+            return 1.0, 1.0 / (rank + 1)
+    return 0.0, 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交叉编码器重排序评估')
+    parser.add_argument('--corpus', help='语料目录，默认使用RAG知识库目录')
+    parser.add_argument('--queries', type=int, default=100, help='查询数量')
+    parser.add_argument('--k', type=int, default=3, help='最终保留的片段数')
+    parser.add_argument('--candidates', type=int, default=20, help='重排序前召回的候选数量')
+    args = parser.parse_args()
+
+    from app.services.rag_service import get_vector_store_service
+
+    chunks = load_corpus_chunks(args.corpus, limit=5000)
+    queries = make_queries(chunks, args.queries)
+    if not queries:
+        print("❌ 没有找到可用的语料")
+        return
+    vector_service = get_vector_store_service()
+    if not vector_service or not vector_service.vector_store:
+        print("❌ 向量库不可用")
+        return
+
+    reranker = vector_service.reranker
+    print(f"📚 查询: {len(queries)}，k={args.k}，候选数={args.candidates}，重排序模型: {reranker.model_name}")
+    reranker.score('预热', chunks[:2])
+
+    baseline_hits, baseline_rr, rerank_hits, rerank_rr = [], [], [], []
+    cold_latencies, warm_latencies = [], []
+    for query in queries:
+        candidates = vector_service.vector_store.similarity_search(query, k=args.candidates)
+        hit, rr = evaluate(candidates, query, args.k)
+        baseline_hits.append(hit)
+        baseline_rr.append(rr)
+
+        start = time.perf_counter()
+        ranked = [doc for doc, _ in reranker.rerank(query, candidates, args.k)]
+        cold_latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        reranker.rerank(query, candidates, args.k)
+        warm_latencies.append((time.perf_counter() - start) * 1000)
+
+        hit, rr = evaluate(ranked, query, args.k)
+        rerank_hits.append(hit)
+        rerank_rr.append(rr)
+
+    print(f"\n{'方式':<12}{'recall@' + str(args.k):>12}{'MRR':>10}")
+    print(f"{'向量检索':<12}{sum(baseline_hits) / len(queries):>12.3f}{sum(baseline_rr) / len(queries):>10.3f}")
+    print(f"{'重排序':<12}{sum(rerank_hits) / len(queries):>12.3f}{sum(rerank_rr) / len(queries):>10.3f}")
+    print(f"\n重排序延迟（{args.candidates}个候选）: 首次 p50={percentile(cold_latencies, 50):.1f}ms "
+          f"p95={percentile(cold_latencies, 95):.1f}ms；缓存命中 p50={percentile(warm_latencies, 50):.2f}ms")
+    print(f"分数缓存: {reranker.get_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
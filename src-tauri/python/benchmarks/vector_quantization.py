@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+内存映射向量库量化模式（none / int8 / binary）的召回率、延迟和内存占用对比
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.vector_quantization --count 200000 --dimension 1024 --multipliers 2 4 8
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from benchmarks.common import PrecomputedEmbeddings, exact_top_k, percentile, random_unit_vectors, recall_at_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description='向量量化召回率基准')
+    parser.add_argument('--count', type=int, default=100000, help='文档向量数量')
+    parser.add_argument('--dimension', type=int, default=1024, help='向量维度')
+    parser.add_argument('--queries', type=int, default=200, help='查询数量')
+    parser.add_argument('--k', type=int, default=10, help='recall@k中的k')
+    parser.add_argument('--multipliers', type=int, nargs='+', default=[2, 4, 8], help='待测试的重排候选倍数')
+    args = parser.parse_args()
+
+    import numpy as np
+    from langchain_core.documents import Document
+    from app.utils.RagUtils.mmap_vector_store import MmapVectorStore
+
+    vectors = random_unit_vectors(args.count, args.dimension)
+    texts = [str(i) for i in range(args.count)]
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.count, size=args.queries, replace=False)]
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.05
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    workdir = tempfile.mkdtemp(prefix='neovai-bench-quant-')
+    try:
+        embeddings = PrecomputedEmbeddings(texts, vectors)
+        base = MmapVectorStore(workdir, embeddings)
+        base.add_embeddings(texts, vectors, ids=texts)
+        baseline_bytes = base.memory_bytes()
+        print(f"📚 文档向量: {args.count} x {args.dimension}，查询: {args.queries}")
+
+        print(f"\n{'模式':<8}{'倍数':>6}{'内存(MB)':>10}{'压缩比':>8}{'p50(ms)':>10}{'p99(ms)':>10}"
+              f"{'recall@' + str(args.k):>12}")
+        for mode in ('none', 'int8', 'binary'):
+            for multiplier in ([1] if mode == 'none' else args.multipliers):
+                store = MmapVectorStore(workdir, embeddings, quantization=mode, rescore_multiplier=multiplier)
+                latencies, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    hits = store.similarity_search_by_vector_with_score(query, k=args.k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    recalls.append(recall_at_k(expected, [int(doc.page_content) for doc, _ in hits], args.k))
+                memory = store.memory_bytes()
+                print(f"{mode:<8}{multiplier:>6}{memory / 1024 / 1024:>10.1f}{baseline_bytes / memory:>7.1f}x"
+                      f"{percentile(latencies, 50):>10.2f}{percentile(latencies, 99):>10.2f}"
+                      f"{sum(recalls) / len(recalls):>12.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Chroma与内存映射向量库（vector_db_type = 'mmap'）的对比基准
+
+默认使用合成的随机单位向量，也可以用 --corpus 指定真实语料（会先用当前嵌入模型编码）。
+
+用法（在src-tauri/python目录下）：
+    python -m benchmarks.vector_stores --count 100000 --dimension 1024
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from benchmarks.common import (PrecomputedEmbeddings, exact_top_k, load_corpus_chunks, percentile,
+                               random_unit_vectors, recall_at_k)
+
+
+def prepare_data(args):
+    """准备文档文本、文档向量和查询向量"""
+    import numpy as np
+
+    if args.corpus:
+        from app.core.config import config_manager
+        from app.services.vector_store_service import VectorStoreService
+
+        chunks = load_corpus_chunks(args.corpus, limit=args.count)
+        texts = [doc.page_content for doc in chunks]
+        embeddings = VectorStoreService(embedder_model=config_manager.get('rag.embedder_model')).embeddings
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    else:
+        vectors = random_unit_vectors(args.count, args.dimension)
+        texts = [f'doc-{i}' for i in range(args.count)]
+
+    # 查询向量取文档向量加噪声，模拟与某些文档相近的真实查询
+    rng = np.random.default_rng(1)
+    picked = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries = picked + rng.standard_normal(picked.shape).astype(np.float32) * 0.05
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return texts, vectors, queries
+
+
+def bench_store(name, store, texts, vectors, queries, query_texts, k, batch_size):
+    """写入并查询单个向量库，返回指标字典"""
+    from langchain_core.documents import Document
+
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        batch = texts[offset:offset + batch_size]
+        store.add_documents([Document(page_content=t, metadata={'index': offset + i}) for i, t in enumerate(batch)])
+    insert_seconds = time.perf_counter() - start
+
+    latencies, results = [], []
+    for text in query_texts:
+        start = time.perf_counter()
+        hits = store.similarity_search_with_score(text, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([doc.metadata['index'] for doc, _ in hits])
+
+    truth = exact_top_k(vectors, queries, k)
+    recall = sum(recall_at_k(t, r, k) for t, r in zip(truth, results)) / len(results)
+    return {
+        'name': name,
+        'insert_per_sec': len(texts) / insert_seconds if insert_seconds else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'recall': recall
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='向量库引擎对比基准')
+    parser.add_argument('--corpus', help='真实语料目录，不指定时使用合成向量')
+    parser.add_argument('--count', type=int, default=50000, help='文档向量数量')
+    parser.add_argument('--dimension', type=int, default=1024, help='合成向量维度')
+    parser.add_argument('--queries', type=int, default=200, help='查询数量')
+    parser.add_argument('--k', type=int, default=5, help='返回结果数量')
+    parser.add_argument('--batch-size', type=int, default=1000, help='写入批大小')
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+    from app.utils.RagUtils.mmap_vector_store import MmapVectorStore
+
+    texts, vectors, queries = prepare_data(args)
+    query_texts = [f'query-{i}' for i in range(len(queries))]
+    embeddings = PrecomputedEmbeddings(texts, vectors, dict(zip(query_texts, queries.tolist())))
+    print(f"📚 文档向量: {len(texts)} x {vectors.shape[1]}，查询: {len(queries)}")
+
+    results = []
+    for name in ('chroma', 'mmap'):
+        workdir = tempfile.mkdtemp(prefix=f'neovai-bench-{name}-')
+        try:
+            if name == 'chroma':
+                store = Chroma(persist_directory=workdir, embedding_function=embeddings)
+            else:
+                store = MmapVectorStore(persist_directory=workdir, embedding_function=embeddings)
+            print(f"🔄 测试引擎: {name}")
+            results.append(bench_store(name, store, texts, vectors, queries, query_texts, args.k, args.batch_size))
+            if name == 'mmap':
+                store.delete_collection()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n=== 结果 ===")
+    print(f"{'引擎':<8}{'写入/秒':>12}{'p50(ms)':>10}{'p99(ms)':>10}{'recall@' + str(args.k):>12}")
+    for r in results:
+        print(f"{r['name']:<8}{r['insert_per_sec']:>12.0f}{r['p50']:>10.2f}{r['p99']:>10.2f}{r['recall']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
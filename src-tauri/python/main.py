@@ -62,8 +62,8 @@ def init_rag():
             # 获取嵌入模型配置
             embedder_model = get_config_value(config_manager, 'rag.embedder_model', 'qwen3-embedding-0.6b')
             
-            # 创建向量存储服务实例
-            vector_service = VectorStoreService(vector_db_path, embedder_model)
+            # 创建向量存储服务单例，聊天检索与文档管理共用同一实例
+            vector_service = VectorStoreService.get_instance(vector_db_path, embedder_model)
             
             # 通过兼容接口设置实例
             set_rag_instance(None)  # 不再需要旧的rag_instance
@@ -84,6 +84,13 @@ def setup():
     load_data()
     # 初始化RAG
     init_rag()
+    # 后台预加载已配置模型的驱动（驱动模块在首次使用时才导入，不占用启动时间）
+    if get_config_value(config_manager, 'app.preload_model_drivers', True):
+        from app.core.data_manager import db
+        from app.models.model_manager import ModelManager
+        configured = [m['name'] for m in db.get('models', []) if m.get('configured')]
+        if configured:
+            ModelManager.preload_drivers(configured)
 
 if __name__ == '__main__':
     # 从配置中获取应用设置
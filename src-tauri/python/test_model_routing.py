@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+测试备用模型的对冲请求和失败切换
+
+使用 benchmarks.fake_servers 中的本地假OpenAI兼容服务，一个首token很慢、一个很快：
+- 主模型超过对冲期限没有响应时向备用模型发出请求，先响应的一方胜出，另一方被取消
+- 延迟样本足够后，对冲期限取主模型最近延迟的百分位
+- 主模型调用失败时自动改用备用模型
+- 备用模型的调用同样占用调度器名额，没有空闲名额时跳过对冲
+
+用法（在src-tauri/python目录下）：
+    python test_model_routing.py
+"""
+import sys
+import json
+import time
+from benchmarks.fake_servers import FakeOpenAIHandler, start_fake_server
+from app.core.config import config_manager
+from app.models.model_manager import ModelManager
+from app.services.model_router import ModelRouter, LatencyStats
+from app.services.request_scheduler import RequestScheduler
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+POLICY = {'backup_model': 'Qwen-fast', 'hedge': True, 'fallback': True}
+
+
+def candidate(vendor, version, base_url):
+    version_config = {'version_name': version, 'api_key': 'test', 'api_base_url': base_url}
+    driver = ModelManager.get_model_driver(vendor, {'name': vendor}, version_config)
+    return {'key': f'{vendor}/{version}', 'display': f'{vendor} - {version}', 'driver': driver}
+
+
+def test_model_routing():
+    """测试对冲、按百分位计算的对冲期限和失败切换"""
+    slow, slow_url = start_fake_server(FakeOpenAIHandler, tokens=20, first_token_delay=2.0)
+    fast, fast_url = start_fake_server(FakeOpenAIHandler, tokens=20, first_token_delay=0.05)
+    config_manager.set('routing.default_hedge_ms', 300)
+    config_manager.set('routing.min_samples', 5)
+    try:
+        print("🔄 测试流式对冲请求...")
+        start = time.perf_counter()
+        stream, _, route = ModelRouter.stream(candidate('Deepseek', 'slow', slow_url),
+                                              candidate('Qwen', 'fast', fast_url), POLICY, MESSAGES, 0.7)
+        chunks = list(stream)
+        elapsed = time.perf_counter() - start
+        assert route['model'] == 'Qwen - fast' and route['hedged'], route
+        assert len(chunks) == 21 and elapsed < 1.0, (len(chunks), elapsed)
+        print(f"✅ 对冲请求在 {elapsed * 1000:.0f}ms 内完成，route={route}")
+
+        print("🔄 测试非流式对冲请求...")
+        response, route = ModelRouter.chat(candidate('Deepseek', 'slow', slow_url),
+                                           candidate('Qwen', 'fast', fast_url), POLICY, MESSAGES, 0.7)
+        assert route['backup'] and route['hedged'] and len(response['content']) == 20, route
+        print(f"✅ 非流式回复来自 {route['model']}")
+
+        print("🔄 测试按延迟百分位计算对冲期限...")
+        stats = LatencyStats.get_instance()
+        for elapsed_ms in (100, 120, 150, 180, 900):
+            stats.record('Deepseek/p95', 'first_token', elapsed_ms)
+        assert ModelRouter.hedge_delay('Deepseek/p95', 'first_token', {}) == 0.9
+        assert ModelRouter.hedge_delay('Deepseek/p95', 'first_token', {'hedge_percentile': 60}) == 0.3
+        assert ModelRouter.hedge_delay('Deepseek/none', 'first_token', {}) == 0.3
+        print("✅ 对冲期限取最近延迟的百分位，样本不足时使用默认值")
+
+        print("🔄 测试失败切换...")
+        dead = candidate('Deepseek', 'dead', 'http://127.0.0.1:9/v1')
+        stream, _, route = ModelRouter.stream(dead, candidate('Qwen', 'fast', fast_url),
+                                              dict(POLICY, hedge=False), MESSAGES, 0.7)
+        chunks = list(stream)
+        assert route['fallback'] and route['backup'] and len(chunks) == 21, route
+        print(f"✅ 主模型失败后由 {route['model']} 回复")
+
+        print("🔄 测试备用模型的调度名额...")
+        from app.services.chat_service import ChatService
+        config_manager.set('scheduler.vendor_concurrency', {'Qwen': 1})
+        scheduler = RequestScheduler.get_instance()
+        busy = scheduler.submit('other-chat', 'Qwen', 'fast')
+        scheduler.acquire(busy)
+        try:
+            backup = dict(candidate('Qwen', 'fast', fast_url), **ChatService._model_slot('routing-chat', 'Qwen', 'fast'))
+            stream, _, route = ModelRouter.stream(candidate('Deepseek', 'slow', slow_url), backup, POLICY,
+                                                  MESSAGES, 0.7)
+            chunks = list(stream)
+            assert not route['hedged'] and route['model'] == 'Deepseek - slow' and len(chunks) == 21, route
+        finally:
+            scheduler.release(busy)
+        backup = dict(candidate('Qwen', 'fast', fast_url), **ChatService._model_slot('routing-chat', 'Qwen', 'fast'))
+        response, route = ModelRouter.chat(candidate('Deepseek', 'slow', slow_url), backup, POLICY, MESSAGES, 0.7)
+        assert route['hedged'] and route['backup'], route
+        assert 'Qwen' not in scheduler.snapshot()['running'], '备用模型调用结束后应归还调度名额'
+        print("✅ 备用模型没有空闲名额时跳过对冲，对冲调用结束后归还名额")
+
+        print(json.dumps(stats.snapshot(), ensure_ascii=False))
+    finally:
+        slow.shutdown()
+        fast.shutdown()
+    return True
+
+
+# 主函数
+if __name__ == "__main__":
+    try:
+        if test_model_routing():
+            print("🎉 测试通过，模型路由工作正常！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 测试过程中出现错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试Ollama驱动的keep_alive、运行参数、预加载和耗时统计
+
+使用 benchmarks.fake_servers 中的本地假Ollama服务（模型未加载时模拟加载等待），不需要安装Ollama：
+- 版本options中的keep_alive放在请求顶层，num_ctx等运行参数放入请求的options
+- 预加载后第一条消息不再等待模型加载；keep_alive为0时请求结束即卸载，下次请求重新加载
+- 流式和非流式回复都能取得Ollama报告的加载、预填充和生成耗时
+- 取消流式调用时立即关闭到Ollama的连接
+
+用法（在src-tauri/python目录下）：
+    python test_ollama_driver.py
+"""
+import sys
+import json
+import time
+import threading
+from benchmarks.fake_servers import FakeOllamaHandler, start_fake_server
+from app.models.model_manager import ModelManager
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+
+
+def build_driver(base_url, **options):
+    version = {'version_name': 'qwen3:8b', 'api_base_url': base_url, 'options': options}
+    return ModelManager.get_model_driver('Ollama', {'name': 'Ollama'}, version)
+
+
+def test_ollama_driver():
+    """测试请求参数、模型保留和耗时统计"""
+    server, base_url = start_fake_server(FakeOllamaHandler, tokens=20, load_delay=0.3)
+    try:
+        print("🔄 测试运行参数...")
+        driver = build_driver(base_url, keep_alive='1h', num_ctx=8192, num_thread=8, num_batch=512)
+        warm = driver.warm()
+        payload = server.last_payload
+        assert payload['keep_alive'] == '1h', payload
+        assert payload['options'] == {'num_ctx': 8192, 'num_thread': 8, 'num_batch': 512}, payload
+        assert warm['load_ms'] >= 300, warm
+        print(f"✅ 预加载耗时 {warm['load_ms']}ms，options={payload['options']}")
+
+        print("🔄 测试预加载后的流式回复...")
+        chunks = list(driver.chat_stream(MESSAGES, 0.3))
+        done = json.loads(chunks[-1][6:])
+        assert server.last_payload['options']['temperature'] == 0.3
+        assert len(chunks) == 21 and done['done'], chunks[-1]
+        assert done['metrics']['load_ms'] == 0 and done['metrics']['eval_count'] == 20, done
+        assert server.loads == 1, server.loads
+        print(f"✅ 流式回复没有重新加载模型，metrics={done['metrics']}")
+
+        print("🔄 测试keep_alive=0时请求结束后卸载模型...")
+        cold = build_driver(base_url, keep_alive='0')
+        # 第一次请求使用已加载的模型，请求结束后模型被卸载，第二次请求重新加载
+        cold.chat(MESSAGES, 0.7)
+        cold.chat(MESSAGES, 0.7)
+        assert server.last_payload['keep_alive'] == 0, server.last_payload
+        assert cold.last_metrics['load_ms'] >= 300, cold.last_metrics
+        assert server.loads == 2, server.loads
+        print(f"✅ 非流式回复的metrics={cold.last_metrics}")
+
+        print("🔄 测试取消流式调用...")
+        server.tokens, server.token_interval = 200, 0.02
+        driver = build_driver(base_url, keep_alive='1h')
+        stream = driver.chat_stream(MESSAGES, 0.7)
+        next(stream)
+        start = time.perf_counter()
+        threading.Timer(0.1, driver.cancel).start()
+        chunks = list(stream)
+        elapsed = time.perf_counter() - start
+        time.sleep(0.1)
+        assert elapsed < 1.0 and len(chunks) < 20, (elapsed, len(chunks))
+        assert server.disconnects == 1, server.disconnects
+        print(f"✅ 取消后 {elapsed * 1000:.0f}ms 内结束，上游连接已关闭")
+    finally:
+        server.shutdown()
+    return True
+
+
+# 主函数
+if __name__ == "__main__":
+    try:
+        if test_ollama_driver():
+            print("🎉 测试通过，Ollama驱动工作正常！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 测试过程中出现错误: {str(e)}")
+        sys.exit(1)
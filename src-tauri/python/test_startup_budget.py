@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+测试后端启动的导入耗时预算
+
+在子进程中以 python -X importtime 导入main，解析每个模块的累计导入耗时：
+- main的累计导入耗时不能超过预算（默认1000ms，可用环境变量NEOVAI_STARTUP_BUDGET_MS调整）
+- 模型供应商SDK、文档加载器、嵌入模型和向量库等重量级依赖不能在启动时导入，
+  它们应在首次使用时才加载
+
+用法（在src-tauri/python目录下）：
+    python test_startup_budget.py
+"""
+import os
+import sys
+import subprocess
+import tempfile
+
+# 启动导入耗时预算（毫秒）
+STARTUP_BUDGET_MS = float(os.environ.get('NEOVAI_STARTUP_BUDGET_MS', 1000))
+
+# 启动时不应导入的模块（只应在首次使用时导入）
+DEFERRED_MODULES = [
+    'langchain_openai',
+    'langchain_anthropic',
+    'langchain_google_genai',
+    'langchain_ollama',
+    'langchain_community',
+    'langchain_chroma',
+    'chromadb',
+    'sentence_transformers',
+    'torch',
+]
+
+
+def measure_imports(module='main'):
+    """在干净的子进程中导入模块，返回 {模块名: 累计导入耗时(微秒)} 和模块的导入顺序"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = dict(os.environ, XDG_DATA_HOME=temp_dir, XDG_CONFIG_HOME=temp_dir, PYTHONDONTWRITEBYTECODE='1')
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=120
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入{module}失败:\n{completed.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        # 格式: import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        try:
+            _, total, name = line[len('import time:'):].split('|', 2)
+            cumulative[name.strip()] = int(total)
+        except ValueError:
+            continue
+    return cumulative
+
+
+def test_startup_budget():
+    """测试启动导入耗时和延迟导入的模块"""
+    print("🔄 开始测量后端启动导入耗时...")
+    cumulative = measure_imports('main')
+
+    total_ms = cumulative.get('main', 0) / 1000
+    print(f"📊 导入main耗时: {total_ms:.1f}ms（预算 {STARTUP_BUDGET_MS:.0f}ms）")
+    print("📊 累计耗时最高的模块:")
+    for name, total in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[1:11]:
+        print(f"   {total / 1000:8.1f}ms  {name}")
+
+    eager = [name for name in DEFERRED_MODULES if name in cumulative]
+    if eager:
+        print(f"❌ 启动时导入了应延迟加载的模块: {', '.join(eager)}")
+    if total_ms > STARTUP_BUDGET_MS:
+        print(f"❌ 启动导入耗时超出预算 {total_ms - STARTUP_BUDGET_MS:.1f}ms")
+
+    assert not eager, f"启动时导入了应延迟加载的模块: {eager}"
+    assert total_ms <= STARTUP_BUDGET_MS, f"导入main耗时 {total_ms:.1f}ms，超出预算 {STARTUP_BUDGET_MS:.0f}ms"
+    return True
+
+
+# 主函数
+if __name__ == "__main__":
+    try:
+        if test_startup_budget():
+            print("🎉 测试通过，后端启动导入耗时在预算内！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 测试过程中出现错误: {str(e)}")
+        sys.exit(1)
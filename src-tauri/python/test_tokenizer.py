@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+测试分词服务
+
+在临时目录中训练一个很小的tokenizer.json作为本地分词器：
+- 分词器首次使用时在后台加载，加载完成前按字符估算，估算值不保存到消息中
+- 批量统计的结果缓存在内存中，消息的token数保存在tokenCounts中，不重复分词
+- 模型专用的分词器不可用时改用默认分词器
+- 入库时记录的片段token数在组装上下文时直接使用
+
+用法（在src-tauri/python目录下）：
+    python test_tokenizer.py
+"""
+import os
+import sys
+import tempfile
+from app.core.config import config_manager
+from app.services.tokenizer_service import TokenizerService, ESTIMATE
+
+
+def build_tokenizer(tokenizer_dir, name):
+    """训练一个只认识少量词的BPE分词器并保存为 <tokenizer_dir>/<name>/tokenizer.json"""
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+
+    tokenizer = Tokenizer(models.BPE(unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train_from_iterator(['hello world token count'] * 10,
+                                  trainers.BpeTrainer(vocab_size=100, special_tokens=['[UNK]']))
+    os.makedirs(os.path.join(tokenizer_dir, name), exist_ok=True)
+    tokenizer.save(os.path.join(tokenizer_dir, name, 'tokenizer.json'))
+
+
+class CountingTokenizer:
+    """记录实际分词的文本数"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.texts = 0
+
+    def count_batch(self, texts):
+        self.texts += len(texts)
+        return self.tokenizer.count_batch(texts)
+
+
+def test_tokenizer():
+    """测试懒加载、批量统计缓存、消息token数缓存和片段token数"""
+    from langchain_core.documents import Document
+    from app.utils.RagUtils.context_assembler import ContextAssembler
+
+    tokenizer_dir = tempfile.mkdtemp()
+    build_tokenizer(tokenizer_dir, 'tiny')
+    config_manager.set('tokenizer.tokenizer_dir', tokenizer_dir)
+    config_manager.set('tokenizer.vendor_tokenizers', {'Deepseek': 'hf:missing'})
+
+    print("🔄 测试字符估算...")
+    config_manager.set('tokenizer.default', ESTIMATE)
+    pending = [{'role': 'user', 'content': 'hello world'}]
+    assert TokenizerService.message_tokens(pending) == [3]
+    assert not pending[0].get('tokenCounts'), '字符估算不应保存到消息中'
+    print("✅ 分词器未就绪时的字符估算不保存，分词器就绪后重新统计")
+
+    print("🔄 测试懒加载...")
+    config_manager.set('tokenizer.default', 'hf:tiny')
+    assert TokenizerService.get_tokenizer('hf:tiny')[0] == ESTIMATE
+    name, tokenizer = TokenizerService.get_tokenizer('hf:tiny', wait=True)
+    assert name == 'hf:tiny' and tokenizer is not None, name
+    assert TokenizerService.count('hello world') == 2
+    assert TokenizerService.message_tokens(pending) == [2] and pending[0]['tokenCounts'] == {'hf:tiny': 2}
+    print("✅ 分词器加载完成前按字符估算，加载后使用本地分词器")
+
+    print("🔄 测试模型专用分词器不可用时的回退...")
+    TokenizerService.get_tokenizer('hf:missing', wait=True)
+    assert TokenizerService.tokenizer_name('Deepseek', 'v3') == 'hf:tiny'
+    print("✅ 未找到的分词器改用默认分词器")
+
+    print("🔄 测试批量统计和缓存...")
+    spy = CountingTokenizer(tokenizer)
+    TokenizerService._tokenizers['hf:tiny'] = spy
+    try:
+        assert TokenizerService.count_batch(['hello', 'hello world', 'token count world']) == [1, 2, 3]
+        assert TokenizerService.count_batch(['hello world', 'count']) == [2, 1]
+        assert spy.texts == 3, spy.texts  # 'hello world'在前面已统计过
+
+        messages = [{'role': 'user', 'content': 'hello world hello'}, {'role': 'assistant', 'content': 'token'}]
+        assert TokenizerService.message_tokens(messages) == [3, 1]
+        assert messages[0]['tokenCounts'] == {'hf:tiny': 3}
+        TokenizerService._counts.clear()
+        texts = spy.texts
+        assert TokenizerService.count_messages(messages) == 4 + 2 * config_manager.get('tokenizer.message_overhead')
+        assert spy.texts == texts, '消息的token数应直接读取tokenCounts'
+        cached = len(TokenizerService._counts)
+        assert TokenizerService.count('hello token world count', cache=False) == 4
+        assert len(TokenizerService._counts) == cached, '不缓存的统计不应写入缓存'
+        print("✅ 已统计的文本和消息不再重复分词")
+
+        print("🔄 测试片段token数...")
+        documents = [Document(page_content='hello world', metadata={'source': 'a.txt'}),
+                     Document(page_content='token count', metadata={'source': 'b.txt'})]
+        TokenizerService.annotate_documents(documents)
+        assert [doc.metadata['token_count'] for doc in documents] == [2, 2]
+        documents[0].metadata['token_count'] = 7  # 检索后应使用入库时记录的计数
+        texts = spy.texts
+        blocks = [{'text': doc.page_content, 'source': doc.metadata['source'], 'page': None, 'start': 0,
+                   'end': 0, 'rank': i, 'chunks': 1, 'doc': doc} for i, doc in enumerate(documents)]
+        ContextAssembler._count_blocks(blocks)
+        assert [block['tokens'] for block in blocks] == [7, 2] and spy.texts == texts
+        print("✅ 组装上下文时使用入库时记录的片段token数")
+    finally:
+        TokenizerService._tokenizers['hf:tiny'] = tokenizer
+
+    print(TokenizerService.status())
+    return True
+
+
+# 主函数
+if __name__ == "__main__":
+    try:
+        if test_tokenizer():
+            print("🎉 测试通过，分词服务工作正常！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 测试过程中出现错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+测试向量库维度与配置不一致时的处理
+
+用按文本哈希生成向量的假嵌入模型代替真实模型，分别在Chroma和mmap引擎上：
+- 用8维向量建库后把配置改为4维，重新打开的向量库保持打开，但拒绝写入和检索
+- 清空向量库后按新维度重建，可以正常写入和检索
+- 配置改为完整维度（0）时，截断过维度的向量库同样被识别为维度不一致
+- 不清空而是重新嵌入时，从已存储的片段文本迁移到新维度
+- 重新嵌入进入切换阶段、尚未取得存储锁时提交的写入在切换后的向量库中仍然存在
+
+用法（在src-tauri/python目录下）：
+    python test_vector_dimension.py
+"""
+import sys
+import time
+import hashlib
+import tempfile
+from app.core.config import config_manager
+from app.services.vector_store_service import VectorStoreService
+
+TEXTS = ['今天天气很好', '向量库维度测试', '重新嵌入迁移片段', '清空后重新建库']
+LATE_TEXT = '切换期间写入的片段'
+# 假嵌入模型的完整维度
+FULL_DIMENSION = 16
+# 测试中修改的配置项，结束后恢复
+CONFIG_KEYS = ('rag.vector_db_type', 'rag.dedup_mode', 'rag.reembed_duty_cycle', 'rag.embedder_model',
+               'rag.embedding_dimension')
+
+
+class HashEmbeddings:
+    """按文本哈希生成固定维度的向量"""
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+
+    def _embed(self, text):
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return [digest[i] / 255.0 + 0.01 for i in range(self.dimension)]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def fake_init_embeddings(self):
+    """按服务当前的维度构造假嵌入模型，不加载真实模型"""
+    self._embeddings = HashEmbeddings(self.embedding_dimension or FULL_DIMENSION)
+    return True
+
+
+def open_service(path, dimension):
+    # 重新嵌入完成后会把新模型写入配置，每次打开前恢复
+    config_manager.set('rag.embedder_model', 'hash-embedding')
+    config_manager.set('rag.embedding_dimension', dimension)
+    return VectorStoreService(path, 'hash-embedding')
+
+
+def add_texts(service):
+    from langchain_core.documents import Document
+    return service.add_documents([Document(page_content=text, metadata={'source': f'{i}.txt'})
+                                  for i, text in enumerate(TEXTS)])
+
+
+def _check_engine(engine):
+    """在一种向量库引擎上测试维度不一致 → 清空 / 重新嵌入 → 恢复可用"""
+    config_manager.set('rag.vector_db_type', engine)
+    config_manager.set('rag.dedup_mode', 'off')
+
+    print(f"🔄 [{engine}] 测试维度不一致后清空...")
+    path = tempfile.mkdtemp()
+    assert add_texts(open_service(path, 8))
+    service = open_service(path, 4)
+    assert service.vector_store is not None, '维度不一致时向量库应保持打开'
+    assert not add_texts(service), '维度不一致时应拒绝写入'
+    assert service.search_documents(TEXTS[0], k=1) == []
+    assert 'warning' in service.get_vector_statistics()
+    assert service.clear_vector_store()
+    assert add_texts(service) and service.embedding_dimension == 4
+    assert service.search_documents(TEXTS[0], k=1)[0].page_content == TEXTS[0]
+    print(f"✅ [{engine}] 清空后按新维度重建，可以正常写入和检索")
+
+    print(f"🔄 [{engine}] 测试配置改为完整维度...")
+    path = tempfile.mkdtemp()
+    assert add_texts(open_service(path, 8))
+    service = open_service(path, 0)
+    assert not add_texts(service), '截断过维度的向量库在配置为完整维度时应拒绝写入'
+    assert service.search_documents(TEXTS[0], k=1) == []
+    assert 'warning' in service.get_vector_statistics()
+    assert service.clear_vector_store() and add_texts(service)
+    assert service.search_documents(TEXTS[0], k=1)[0].page_content == TEXTS[0]
+    print(f"✅ [{engine}] 配置为完整维度时识别出维度不一致，清空后恢复")
+
+    print(f"🔄 [{engine}] 测试维度不一致后重新嵌入...")
+    path = tempfile.mkdtemp()
+    assert add_texts(open_service(path, 8))
+    service = open_service(path, 4)
+    service.start_reembedding()
+    deadline = time.time() + 60
+    while service.get_reembedding_status()['state'] not in ('completed', 'failed', 'cancelled'):
+        assert time.time() < deadline, '重新嵌入超时'
+        time.sleep(0.1)
+    status = service.get_reembedding_status()
+    assert status['state'] == 'completed', status
+    assert service.embedding_dimension == 4 and 'warning' not in service.get_vector_statistics()
+    assert service.search_documents(TEXTS[1], k=1)[0].page_content == TEXTS[1]
+    try:
+        service.start_reembedding()
+        assert False, '维度已与配置一致时应拒绝重新嵌入'
+    except ValueError as e:
+        assert '4维' in str(e), str(e)
+    print(f"✅ [{engine}] 重新嵌入把 {status['processed']} 个片段迁移到新维度")
+
+    print(f"🔄 [{engine}] 测试切换阶段的写入...")
+    from langchain_core.documents import Document
+    switch_to_shadow = service.switch_to_shadow
+
+    def write_then_switch(job):
+        # 状态已是switching、尚未取得存储锁时提交一次写入
+        assert job.status['state'] == 'switching'
+        assert service.add_documents([Document(page_content=LATE_TEXT, metadata={'source': 'late.txt'})])
+        return switch_to_shadow(job)
+
+    service.switch_to_shadow = write_then_switch
+    service.start_reembedding(embedder_model='hash-embedding-v2')
+    deadline = time.time() + 60
+    while service.get_reembedding_status()['state'] not in ('completed', 'failed', 'cancelled'):
+        assert time.time() < deadline, '重新嵌入超时'
+        time.sleep(0.1)
+    assert service.get_reembedding_status()['state'] == 'completed', service.get_reembedding_status()
+    assert service.embedder_model == 'hash-embedding-v2'
+    assert service.search_documents(LATE_TEXT, k=1)[0].page_content == LATE_TEXT, '切换阶段的写入丢失'
+    print(f"✅ [{engine}] 切换阶段的写入在影子向量库上重放")
+
+
+def test_vector_dimension():
+    """在Chroma和mmap引擎上测试，结束后恢复嵌入模型的初始化方法和修改过的配置"""
+    init_embeddings = VectorStoreService._init_embeddings
+    saved_config = {key: config_manager.get(key) for key in CONFIG_KEYS}
+    VectorStoreService._init_embeddings = fake_init_embeddings
+    config_manager.set('rag.reembed_duty_cycle', 1.0)
+    try:
+        for engine in ('chroma', 'mmap'):
+            _check_engine(engine)
+    finally:
+        VectorStoreService._init_embeddings = init_embeddings
+        for key, value in saved_config.items():
+            config_manager.set(key, value)
+    return True
+
+
+# 主函数
+if __name__ == "__main__":
+    try:
+        if test_vector_dimension():
+            print("🎉 测试通过，向量库维度不一致时可以清空或重新嵌入！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ 测试过程中出现错误: {str(e)}")
+        sys.exit(1)
@@ -80,6 +80,9 @@ function handleApiError(error) {
       case 404:
         console.error('请求的资源不存在');
         break;
+      case 429:
+        console.error(`请求过多: ${data?.error || '请稍后重试'}`);
+        break;
       case 500:
         console.error('服务器内部错误');
         break;
@@ -149,7 +152,10 @@ export function handleStreamingResponse(url, data, onMessage, onError, onComplet
     signal: signal
   }).then(response => {
     if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
+      // 开始流式传输前被拒绝时（如模型请求排队已满返回429）响应体是json错误信息
+      return response.json().catch(() => ({})).then((body) => {
+        throw new Error(body.error || `HTTP error! status: ${response.status}`);
+      });
     }
     
     // 检查响应是否支持流式处理
@@ -299,6 +305,52 @@ export const apiService = {
       });
     },
     
+    // 同一条消息同时发给多个模型对比，onMessage收到的每个事件带model字段
+    sendFanoutMessage: async (chatId, message, models, options = {}, onMessage, onError, onComplete) => {
+      const { modelParams = {}, ragConfig = {} } = options;
+
+      const url = `/api/chats/${chatId}/messages/fanout`;
+      const data = { message, models, modelParams, ragConfig };
+
+      return new Promise((resolve, reject) => {
+        try {
+          const closeConnection = handleStreamingResponse(url, data, onMessage, onError, () => {
+            onComplete?.();
+            resolve();
+          });
+          apiService.chat.activeStreamingConnection = closeConnection;
+        } catch (error) {
+          console.error('创建多模型流式连接失败:', error);
+          reject(error);
+        }
+      });
+    },
+
+    // 停止后端进行中的生成（messageId为流式响应第一个增量中的message_id）
+    cancelMessage: async (chatId, messageId) => {
+      return await requestWithRetry({
+        method: 'POST',
+        url: `/api/chats/${chatId}/messages/${messageId}/cancel`,
+      }, 1);
+    },
+
+    // 获取对话的路由策略（备用模型、对冲和失败切换）
+    getRouting: async (chatId) => {
+      return await requestWithRetry({
+        method: 'GET',
+        url: `/api/chats/${chatId}/routing`,
+      });
+    },
+
+    // 设置对话的路由策略，如 { backup_model: 'Deepseek-deepseek-chat', hedge: true, fallback: true }，传 {} 清除
+    setRouting: async (chatId, routing) => {
+      return await requestWithRetry({
+        method: 'PUT',
+        url: `/api/chats/${chatId}/routing`,
+        data: routing || {},
+      });
+    },
+
     // 关闭活动的流式连接
     closeStreamingConnection: () => {
       if (apiService.chat.activeStreamingConnection) {
@@ -365,6 +417,37 @@ export const apiService = {
         url: '/api/rag/folders',
       });
     },
+    // 获取向量库统计信息
+    getVectorStats: async (detailed = true) => {
+      return await requestWithRetry({
+        method: 'GET',
+        url: '/api/rag/stats',
+        params: { detailed },
+      });
+    },
+    // 启动重新嵌入（更换嵌入模型后迁移向量库）
+    startReembedding: async (embedderModel = null, embeddingDimension = null) => {
+      return await requestWithRetry({
+        method: 'POST',
+        url: '/api/rag/reembed',
+        data: { embedder_model: embedderModel, embedding_dimension: embeddingDimension },
+      });
+    },
+    // 获取重新嵌入进度
+    getReembeddingStatus: async () => {
+      return await requestWithRetry({
+        method: 'GET',
+        url: '/api/rag/reembed',
+      });
+    },
+    // 预取检索结果：用户输入时提交草稿，发送消息时直接命中后端查询缓存
+    prefetch: async (query, ragConfig = {}) => {
+      return await requestWithRetry({
+        method: 'POST',
+        url: '/api/rag/prefetch',
+        data: { query, ragConfig },
+      }, 1); // 预取失败不影响发送消息，不重试
+    },
     // 验证向量数据库路径是否有效
     validateVectorDbPath: async (path) => {
       return await requestWithRetry({
@@ -406,6 +489,15 @@ export const apiService = {
         data: params,
       });
     },
+
+    // 预加载本地模型版本到内存（如Ollama），加载耗时较长，不重试
+    warmModel: async (model, version) => {
+      return await requestWithRetry({
+        method: 'POST',
+        url: `/api/models/${encodeURIComponent(model)}/${encodeURIComponent(version)}/warm`,
+        timeout: 300000,
+      }, 1);
+    },
   },
 
   // 通用请求方法
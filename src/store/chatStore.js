@@ -27,6 +27,13 @@ import { ref } from 'vue'; // 引入 ref
  * @property {string} model - 使用的模型
  */
 
+// 输入停顿后预取检索结果，与发送消息时一样提交去除首尾空白的文本
+const prefetchRetrieval = debounce((text, ragConfig) => {
+  apiService.rag.prefetch(text, ragConfig).catch((error) => {
+    console.warn('预取检索失败:', error);
+  });
+}, 300);
+
 export const useChatStore = defineStore('chat', {
   state: () => ({
     chats: [],
@@ -40,6 +47,7 @@ export const useChatStore = defineStore('chat', {
     retryCount: 0, // 重试计数
     maxRetries: 10, // 最大重试次数
     retryInterval: 3000, // 初始重试间隔（毫秒）
+    activeGeneration: null, // 进行中的流式生成 { chatId, messageId }，用于通知后端停止生成
   }),
 
   getters: {
@@ -277,6 +285,12 @@ export const useChatStore = defineStore('chat', {
                   currentChat.messages.push(messageContent);
                 }
                 
+                // 第一个增量携带后端的AI消息ID，停止生成时用它通知后端
+                if (data.message_id) {
+                  aiMessage.value.serverId = data.message_id;
+                  this.activeGeneration = { chatId: currentChat.id, messageId: data.message_id };
+                }
+                
                 // 处理后端返回的流式数据格式
                 let contentToAdd = '';
                 // 只处理data.chunk字段
@@ -295,6 +309,10 @@ export const useChatStore = defineStore('chat', {
                 
                 // 检查是否完成
                 if (data.done || data.completed || data.type === 'end') {
+                  this.activeGeneration = null;
+                  if (data.ai_message?.truncated && aiMessage) {
+                    aiMessage.value.truncated = true;
+                  }
                   // 确保消息状态正确
                   if (aiMessage && aiMessage.value.status === 'streaming') {
                     aiMessage.value.status = 'received';
@@ -570,6 +588,13 @@ export const useChatStore = defineStore('chat', {
     // 更新消息输入
     updateMessageInput(content) {
       this.messageInput = content;
+
+      // 启用RAG时在输入过程中预取检索结果
+      const settingsStore = useSettingsStore();
+      const draft = (content || '').trim();
+      if (settingsStore.ragConfig.enabled && draft.length >= 4) {
+        prefetchRetrieval(draft, settingsStore.ragConfig);
+      }
     },
 
     // 从后端API获取对话历史
@@ -770,6 +795,14 @@ export const useChatStore = defineStore('chat', {
     // 取消流式响应
     cancelStreaming() {
       try {
+        // 先通知后端停止上游生成并保存已生成的部分，再关闭连接
+        if (this.activeGeneration) {
+          const { chatId, messageId } = this.activeGeneration;
+          this.activeGeneration = null;
+          apiService.chat.cancelMessage(chatId, messageId).catch((error) => {
+            console.warn('通知后端停止生成失败:', error);
+          });
+        }
         apiService.chat.closeStreamingConnection();
         console.log('流式连接已关闭');
       } catch (error) {
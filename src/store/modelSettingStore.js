@@ -257,6 +257,10 @@ export const useModelSettingStore = defineStore('modelSetting', {
           version_name: versionConfig.versionName,
           streaming_config: versionConfig.streamingConfig
         };
+        // 版本运行参数（如Ollama的keep_alive、num_ctx），未提供时不覆盖已保存的值
+        if (versionConfig.options !== undefined) {
+          modelConfig.options = versionConfig.options;
+        }
         
         console.log('发送的API请求数据:', JSON.stringify(modelConfig));
         
@@ -293,6 +297,10 @@ export const useModelSettingStore = defineStore('modelSetting', {
           version_name: versionConfig.versionName,
           streaming_config: versionConfig.streamingConfig
         };
+        // 版本运行参数（如Ollama的keep_alive、num_ctx），未提供时不覆盖已保存的值
+        if (versionConfig.options !== undefined) {
+          requestData.options = versionConfig.options;
+        }
         
         // 调用API保存配置
         const response = await apiService.post(`/api/models/${modelName}`, requestData);
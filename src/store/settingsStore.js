@@ -19,6 +19,9 @@ const STORAGE_KEYS = {
  * @property {string} retrievalMode - 文档检索模式
  * @property {number} topK - 检索文档数量
  * @property {number} scoreThreshold - 检索相关性阈值
+ * @property {number} contextTokenBudget - 检索片段组装为上下文时可使用的token数
+ * @property {boolean|null} rerank - 是否使用交叉编码器重排序，null 表示使用后端配置
+ * @property {number} rerankCandidates - 重排序前召回的候选数量
  * @property {string} embedderModel - Embedder模型
  * @property {string} vectorDbPath - 向量数据库路径
  * @property {string} vectorDbType - 向量数据库类型
@@ -68,6 +71,9 @@ export const useSettingsStore = defineStore('settings', {
       retrievalMode: 'vector',
       topK: 3,
       scoreThreshold: 0.7,
+      contextTokenBudget: 1500,
+      rerank: null,
+      rerankCandidates: 20,
       embedderModel: 'qwen3-embedding-0.6b',
       vectorDbPath: '', // 留空，让后端使用标准用户数据目录
       vectorDbType: 'chroma',